@@ -9,6 +9,12 @@ if TYPE_CHECKING:
 
 
 # define functions for lazily importing each backend (alphabetical order)
+def _cascade() -> Type[AnnifBackend]:
+    from . import cascade
+
+    return cascade.CascadeBackend
+
+
 def _dummy() -> Type[AnnifBackend]:
     from . import dummy
 
@@ -43,12 +49,13 @@ def _mllm() -> Type[AnnifBackend]:
 
 
 def _nn_ensemble() -> Type[AnnifBackend]:
+    # PyTorch is imported only when training, see NNEnsembleBackend
     try:
         from . import nn_ensemble
 
         return nn_ensemble.NNEnsembleBackend
     except ImportError:
-        raise ValueError("PyTorch not available, cannot use nn_ensemble backend")
+        raise ValueError("LMDB not available, cannot use nn_ensemble backend")
 
 
 def _omikuji() -> Type[AnnifBackend]:
@@ -98,6 +105,7 @@ def _yake() -> Type[AnnifBackend]:
 
 # registry of the above functions
 _backend_fns = {
+    "cascade": _cascade,
     "dummy": _dummy,
     "ensemble": _ensemble,
     "fasttext": _fasttext,
@@ -113,6 +121,16 @@ _backend_fns = {
 }
 
 
+# pruners available for hyperparameter optimization, mapped to the names of
+# the corresponding classes in optuna.pruners
+HYPEROPT_PRUNERS = {
+    "none": "NopPruner",
+    "median": "MedianPruner",
+    "halving": "SuccessiveHalvingPruner",
+    "hyperband": "HyperbandPruner",
+}
+
+
 def get_backend(backend_id: str) -> Type[AnnifBackend]:
     if backend_id in _backend_fns:
         return _backend_fns[backend_id]()
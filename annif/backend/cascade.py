@@ -0,0 +1,228 @@
+"""Cascade ensemble backend that queries the source projects in order and
+stops as soon as the combined result is confident enough"""
+
+from __future__ import annotations
+
+import threading
+from typing import TYPE_CHECKING, Any, Callable
+
+import numpy as np
+import scipy.sparse
+from optuna.trial import TrialState
+from scipy.sparse import csr_array
+
+import annif.eval
+import annif.util
+from annif.suggestion import SuggestionBatch, filter_suggestion
+
+from . import ensemble, hyperopt
+
+if TYPE_CHECKING:
+    from configparser import SectionProxy
+
+    from optuna.study.study import Study
+    from optuna.trial import Trial
+
+    from annif.backend.hyperopt import HPRecommendation
+    from annif.corpus.document import Document, DocumentCorpus
+    from annif.project import AnnifProject
+
+
+def is_confident(array: csr_array, confidence: float, margin: float) -> np.ndarray:
+    """Return a boolean vector telling which rows of a score array have a top
+    score of at least confidence, exceeding the second best score by at
+    least margin"""
+    top = filter_suggestion(array, limit=2)
+    first = top.max(axis=1).toarray().ravel()
+    second = np.asarray(top.sum(axis=1)).ravel() - first
+    return (first >= confidence) & (first - second >= margin)
+
+
+def _normalize(weighted: csr_array, weight_sum: np.ndarray) -> csr_array:
+    # divide the rows by their weight sums; rows with a zero weight sum
+    # only have zero scores, so they are left as they are
+    inverse = np.divide(
+        1.0, weight_sum, out=np.ones_like(weight_sum), where=weight_sum != 0.0
+    )
+    return csr_array(scipy.sparse.diags_array(inverse) @ weighted)
+
+
+def cascade_merge(
+    get_scores: Callable[[int, np.ndarray], csr_array],
+    n_docs: int,
+    weights: list[float],
+    confidence: float,
+    margin: float,
+) -> tuple[csr_array, int]:
+    """Compute the weighted average of source scores for n_docs documents,
+    querying the sources in order. get_scores(source_idx, doc_indices) must
+    return the (documents x subjects) score array of a source for the given
+    documents. Documents whose partial average is confident are not passed
+    to the remaining sources. Return the averaged scores and the number of
+    documents passed to sources other than the first."""
+
+    active = np.arange(n_docs)
+    weight_sum = np.zeros(n_docs)
+    weighted = None
+    n_calls = 0
+    for source_idx, weight in enumerate(weights):
+        scores = get_scores(source_idx, active)
+        if source_idx > 0:
+            n_calls += len(active)
+        # map the rows of the active documents to their positions in the batch
+        placement = csr_array(
+            (np.full(len(active), weight), (active, np.arange(len(active)))),
+            shape=(n_docs, len(active)),
+        )
+        contribution = placement @ scores
+        weighted = contribution if weighted is None else weighted + contribution
+        weight_sum[active] += weight
+        if source_idx == len(weights) - 1:
+            break
+        partial = _normalize(weighted[active], weight_sum[active])
+        active = active[~is_confident(partial, confidence, margin)]
+        if len(active) == 0:
+            break
+    averaged = _normalize(weighted, weight_sum)
+    return csr_array(averaged, dtype=np.float32), n_calls
+
+
+class CascadeHPObjective(hyperopt.HPObjective):
+    """Objective function of the cascade hyperparameter optimizer"""
+
+    @classmethod
+    def suggest_params(cls, trial: Trial, args) -> dict[str, float]:
+        return {
+            "confidence": trial.suggest_float("confidence", 0.0, 1.0),
+            "margin": trial.suggest_float("margin", 0.0, 1.0),
+        }
+
+    @classmethod
+    def score_and_savings(
+        cls, params: dict[str, float], args: dict[str, Any]
+    ) -> tuple[float, float]:
+        """Return the metric score and the fraction of skipped calls to
+        sources other than the first one for the given thresholds"""
+        source_arrays = args["source_arrays"]
+        n_docs = args["gold"].shape[0]
+        scores, n_calls = cascade_merge(
+            lambda source_idx, docs: source_arrays[source_idx][docs],
+            n_docs,
+            args["weights"],
+            params["confidence"],
+            params["margin"],
+        )
+        y_pred = filter_suggestion(scores, limit=int(args["limit"]))
+        metric = args["metric"]
+        score = annif.eval.evaluate_samples(args["gold"], y_pred, [metric])[metric]
+        n_possible = n_docs * (len(source_arrays) - 1)
+        saved = 1.0 - n_calls / n_possible if n_possible else 0.0
+        return score, saved
+
+    @classmethod
+    def evaluate(cls, params: dict[str, float], args) -> float:
+        score, _ = cls.score_and_savings(params, args)
+        return score
+
+
+class CascadeOptimizer(ensemble.EnsembleOptimizer):
+    """Hyperparameter optimizer for the cascade backend"""
+
+    def __init__(
+        self, backend: CascadeBackend, corpus: DocumentCorpus, metric: str
+    ) -> None:
+        super().__init__(backend, corpus, metric, CascadeHPObjective)
+        self._weights = [
+            weight
+            for _, weight in annif.util.parse_sources(backend.config_params["sources"])
+        ]
+
+    def _prepare(self, n_jobs: int = 1) -> dict[str, Any]:
+        # the cascade queries each source with its own parameters and limits
+        # only the merged result, so the source suggestions are kept as such
+        source_arrays, gold = self._suggest_corpus(n_jobs, limit=None)
+        return {
+            "gold": gold,
+            "source_arrays": source_arrays,
+            "weights": self._weights,
+            "limit": self._backend.params["limit"],
+            "metric": self._metric,
+        }
+
+    def _normalize(self, hps: dict[str, float]) -> dict[str, float]:
+        return hps
+
+    def _postprocess(self, study: Study) -> HPRecommendation:
+        # the trials are scored by the plain metric, so that the score of the
+        # recommendation is the best value of the study. The cheapest one of
+        # the equally good threshold settings is recommended.
+        args = self._objective_args
+        saved, best = max(
+            (
+                (CascadeHPObjective.score_and_savings(trial.params, args)[1], trial)
+                for trial in study.get_trials(states=(TrialState.COMPLETE,))
+                if trial.value == study.best_value
+            ),
+            key=lambda candidate: candidate[0],
+        )
+        lines = [
+            f"confidence={best.params['confidence']:.4f}",
+            f"margin={best.params['margin']:.4f}",
+            f"# expensive source calls saved: {saved:.1%}",
+        ]
+        return hyperopt.HPRecommendation(lines=lines, score=study.best_value)
+
+
+class CascadeBackend(ensemble.EnsembleBackend):
+    """Ensemble backend that queries the sources in the configured order,
+    which should be from cheapest to most expensive, and stops for each
+    document as soon as the averaged result of the sources queried so far
+    has a top score of at least the given confidence, exceeding the second
+    best score by at least the given margin"""
+
+    name = "cascade"
+
+    DEFAULT_PARAMETERS = {"confidence": 0.9, "margin": 0.1}
+
+    def __init__(
+        self,
+        backend_id: str,
+        config_params: dict[str, Any] | SectionProxy,
+        project: AnnifProject,
+    ) -> None:
+        super().__init__(backend_id, config_params, project)
+        # counters of calls to sources other than the first one
+        self._calls_lock = threading.Lock()
+        self._calls_made = 0
+        self._calls_possible = 0
+
+    def skipped_source_calls(self) -> float | None:
+        """Return the fraction of calls to sources other than the first one
+        that were skipped so far, or None if nothing has been suggested"""
+        if not self._calls_possible:
+            return None
+        return 1.0 - self._calls_made / self._calls_possible
+
+    def get_hp_optimizer(self, corpus: DocumentCorpus, metric: str) -> CascadeOptimizer:
+        return CascadeOptimizer(self, corpus, metric)
+
+    def _suggest_batch(
+        self, documents: list[Document], params: dict[str, Any]
+    ) -> SuggestionBatch:
+        sources = annif.util.parse_sources(params["sources"])
+
+        def get_scores(source_idx: int, docs: np.ndarray) -> csr_array:
+            project = self.project.registry.get_project(sources[source_idx][0])
+            return project.suggest([documents[idx] for idx in docs]).array
+
+        scores, n_calls = cascade_merge(
+            get_scores,
+            len(documents),
+            [weight for _, weight in sources],
+            float(params["confidence"]),
+            float(params["margin"]),
+        )
+        with self._calls_lock:
+            self._calls_made += n_calls
+            self._calls_possible += len(documents) * (len(sources) - 1)
+        return SuggestionBatch(scores).filter(limit=int(params["limit"]))
@@ -2,13 +2,17 @@
 
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, Iterator
+
+import numpy as np
+import scipy.sparse
+from scipy.sparse import csr_array
 
 import annif.eval
 import annif.parallel
 import annif.util
 from annif.exception import NotSupportedException
-from annif.suggestion import SuggestionBatch
+from annif.suggestion import SuggestionBatch, filter_suggestion
 
 from . import backend, hyperopt
 
@@ -25,6 +29,14 @@ if TYPE_CHECKING:
 class BaseEnsembleBackend(backend.AnnifBackend):
     """Base class for ensemble backends"""
 
+    DEFAULT_PARAMETERS = {"source-threads": 1}
+
+    def default_params(self) -> dict[str, Any]:
+        params = backend.AnnifBackend.DEFAULT_PARAMETERS.copy()
+        params.update(BaseEnsembleBackend.DEFAULT_PARAMETERS)
+        params.update(self.DEFAULT_PARAMETERS)
+        return params
+
     def _get_sources_attribute(self, attr: str) -> list[bool | None]:
         params = self._get_backend_params(None)
         sources = annif.util.parse_sources(params["sources"])
@@ -41,12 +53,31 @@ class BaseEnsembleBackend(backend.AnnifBackend):
             project.initialize(parallel)
 
     def _suggest_with_sources(
-        self, documents: list[Document], sources: list[tuple[str, float]]
+        self,
+        documents: list[Document],
+        sources: list[tuple[str, float]],
+        n_threads: int = 1,
     ) -> dict[str, SuggestionBatch]:
-        return {
-            project_id: self.project.registry.get_project(project_id).suggest(documents)
-            for project_id, _ in sources
-        }
+        """Suggest subjects for the documents using each source project. With
+        n_threads > 1 the sources are queried concurrently using a shared
+        thread pool, except when already running in a pool thread (i.e. for
+        the sources of a nested ensemble) to avoid exhausting the pool."""
+
+        def suggest(project_id: str) -> SuggestionBatch:
+            return self.project.registry.get_project(project_id).suggest(documents)
+
+        project_ids = [project_id for project_id, _ in sources]
+        if (
+            n_threads > 1
+            and len(project_ids) > 1
+            and not annif.parallel.in_thread_pool()
+        ):
+            pool = annif.parallel.get_thread_pool(n_threads)
+            batches = pool.map(suggest, project_ids)
+        else:
+            batches = map(suggest, project_ids)
+        # results are collected in the order of the sources
+        return dict(zip(project_ids, batches))
 
     def _merge_source_batches(
         self,
@@ -69,7 +100,9 @@ class BaseEnsembleBackend(backend.AnnifBackend):
         self, documents: list[Document], params: dict[str, Any]
     ) -> SuggestionBatch:
         sources = annif.util.parse_sources(params["sources"])
-        batch_by_source = self._suggest_with_sources(documents, sources)
+        batch_by_source = self._suggest_with_sources(
+            documents, sources, int(params["source-threads"])
+        )
         return self._merge_source_batches(batch_by_source, sources, params)
 
 
@@ -77,32 +110,59 @@ class EnsembleHPObjective(hyperopt.HPObjective):
     """Objective function of the ensemble hyperparameter optimizer"""
 
     @classmethod
-    def objective(cls, trial: Trial, args) -> float:
-        eval_batch = annif.eval.EvaluationBatch(args["subject_index"])
-        proj_weights = {
+    def suggest_params(cls, trial: Trial, args) -> dict[str, float]:
+        return {
             project_id: trial.suggest_float(project_id, 0.0, 1.0)
             for project_id in args["sources"]
         }
-        for gold_batch, src_batches in zip(
-            args["gold_batches"], args["source_batches"]
-        ):
-            batches = [src_batches[project_id] for project_id in args["sources"]]
-            weights = [proj_weights[project_id] for project_id in args["sources"]]
-            avg_batch = SuggestionBatch.from_averaged(batches, weights).filter(
-                limit=int(args["limit"])
-            )
-            eval_batch.evaluate_many(avg_batch, gold_batch)
-        results = eval_batch.results(metrics=[args["metric"]])
-        return results[args["metric"]]
+
+    @classmethod
+    def _evaluate_docs(cls, weights: np.ndarray, args, n_docs: int) -> float:
+        # weighted average of the source scores for the first n_docs
+        # documents, using the shared sparsity pattern of the precomputed
+        # source score matrix
+        if weights.sum() == 0.0:
+            # all sources have zero weight, so nothing would be suggested
+            return 0.0
+        indptr = args["indptr"][: n_docs + 1]
+        data = args["source_scores"][: indptr[-1]] @ weights / weights.sum()
+        avg_array = csr_array(
+            (data, args["indices"][: indptr[-1]], indptr),
+            shape=(n_docs, args["gold"].shape[1]),
+        )
+        y_pred = filter_suggestion(avg_array, limit=int(args["limit"]))
+        metric = args["metric"]
+        gold = args["gold"][:n_docs]
+        return annif.eval.evaluate_samples(gold, y_pred, [metric])[metric]
+
+    @classmethod
+    def _weights(cls, params: dict[str, float], args) -> np.ndarray:
+        return np.array([params[project_id] for project_id in args["sources"]])
+
+    @classmethod
+    def evaluate(cls, params: dict[str, float], args) -> float:
+        return cls._evaluate_docs(
+            cls._weights(params, args), args, args["gold"].shape[0]
+        )
+
+    @classmethod
+    def evaluate_steps(cls, params: dict[str, float], args) -> Iterator[float]:
+        weights = cls._weights(params, args)
+        for n_docs in cls.step_sizes(args["gold"].shape[0]):
+            yield cls._evaluate_docs(weights, args, n_docs)
 
 
 class EnsembleOptimizer(hyperopt.HyperparameterOptimizer):
     """Hyperparameter optimizer for the ensemble backend"""
 
     def __init__(
-        self, backend: EnsembleBackend, corpus: DocumentCorpus, metric: str
+        self,
+        backend: EnsembleBackend,
+        corpus: DocumentCorpus,
+        metric: str,
+        objective: hyperopt.HPObjective = EnsembleHPObjective,
     ) -> None:
-        super().__init__(backend, corpus, metric, EnsembleHPObjective)
+        super().__init__(backend, corpus, metric, objective)
         self._sources = [
             project_id
             for project_id, _ in annif.util.parse_sources(
@@ -110,8 +170,33 @@ class EnsembleOptimizer(hyperopt.HyperparameterOptimizer):
             )
         ]
 
-    def _prepare(self, n_jobs: int = 1) -> dict[str, Any]:
-        gold_batches = []
+    @staticmethod
+    def _stack_source_arrays(
+        arrays: list[csr_array],
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Align the (documents x subjects) score arrays of the sources on the
+        union of their sparsity patterns. Return the indices and indptr of
+        the union pattern and a (nonzeros x sources) matrix of scores."""
+
+        shape = arrays[0].shape
+        coos = [array.tocoo() for array in arrays]
+        keys = [coo.row.astype(np.int64) * shape[1] + coo.col for coo in coos]
+        union_keys = np.unique(np.concatenate(keys))
+        scores = np.zeros((len(union_keys), len(arrays)), dtype=np.float32)
+        for idx, (coo, source_keys) in enumerate(zip(coos, keys)):
+            scores[np.searchsorted(union_keys, source_keys), idx] = coo.data
+        rows, cols = np.divmod(union_keys, shape[1])
+        indptr = np.searchsorted(rows, np.arange(shape[0] + 1))
+        return cols.astype(np.int32), indptr, scores
+
+    def _suggest_corpus(
+        self, n_jobs: int, limit: int | None
+    ) -> tuple[list[csr_array], csr_array]:
+        """Suggest subjects for the corpus using each source, keeping up to
+        limit suggestions per document, or all of them if limit is None.
+        Return the (documents x subjects) score arrays of the sources and the
+        gold standard as a boolean array, with rows aligned by document."""
+        gold_sets = []
         source_batches = []
 
         for project_id in self._sources:
@@ -122,7 +207,7 @@ class EnsembleOptimizer(hyperopt.HyperparameterOptimizer):
             self._backend.project.registry,
             self._sources,
             backend_params=None,
-            limit=int(self._backend.params["limit"]),
+            limit=limit,
             threshold=0.0,
         )
 
@@ -133,12 +218,36 @@ class EnsembleOptimizer(hyperopt.HyperparameterOptimizer):
                 psmap.suggest_batch, self._corpus.doc_batches
             ):
                 source_batches.append(suggestions)
-                gold_batches.append(gold_batch)
+                gold_sets.extend(gold_batch)
 
+        if not source_batches:
+            raise NotSupportedException("cannot evaluate empty corpus")
+
+        source_arrays = [
+            scipy.sparse.vstack(
+                [batches[project_id].array for batches in source_batches],
+                format="csr",
+            )
+            for project_id in self._sources
+        ]
+        gold = annif.eval.subject_sets_to_array(
+            gold_sets, len(self._backend.project.subjects)
+        )
+
+        return source_arrays, gold
+
+    def _prepare(self, n_jobs: int = 1) -> dict[str, Any]:
+        # precompute the source scores and the gold standard as matrices
+        # aligned by document, so that trials only need to combine them
+        source_arrays, gold = self._suggest_corpus(
+            n_jobs, int(self._backend.params["limit"])
+        )
+        indices, indptr, source_scores = self._stack_source_arrays(source_arrays)
         return {
-            "gold_batches": gold_batches,
-            "source_batches": source_batches,
-            "subject_index": self._backend.project.subjects,
+            "gold": gold,
+            "indices": indices,
+            "indptr": indptr,
+            "source_scores": source_scores,
             "sources": self._sources,
             "limit": self._backend.params["limit"],
             "metric": self._metric,
@@ -4,14 +4,20 @@ and returns the results"""
 from __future__ import annotations
 
 import importlib
+import itertools
+import os
+import time
 from typing import TYPE_CHECKING, Any
 
 import dateutil.parser
 import requests
+import requests.adapters
 import requests.exceptions
 
+import annif.parallel
+import annif.util
 from annif.exception import OperationFailedException
-from annif.suggestion import SubjectSuggestion
+from annif.suggestion import SubjectSuggestion, SuggestionBatch
 
 from . import backend
 
@@ -24,6 +30,20 @@ if TYPE_CHECKING:
 class HTTPBackend(backend.AnnifBackend):
     name = "http"
     _headers = None
+    _session = None
+    _session_pid = None
+    _project_info = None
+    _project_info_time = None
+    _batch_unavailable = False
+
+    # maximum number of documents in a single request to a suggest-batch endpoint
+    BATCH_MAX_DOCUMENTS = 32
+
+    DEFAULT_PARAMETERS = {
+        "batch": False,
+        "request-threads": 1,
+        "info-ttl": 60,
+    }
 
     @property
     def headers(self) -> dict[str, str]:
@@ -34,6 +54,22 @@ class HTTPBackend(backend.AnnifBackend):
             }
         return self._headers
 
+    @property
+    def session(self) -> requests.Session:
+        """A session for reusing connections to the endpoint. A new session
+        is created in forked processes, as connections can't be shared."""
+        if self._session is None or self._session_pid != os.getpid():
+            pool_size = max(int(self.params["request-threads"]), 1)
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=pool_size
+            )
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._session = session
+            self._session_pid = os.getpid()
+        return self._session
+
     @property
     def is_trained(self) -> bool | None:
         return self._get_project_info("is_trained")
@@ -46,9 +82,23 @@ class HTTPBackend(backend.AnnifBackend):
         return dateutil.parser.parse(mtime)
 
     def _get_project_info(self, key: str) -> bool | str | None:
+        ttl = float(self.params["info-ttl"])
+        if (
+            self._project_info is None
+            or time.monotonic() - self._project_info_time > ttl
+        ):
+            self._project_info = self._request_project_info()
+            self._project_info_time = time.monotonic()
+
+        if key in self._project_info:
+            return self._project_info[key]
+        else:
+            return None
+
+    def _request_project_info(self) -> dict[str, Any]:
         params = self._get_backend_params(None)
         try:
-            req = requests.get(
+            req = self.session.get(
                 params["endpoint"].replace("/suggest", ""), headers=self.headers
             )
             req.raise_for_status()
@@ -56,15 +106,114 @@ class HTTPBackend(backend.AnnifBackend):
             msg = f"HTTP request failed: {err}"
             raise OperationFailedException(msg) from err
         try:
-            response = req.json()
+            return req.json()
         except ValueError as err:
             msg = f"JSON decode failed: {err}"
             raise OperationFailedException(msg) from err
 
-        if key in response:
-            return response[key]
+    def _use_batch_endpoint(self, params: dict[str, Any]) -> bool:
+        # only Annif REST API endpoints have a suggest-batch counterpart, and
+        # it has no way to pass the project parameter of the form data
+        return (
+            annif.util.boolean(params["batch"])
+            and params["endpoint"].endswith("/suggest")
+            and "project" not in params
+            and not self._batch_unavailable
+        )
+
+    def _suggest_batch(
+        self, documents: list[Document], params: dict[str, Any]
+    ) -> SuggestionBatch:
+        if self._use_batch_endpoint(params):
+            chunks = [
+                documents[start : start + self.BATCH_MAX_DOCUMENTS]
+                for start in range(0, len(documents), self.BATCH_MAX_DOCUMENTS)
+            ]
+
+            def suggest_chunk(chunk):
+                results = self._suggest_with_batch_endpoint(chunk, params)
+                if results is None:  # no batch endpoint, fall back to single
+                    return [self._suggest(doc, params) for doc in chunk]
+                return results
+
         else:
-            return None
+            chunks = documents
+
+            def suggest_chunk(doc):
+                return [self._suggest(doc, params)]
+
+        n_threads = int(params["request-threads"])
+        # requests are made concurrently unless already running in a pool
+        # thread, e.g. as a source of an ensemble
+        if n_threads > 1 and len(chunks) > 1 and not annif.parallel.in_thread_pool():
+            pool = annif.parallel.get_thread_pool(n_threads)
+            chunk_results = pool.map(suggest_chunk, chunks)
+        else:
+            chunk_results = map(suggest_chunk, chunks)
+
+        return SuggestionBatch.from_sequence(
+            list(itertools.chain.from_iterable(chunk_results)),
+            self.project.subjects,
+            limit=int(params["limit"]),
+        )
+
+    def _suggest_with_batch_endpoint(
+        self, documents: list[Document], params: dict[str, Any]
+    ) -> list[list[SubjectSuggestion]] | None:
+        """Suggest subjects for the documents with a single request to the
+        suggest-batch endpoint. Return None if the endpoint doesn't exist."""
+        data = {
+            "documents": [
+                {"text": doc.text, "metadata": doc.metadata} for doc in documents
+            ]
+        }
+        query = {"limit": params["limit"]}
+
+        try:
+            req = self.session.post(
+                params["endpoint"] + "-batch",
+                json=data,
+                params=query,
+                headers=self.headers,
+            )
+            req.raise_for_status()
+        except requests.exceptions.RequestException as err:
+            if err.response is not None and err.response.status_code in (404, 405):
+                self.warning(
+                    "suggest-batch endpoint not available, "
+                    "falling back to single document requests"
+                )
+                self._batch_unavailable = True
+                return None
+            self.warning("HTTP request failed: {}".format(err))
+            return [[] for _ in documents]
+
+        try:
+            response = req.json()
+        except ValueError as err:
+            self.warning("JSON decode failed: {}".format(err))
+            return [[] for _ in documents]
+
+        try:
+            if len(response) != len(documents):
+                raise ValueError("unexpected number of results")
+            return [
+                self._parse_results(doc_response["results"])
+                for doc_response in response
+            ]
+        except (TypeError, ValueError, KeyError) as err:
+            self.warning("Problem interpreting JSON data: {}".format(err))
+            return [[] for _ in documents]
+
+    def _parse_results(self, results: list[dict[str, Any]]) -> list[SubjectSuggestion]:
+        return [
+            SubjectSuggestion(
+                subject_id=self.project.subjects.by_uri(hit["uri"]),
+                score=hit["score"],
+            )
+            for hit in results
+            if hit["score"] > 0.0
+        ]
 
     def _suggest(
         self, doc: Document, params: dict[str, Any]
@@ -78,7 +227,7 @@ class HTTPBackend(backend.AnnifBackend):
             data["limit"] = params["limit"]
 
         try:
-            req = requests.post(params["endpoint"], data=data, headers=self.headers)
+            req = self.session.post(params["endpoint"], data=data, headers=self.headers)
             req.raise_for_status()
         except requests.exceptions.RequestException as err:
             self.warning("HTTP request failed: {}".format(err))
@@ -96,14 +245,7 @@ class HTTPBackend(backend.AnnifBackend):
             results = response
 
         try:
-            subject_suggestions = [
-                SubjectSuggestion(
-                    subject_id=self.project.subjects.by_uri(hit["uri"]),
-                    score=hit["score"],
-                )
-                for hit in results
-                if hit["score"] > 0.0
-            ]
+            subject_suggestions = self._parse_results(results)
         except (TypeError, ValueError) as err:
             self.warning("Problem interpreting JSON data: {}".format(err))
             return []
@@ -4,13 +4,20 @@ from __future__ import annotations
 
 import abc
 import collections
-import tempfile
-from typing import TYPE_CHECKING, Any, Callable
+import contextlib
+import multiprocessing
+import os
+import queue
+from typing import TYPE_CHECKING, Any, Callable, Iterator
 
 import optuna
 import optuna.exceptions
+from optuna.trial import TrialState
 
+import annif.backend
 import annif.parallel
+from annif import logger
+from annif.exception import ConfigurationException, OperationFailedException
 
 from .backend import AnnifBackend
 
@@ -24,22 +31,39 @@ if TYPE_CHECKING:
 HPRecommendation = collections.namedtuple("HPRecommendation", "lines score")
 
 
+def get_pruner(name: str) -> optuna.pruners.BasePruner:
+    """Return an Optuna pruner matching the given name"""
+    try:
+        return getattr(optuna.pruners, annif.backend.HYPEROPT_PRUNERS[name])()
+    except KeyError:
+        raise ConfigurationException(f"unknown pruner '{name}'")
+
+
 class TrialWriter:
     """Object that writes hyperparameter optimization trial results into a
-    TSV file."""
+    TSV file. If pruning is used, the final state of each trial and the number
+    of evaluated steps are included as well, and the value of pruned trials
+    is left empty."""
 
-    def __init__(self, results_file: LazyFile, normalize_func: Callable) -> None:
+    def __init__(
+        self, results_file: LazyFile, normalize_func: Callable, pruning: bool = False
+    ) -> None:
         self.results_file = results_file
         self.normalize_func = normalize_func
+        self.pruning = pruning
         self.header_written = False
 
     def write(self, trial_data: dict[str, Any]) -> None:
         """Write the results of one trial into the results file.  On the
         first run, write the header line first."""
 
+        stats_names = ["state", "steps"] if self.pruning else []
         if not self.header_written:
             param_names = list(trial_data["params"].keys())
-            print("\t".join(["trial", "value"] + param_names), file=self.results_file)
+            print(
+                "\t".join(["trial", "value"] + param_names + stats_names),
+                file=self.results_file,
+            )
             self.header_written = True
         print(
             "\t".join(
@@ -47,6 +71,7 @@ class TrialWriter:
                     str(e)
                     for e in [trial_data["number"], trial_data["value"]]
                     + list(self.normalize_func(trial_data["params"]).values())
+                    + [trial_data[name] for name in stats_names]
                 )
             ),
             file=self.results_file,
@@ -54,41 +79,66 @@ class TrialWriter:
 
 
 class HPObjective(annif.parallel.BaseWorker):
-    """Base class for hyperparameter optimizer objective functions"""
+    """Base class for hyperparameter optimizer objective functions. The
+    hyperparameters of each trial are suggested in the main process and
+    evaluated by workers, which receive the objective arguments only once
+    when the pool is started."""
+
+    # fractions of the corpus evaluated in successive steps when pruning
+    STEP_FRACTIONS = (0.25, 0.5, 1.0)
 
     @classmethod
-    def objective(cls, trial: Trial, args) -> float:
-        """Objective function to optimize. To be implemented by subclasses."""
+    def suggest_params(cls, trial: Trial, args) -> dict[str, Any]:
+        """Suggest the hyperparameters to evaluate in the given trial. To be
+        implemented by subclasses."""
 
         pass  # pragma: no cover
 
     @classmethod
-    def _objective_wrapper(cls, trial: Trial) -> float:
-        return cls.objective(trial, cls.args)
+    def evaluate(cls, params: dict[str, Any], args) -> float:
+        """Evaluate the given hyperparameters and return the value of the
+        objective function. To be implemented by subclasses."""
 
-    @classmethod
-    def run_trial(
-        cls, trial_id: int, storage_url: str, study_name: str
-    ) -> dict[str, Any]:
+        pass  # pragma: no cover
 
-        # use a callback to set the completed trial, to avoid race conditions
-        completed_trial = []
+    @classmethod
+    def evaluate_steps(cls, params: dict[str, Any], args) -> Iterator[float]:
+        """Evaluate the given hyperparameters in steps, yielding intermediate
+        values of the objective function for increasing fractions of the
+        corpus, the last one covering the whole corpus. Can be overridden by
+        subclasses to allow pruning. The default is a single step."""
 
-        def set_trial_callback(study: Study, trial: Trial) -> None:
-            completed_trial.append(trial)
+        yield cls.evaluate(params, args)
 
-        study = optuna.load_study(storage=storage_url, study_name=study_name)
-        study.optimize(
-            cls._objective_wrapper,
-            n_trials=1,
-            callbacks=[set_trial_callback],
-        )
+    @classmethod
+    def step_sizes(cls, n_samples: int) -> list[int]:
+        """Return the increasing numbers of samples to evaluate in each step"""
+        sizes = [max(round(fraction * n_samples), 1) for fraction in cls.STEP_FRACTIONS]
+        return sorted(set(sizes))
 
-        return {
-            "number": completed_trial[0].number,
-            "value": completed_trial[0].value,
-            "params": completed_trial[0].params,
-        }
+    @classmethod
+    def run_trial(
+        cls,
+        params: dict[str, Any],
+        trial_number: int | None = None,
+        reports: queue.Queue | None = None,
+        decisions: queue.Queue | None = None,
+    ) -> tuple[list[float], bool]:
+        """Evaluate a trial, returning its intermediate values and whether it
+        was pruned. When pruning, each intermediate value is put in the
+        reports queue together with the trial number, and the evaluation is
+        stopped if the main process answers True via the decisions queue."""
+
+        if reports is None:
+            return [cls.evaluate(params, cls.args)], False
+
+        values = []
+        for step, value in enumerate(cls.evaluate_steps(params, cls.args)):
+            values.append(value)
+            reports.put((trial_number, "step", (step, value)))
+            if decisions.get():
+                return values, True
+        return values, False
 
 
 class HyperparameterOptimizer:
@@ -105,6 +155,7 @@ class HyperparameterOptimizer:
         self._corpus = corpus
         self._metric = metric
         self._objective = objective
+        self._objective_args = None
 
     def _prepare(self, n_jobs: int = 1):
         """Prepare the optimizer for hyperparameter evaluation.  Up to
@@ -124,35 +175,132 @@ class HyperparameterOptimizer:
         return hps
 
     def optimize(
-        self, n_trials: int, n_jobs: int, results_file: LazyFile | None
+        self,
+        n_trials: int,
+        n_jobs: int,
+        results_file: LazyFile | None,
+        pruner: str = "none",
     ) -> HPRecommendation:
         """Find the optimal hyperparameters by testing up to the given number
-        of hyperparameter combinations"""
+        of hyperparameter combinations. Unpromising trials are stopped early
+        by the named pruner after evaluating a part of the corpus."""
 
-        objective_args = self._prepare(n_jobs)
-        self._objective.init(objective_args)
+        pruner_obj = get_pruner(pruner)
+        pruning = not isinstance(pruner_obj, optuna.pruners.NopPruner)
+        self._objective_args = self._prepare(n_jobs)
 
-        writer = TrialWriter(results_file, self._normalize) if results_file else None
-        write_callback = writer.write if writer else None
-
-        temp_db = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
-        storage_url = f"sqlite:///{temp_db.name}"
+        writer = (
+            TrialWriter(results_file, self._normalize, pruning)
+            if results_file
+            else None
+        )
 
-        study = optuna.create_study(direction="maximize", storage=storage_url)
+        # the study is kept in memory and driven by the main process using
+        # the ask-and-tell interface, workers only evaluate the trials. When
+        # pruning, the workers report intermediate values to the main process,
+        # which makes the pruning decisions using the trials of the study.
+        study = optuna.create_study(direction="maximize", pruner=pruner_obj)
+        running = {}
 
         jobs, pool_class = annif.parallel.get_pool(n_jobs)
-        with pool_class(jobs) as pool:
-            for i in range(n_trials):
+        with contextlib.ExitStack() as stack:
+            if pruning:
+                manager = stack.enter_context(
+                    multiprocessing.get_context(
+                        annif.parallel.MP_START_METHOD
+                    ).Manager()
+                )
+                events = manager.Queue()
+            else:
+                events = queue.Queue()
+            pool = stack.enter_context(
+                pool_class(
+                    jobs,
+                    initializer=self._objective.init,
+                    initargs=(self._objective_args,),
+                )
+            )
+
+            def start_trial() -> None:
+                trial = study.ask()
+                params = self._objective.suggest_params(trial, self._objective_args)
+                if pruning:
+                    decisions = manager.Queue()
+                    args = (params, trial.number, events, decisions)
+                else:
+                    decisions = None
+                    args = (params,)
+                running[trial.number] = (trial, decisions)
                 pool.apply_async(
                     self._objective.run_trial,
-                    args=(i, storage_url, study.study_name),
-                    callback=write_callback,
+                    args=args,
+                    callback=lambda result, number=trial.number: events.put(
+                        (number, "done", result)
+                    ),
+                    error_callback=lambda err, number=trial.number: events.put(
+                        (number, "done", err)
+                    ),
                 )
-            pool.close()
-            pool.join()
 
+            n_started = min(jobs or os.cpu_count(), n_trials)
+            for _ in range(n_started):
+                start_trial()
+            n_finished = 0
+            while n_finished < n_trials:
+                number, event, payload = events.get()
+                trial, decisions = running[number]
+                if event == "step":
+                    step, value = payload
+                    trial.report(value, step)
+                    decisions.put(trial.should_prune())
+                    continue
+                del running[number]
+                self._finish_trial(study, trial, payload, writer)
+                n_finished += 1
+                if n_started < n_trials:
+                    start_trial()
+                    n_started += 1
+
+        if pruning:
+            n_pruned = len(study.get_trials(states=(TrialState.PRUNED,)))
+            logger.info(f"Pruned {n_pruned} of {n_trials} trials")
+        if not study.get_trials(states=(TrialState.COMPLETE,)):
+            raise OperationFailedException(
+                f"None of the {n_trials} trials completed successfully, "
+                + "cannot recommend hyperparameters"
+            )
         return self._postprocess(study)
 
+    def _finish_trial(
+        self,
+        study: Study,
+        trial: Trial,
+        result: tuple[list[float], bool] | Exception,
+        writer: TrialWriter | None,
+    ) -> None:
+        if isinstance(result, Exception):
+            logger.warning(f"Trial {trial.number} failed: {result}")
+            study.tell(trial, state=TrialState.FAIL)
+            return
+
+        values, pruned = result
+        if pruned:
+            study.tell(trial, state=TrialState.PRUNED)
+        else:
+            study.tell(trial, values[-1])
+        if writer:
+            writer.write(
+                {
+                    "number": trial.number,
+                    # the partial corpus values of pruned trials are not
+                    # comparable to the others
+                    "value": "" if pruned else values[-1],
+                    "params": trial.params,
+                    "state": "pruned" if pruned else "complete",
+                    "steps": len(values),
+                }
+            )
+
 
 class AnnifHyperoptBackend(AnnifBackend):
     """Base class for Annif backends that can perform hyperparameter
@@ -4,13 +4,14 @@ from __future__ import annotations
 
 import abc
 import os.path
+import time
 from typing import TYPE_CHECKING, Any
 
 import joblib
 from sklearn.feature_extraction.text import TfidfVectorizer
 
 import annif.util
-from annif.exception import NotInitializedException
+from annif.exception import ConfigurationException, NotInitializedException
 
 if TYPE_CHECKING:
     from collections.abc import Iterable
@@ -92,3 +93,75 @@ class TfidfVectorizerMixin:
             self.vectorizer, self.datadir, self.VECTORIZER_FILE, method=joblib.dump
         )
         return veccorpus
+
+
+class JoblibSerializationMixin:
+    """Annif backend mixin that implements saving and loading of objects
+    using joblib. The serialization policy is set using the "serialization"
+    backend parameter: "compressed" (gzip, the default), "uncompressed" or
+    "mmap" (uncompressed, with NumPy arrays memory-mapped when loading)."""
+
+    SERIALIZATION_EXTENSIONS = {
+        "compressed": ".gz",
+        "uncompressed": ".joblib",
+        "mmap": ".joblib",
+    }
+
+    def _serialization_policy(self, params: dict[str, Any]) -> str:
+        policy = params.get("serialization", "compressed")
+        if policy not in self.SERIALIZATION_EXTENSIONS:
+            raise ConfigurationException(
+                "invalid serialization policy '{}', expected one of: {}".format(
+                    policy, ", ".join(self.SERIALIZATION_EXTENSIONS)
+                ),
+                backend_id=self.backend_id,
+            )
+        return policy
+
+    def save_joblib(self, obj: Any, basename: str, params: dict[str, Any]) -> None:
+        """Save the given object into the data directory using the given
+        base file name and the configured serialization policy. A file
+        previously saved using another policy is removed."""
+
+        extension = self.SERIALIZATION_EXTENSIONS[self._serialization_policy(params)]
+        compress = 3 if extension == ".gz" else 0
+        annif.util.atomic_save(
+            obj,
+            self.datadir,
+            basename + extension,
+            method=lambda obj, fn: joblib.dump(obj, fn, compress=compress),
+        )
+        for other_ext in set(self.SERIALIZATION_EXTENSIONS.values()) - {extension}:
+            other_path = os.path.join(self.datadir, basename + other_ext)
+            if os.path.exists(other_path):
+                os.remove(other_path)
+
+    def load_joblib(self, basename: str, params: dict[str, Any]) -> Any:
+        """Load an object saved using save_joblib from the data directory.
+        The file matching the configured serialization policy is preferred,
+        but a file saved using another policy will also be loaded."""
+
+        policy = self._serialization_policy(params)
+        extension = self.SERIALIZATION_EXTENSIONS[policy]
+        extensions = [extension] + sorted(
+            set(self.SERIALIZATION_EXTENSIONS.values()) - {extension}
+        )
+        for ext in extensions:
+            path = os.path.join(self.datadir, basename + ext)
+            if os.path.exists(path):
+                mmap_mode = "r" if policy == "mmap" and ext == ".joblib" else None
+                self.debug("loading {} (mmap_mode={})".format(path, mmap_mode))
+                start_time = time.perf_counter()
+                obj = joblib.load(path, mmap_mode=mmap_mode)
+                self.debug(
+                    "loaded {} in {:.3f} seconds".format(
+                        path, time.perf_counter() - start_time
+                    )
+                )
+                return obj
+        raise NotInitializedException(
+            "model {} not found".format(
+                os.path.join(self.datadir, basename + extension)
+            ),
+            backend_id=self.backend_id,
+        )
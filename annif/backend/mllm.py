@@ -13,13 +13,14 @@ import annif.util
 from annif.exception import NotInitializedException, NotSupportedException
 from annif.lexical.mllm import (
     MLLMModel,
+    TreeEnsemble,
     candidates_to_features,
     create_classifier,
     prediction_to_list,
 )
 from annif.suggestion import vector_to_suggestions
 
-from . import hyperopt
+from . import hyperopt, mixins
 
 if TYPE_CHECKING:
     from collections.abc import Iterator
@@ -28,7 +29,7 @@ if TYPE_CHECKING:
     from optuna.trial import Trial
 
     from annif.backend.hyperopt import HPRecommendation
-    from annif.corpus import Document, DocumentCorpus
+    from annif.corpus import Document, DocumentCorpus, SubjectSet
     from annif.lexical.mllm import Candidate
     from annif.vocab import SubjectIndex
 
@@ -48,28 +49,51 @@ class MLLMHPObjective(hyperopt.HPObjective):
     """Objective function of the MLLM hyperparameter optimizer"""
 
     @classmethod
-    def objective(cls, trial: Trial, args) -> float:
-        params = {
+    def suggest_params(cls, trial: Trial, args) -> dict[str, Any]:
+        return {
             "min_samples_leaf": trial.suggest_int("min_samples_leaf", 5, 30),
             "max_leaf_nodes": trial.suggest_int("max_leaf_nodes", 100, 2000),
             "max_samples": trial.suggest_float("max_samples", 0.5, 1.0),
             "limit": 100,
         }
+
+    @classmethod
+    def _evaluate_docs(
+        cls, params: dict[str, Any], args, step_sizes: list[int]
+    ) -> Iterator[float]:
+        # train the model once and evaluate it on the documents, yielding the
+        # metric value after each of the given numbers of documents
         model = create_classifier(params)
         model.fit(args["train_x"], args["train_y"])
+        ensemble = TreeEnsemble(model)
 
         batch = annif.eval.EvaluationBatch(args["subject_index"])
-        for goldsubj, candidates in zip(args["gold_subjects"], args["candidates"]):
+        docs = zip(args["gold_subjects"], args["candidates"])
+        idx = 0
+        for idx, (goldsubj, candidates) in enumerate(docs, start=1):
             if candidates:
                 features = candidates_to_features(candidates, args["model_data"])
-                scores = model.predict_proba(features)
+                scores = ensemble.predict_proba(features)
                 ranking = prediction_to_list(scores, candidates)
             else:
                 ranking = []
             results = prediction_to_result(ranking, params, args["subject_index"])
             batch.evaluate_many([results], [goldsubj])
-        results = batch.results(metrics=[args["metric"]])
-        return results[args["metric"]]
+            if idx in step_sizes:
+                yield batch.results(metrics=[args["metric"]])[args["metric"]]
+        if idx == 0:  # empty corpus
+            yield batch.results(metrics=[args["metric"]])[args["metric"]]
+
+    @classmethod
+    def evaluate(cls, params: dict[str, Any], args) -> float:
+        n_docs = len(args["gold_subjects"])
+        return next(cls._evaluate_docs(params, args, [n_docs]))
+
+    @classmethod
+    def evaluate_steps(cls, params: dict[str, Any], args) -> Iterator[float]:
+        return cls._evaluate_docs(
+            params, args, cls.step_sizes(len(args["gold_subjects"]))
+        )
 
 
 class MLLMOptimizer(hyperopt.HyperparameterOptimizer):
@@ -81,11 +105,11 @@ class MLLMOptimizer(hyperopt.HyperparameterOptimizer):
         all_candidates = []
         gold_subjects = []
 
-        # TODO parallelize generation of candidates
-        for doc in self._corpus.documents:
-            candidates = self._backend._generate_candidates(doc.text)
+        for subject_set, candidates in self._backend._generate_corpus_candidates(
+            self._corpus, n_jobs
+        ):
             all_candidates.append(candidates)
-            gold_subjects.append(doc.subject_set)
+            gold_subjects.append(subject_set)
 
         return {
             "train_x": train_x,
@@ -107,7 +131,7 @@ class MLLMOptimizer(hyperopt.HyperparameterOptimizer):
         return hyperopt.HPRecommendation(lines=lines, score=study.best_value)
 
 
-class MLLMBackend(hyperopt.AnnifHyperoptBackend):
+class MLLMBackend(mixins.JoblibSerializationMixin, hyperopt.AnnifHyperoptBackend):
     """Maui-like Lexical Matching backend for Annif"""
 
     name = "mllm"
@@ -115,36 +139,38 @@ class MLLMBackend(hyperopt.AnnifHyperoptBackend):
     # defaults for unitialized instances
     _model = None
 
-    MODEL_FILE = "mllm-model.gz"
-    TRAIN_FILE = "mllm-train.gz"
+    MODEL_FILE = "mllm-model"
+    TRAIN_X_FILE = "mllm-train-x.npy"
+    TRAIN_Y_FILE = "mllm-train-y.npy"
+    # training data file written by Annif 1.4 and older
+    LEGACY_TRAIN_FILE = "mllm-train.gz"
 
     DEFAULT_PARAMETERS = {
         "min_samples_leaf": 20,
         "max_leaf_nodes": 1000,
         "max_samples": 0.9,
         "use_hidden_labels": False,
+        "serialization": "compressed",
     }
 
     def get_hp_optimizer(self, corpus: DocumentCorpus, metric: str) -> MLLMOptimizer:
         return MLLMOptimizer(self, corpus, metric, MLLMHPObjective)
 
     def _load_model(self) -> MLLMModel:
-        path = os.path.join(self.datadir, self.MODEL_FILE)
-        self.debug("loading model from {}".format(path))
-        if os.path.exists(path):
-            return MLLMModel.load(path)
-        else:
-            raise NotInitializedException(
-                "model {} not found".format(path), backend_id=self.backend_id
-            )
+        return self.load_joblib(self.MODEL_FILE, self.params)
 
     def _load_train_data(self) -> tuple[np.ndarray, np.ndarray]:
-        path = os.path.join(self.datadir, self.TRAIN_FILE)
-        if os.path.exists(path):
-            return joblib.load(path)
+        x_path = os.path.join(self.datadir, self.TRAIN_X_FILE)
+        y_path = os.path.join(self.datadir, self.TRAIN_Y_FILE)
+        legacy_path = os.path.join(self.datadir, self.LEGACY_TRAIN_FILE)
+        if os.path.exists(x_path) and os.path.exists(y_path):
+            return (np.load(x_path, mmap_mode="r"), np.load(y_path))
+        elif os.path.exists(legacy_path):
+            return joblib.load(legacy_path)  # pragma: no cover
         else:
             raise NotInitializedException(
-                "train data file {} not found".format(path), backend_id=self.backend_id
+                "train data file {} not found".format(x_path),
+                backend_id=self.backend_id,
             )
 
     def initialize(self, parallel: bool = False) -> None:
@@ -166,10 +192,18 @@ class MLLMBackend(hyperopt.AnnifHyperoptBackend):
             self.info("preparing training data")
             self._model = MLLMModel()
             train_data = self._model.prepare_train(
-                corpus, self.project.vocab, self.project.analyzer, params, jobs
+                corpus,
+                self.project.vocab,
+                self.project.analyzer,
+                params,
+                jobs,
+                os.path.join(self.datadir, self.TRAIN_X_FILE),
             )
             annif.util.atomic_save(
-                train_data, self.datadir, self.TRAIN_FILE, method=joblib.dump
+                train_data[1],
+                self.datadir,
+                self.TRAIN_Y_FILE,
+                method=lambda arr, fn: np.save(fn, arr),
             )
         else:
             self.info("reusing cached training data from previous run")
@@ -180,11 +214,18 @@ class MLLMBackend(hyperopt.AnnifHyperoptBackend):
         self._model.train(train_data[0], train_data[1], params)
 
         self.info("saving model")
-        annif.util.atomic_save(self._model, self.datadir, self.MODEL_FILE)
+        self.save_joblib(self._model, self.MODEL_FILE, params)
 
     def _generate_candidates(self, text: str) -> list[Candidate]:
         return self._model.generate_candidates(text, self.project.analyzer)
 
+    def _generate_corpus_candidates(
+        self, corpus: DocumentCorpus, n_jobs: int
+    ) -> list[tuple[SubjectSet, list[Candidate]]]:
+        return self._model.generate_corpus_candidates(
+            corpus, self.project.analyzer, n_jobs
+        )
+
     def _suggest(self, doc: Document, params: dict[str, Any]) -> Iterator:
         candidates = self._generate_candidates(doc.text)
         prediction = self._model.predict(candidates)
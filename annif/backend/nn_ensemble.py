@@ -3,21 +3,18 @@ projects."""
 
 from __future__ import annotations
 
-import copy
+import collections
 import os.path
 import shutil
-import sys
+import struct
 from io import BytesIO
 from typing import TYPE_CHECKING, Any
 
 import joblib
 import lmdb
 import numpy as np
-import torch
-import torch.nn as nn
-from scipy.sparse import csr_matrix
-from torch.utils.data import DataLoader, Dataset
-from tqdm import tqdm
+import scipy.special
+from scipy.sparse import csr_array
 
 import annif.corpus
 import annif.parallel
@@ -27,13 +24,18 @@ from annif.exception import (
     NotSupportedException,
     OperationFailedException,
 )
-from annif.suggestion import SuggestionBatch, vector_to_suggestions
+from annif.suggestion import SubjectSuggestion, SuggestionBatch
 
 from . import backend, ensemble
 
 if TYPE_CHECKING:
+    from types import ModuleType
+
+    from annif.corpus import SubjectSet
     from annif.corpus.document import DocumentCorpus
 
+    from .nn_ensemble_torch import LMDBDataset, NNEnsembleModel
+
 logger = annif.logger
 
 
@@ -47,150 +49,200 @@ def key_to_idx(key: memoryview | bytes) -> int:
     return int(key)
 
 
-class LMDBDataset(Dataset):
-    """A sequence of samples stored in a LMDB database."""
-
-    def __init__(self, txn):
-        super().__init__()
-        self._txn = txn
-        cursor = txn.cursor()
-        if cursor.last():
-            # Counter holds the number of samples in the database
-            self._counter = key_to_idx(cursor.key()) + 1
-        else:  # empty database
-            self._counter = 0
-
-    def add_sample(self, inputs: np.ndarray, targets: np.ndarray) -> None:
-        # use zero-padded 8-digit key
-        key = idx_to_key(self._counter)
-        self._counter += 1
-        # convert the sample into a sparse matrix and serialize it as bytes
-        sample = (csr_matrix(inputs), csr_matrix(targets))
-        buf = BytesIO()
-        joblib.dump(sample, buf)
-        buf.seek(0)
-        self._txn.put(key, buf.read())
-
-    def __getitem__(self, idx: int) -> tuple[torch.Tensor, torch.Tensor]:
-        """get a particular sample"""
-        cursor = self._txn.cursor()
-        cursor.set_key(idx_to_key(idx))
-        value = cursor.value()
-        input_csr, target_csr = joblib.load(BytesIO(value))
-        input_tensor = torch.log1p(torch.from_numpy(input_csr.toarray()))
-        target_tensor = torch.log1p(torch.from_numpy(target_csr.toarray()[0]).float())
-        return input_tensor, target_tensor
-
-    def get_subset(self, indices: list[int]) -> tuple[torch.Tensor, torch.Tensor]:
-        """Fetch a fixed set of samples by index and stack into batch tensors.
-
-        Returns (inputs, targets) where inputs is ``torch.Tensor`` of shape (B, M, N)
-        and targets is ``torch.Tensor`` of shape (B, N).
-        """
-        inputs_list, targets_list = [], []
-        for idx in indices:
-            inp, tgt = self[idx]
-            inputs_list.append(inp)
-            targets_list.append(tgt)
-        inputs = torch.stack(inputs_list, dim=0)
-        targets = torch.stack(targets_list, dim=0)
-        return inputs, targets
-
-    def __len__(self) -> int:
-        """return the number of available samples"""
-        return self._counter
-
-
-class NNEnsembleModel(nn.Module):
-    def __init__(self, n_sources: int, n_subjects: int, source_weights: list[float]):
-        super().__init__()
-        self.model_config = {
-            "n_sources": n_sources,
-            "n_subjects": n_subjects,
-            "source_weights": source_weights,
-        }
-        # per-concept/source weights
-        init_weights = torch.tensor(source_weights, dtype=torch.float32)
-        init_weights = init_weights / init_weights.sum()
-        self.weights = nn.Parameter(
-            init_weights[:, None].expand(-1, n_subjects).contiguous()
-        )
-        # bias decomposition: global + per-label delta
-        self.bias_global = nn.Parameter(torch.tensor(0.0, dtype=torch.float32))
-        self.bias_delta = nn.Parameter(torch.zeros(n_subjects, dtype=torch.float32))
-
-    def forward(self, inputs: torch.Tensor):
-        weighted = inputs * self.weights.unsqueeze(0)
-        return weighted.sum(1) + self.bias_global + self.bias_delta
-
-    def save(self, filepath):
-        torch.save(
-            {
-                "model_state_dict": self.state_dict(),
-                "model_class": self.__class__.__name__,
-                "model_config": self.model_config,
-                "pytorch_version": str(torch.__version__),
-                "python_version": sys.version,
-            },
-            filepath,
-        )
+# A training sample is stored in LMDB as a binary record: a header giving the
+# sample dimensions and the number of nonzero input and target values,
+# followed by the raw input source indices, input subject indices and input
+# scores and finally the target subject indices. All values are 4 bytes wide.
+SAMPLE_MAGIC = b"NNS1"
+SAMPLE_HEADER = struct.Struct("<4sIIII")
 
-    @classmethod
-    def load(cls, filepath, map_location="cpu"):
-        checkpoint = torch.load(filepath, map_location=map_location, weights_only=True)
-        config = checkpoint["model_config"]
-        model = cls(**config)
-        model.load_state_dict(checkpoint["model_state_dict"])
-        model.eval()
-        return model
-
-
-class EarlyStopping:
-    def __init__(self, patience: int):
-        self._patience = patience
-        self._best_metric = None
-        self._no_improvement_count = 0
-        self._stop_early = False
-        self.best_state = None
-        self.best_epoch = 0
-
-    def __call__(self, model, metric, epoch):
-        if self._best_metric is None or metric > self._best_metric:
-            self._best_metric = metric
-            self._no_improvement_count = 0
-            self.best_state = copy.deepcopy(model.state_dict())
-            self.best_epoch = epoch
-        else:
-            self._no_improvement_count += 1
-            if self._no_improvement_count >= self._patience:
-                self._stop_early = True
+Sample = collections.namedtuple(
+    "Sample", "n_sources n_subjects input_rows input_cols input_values target_cols"
+)
 
-        return self._stop_early
 
+def _pack_sample(
+    n_sources: int,
+    n_subjects: int,
+    input_rows: np.ndarray,
+    input_cols: np.ndarray,
+    input_values: np.ndarray,
+    target_cols: np.ndarray,
+) -> bytes:
+    header = SAMPLE_HEADER.pack(
+        SAMPLE_MAGIC, n_sources, n_subjects, len(input_rows), len(target_cols)
+    )
+    return b"".join(
+        [
+            header,
+            input_rows.astype(np.int32).tobytes(),
+            input_cols.astype(np.int32).tobytes(),
+            input_values.astype(np.float32).tobytes(),
+            target_cols.astype(np.int32).tobytes(),
+        ]
+    )
+
+
+def encode_sample(inputs: np.ndarray, targets: np.ndarray) -> bytes:
+    """encode a sample given as a dense (sources x subjects) score array and
+    a dense target vector into a compact binary record"""
+    input_rows, input_cols = np.nonzero(inputs)
+    return _pack_sample(
+        *inputs.shape,
+        input_rows,
+        input_cols,
+        inputs[input_rows, input_cols],
+        np.flatnonzero(targets),
+    )
+
+
+def encode_batch(
+    arrays: list[csr_array], subject_sets: list[SubjectSet]
+) -> list[bytes]:
+    """encode the samples for a batch of documents, given as a list of
+    (documents x subjects) score arrays, one per source, and the gold
+    standard subjects of each document"""
+    coos = [array.tocoo() for array in arrays]
+    docs = np.concatenate([coo.row for coo in coos])
+    rows = np.concatenate(
+        [np.full(coo.nnz, idx, dtype=np.int32) for idx, coo in enumerate(coos)]
+    )
+    cols = np.concatenate([coo.col for coo in coos])
+    values = np.concatenate([coo.data for coo in coos])
+    # order the values by document, then source and subject like np.nonzero
+    order = np.lexsort((cols, rows, docs))
+    order = order[values[order] != 0.0]
+    docs, rows, cols, values = docs[order], rows[order], cols[order], values[order]
+    n_docs, n_subjects = arrays[0].shape
+    bounds = np.searchsorted(docs, np.arange(n_docs + 1))
+    return [
+        _pack_sample(
+            len(arrays),
+            n_subjects,
+            rows[bounds[idx] : bounds[idx + 1]],
+            cols[bounds[idx] : bounds[idx + 1]],
+            values[bounds[idx] : bounds[idx + 1]],
+            np.unique(np.array(list(subject_set), dtype=np.int32)),
+        )
+        for idx, subject_set in enumerate(subject_sets)
+    ]
 
-@torch.no_grad()
-def ndcg_batch(preds: torch.Tensor, targets: torch.Tensor) -> float:
-    """
-    preds:   (B, N) float
-    targets: (B, N) binary {0, 1} relevance labels
 
-    Returns: mean NDCG across the batch (float)
-    """
-    sorted_idx = torch.argsort(preds, dim=1, descending=True)
-    sorted_targets = torch.gather(targets, 1, sorted_idx)
+def decode_sample(value: memoryview | bytes) -> Sample:
+    """decode a binary record into a Sample; records written using the older
+    joblib based format are also supported"""
+    if bytes(value[:4]) != SAMPLE_MAGIC:
+        input_csr, target_csr = joblib.load(BytesIO(value))
+        input_coo = input_csr.tocoo()
+        return Sample(
+            *input_csr.shape,
+            input_coo.row.astype(np.int32),
+            input_coo.col.astype(np.int32),
+            input_coo.data.astype(np.float32),
+            target_csr.indices.astype(np.int32),
+        )
 
-    L = sorted_targets.size(1)
-    ranks = torch.arange(1, L + 1, device=preds.device)
-    discounts = 1.0 / torch.log2(ranks + 1)
+    _, n_sources, n_subjects, n_inputs, n_targets = SAMPLE_HEADER.unpack_from(value)
+    offset = SAMPLE_HEADER.size
+    input_rows = np.frombuffer(value, np.int32, n_inputs, offset)
+    offset += input_rows.nbytes
+    input_cols = np.frombuffer(value, np.int32, n_inputs, offset)
+    offset += input_cols.nbytes
+    input_values = np.frombuffer(value, np.float32, n_inputs, offset)
+    offset += input_values.nbytes
+    target_cols = np.frombuffer(value, np.int32, n_targets, offset)
+    return Sample(
+        n_sources, n_subjects, input_rows, input_cols, input_values, target_cols
+    )
+
+
+class NNEnsemblePredictor:
+    """Inference for a trained NNEnsembleModel using NumPy only, working
+    directly on the sparse source suggestions. Scores are computed only for
+    subjects suggested by at least one source, plus the subjects with the
+    highest bias, since all other subjects have a lower bias-only score."""
+
+    def __init__(
+        self,
+        weights: np.ndarray,
+        bias_global: np.ndarray,
+        bias_delta: np.ndarray,
+        scale: float,
+    ) -> None:
+        self._weights = weights
+        self._bias_global = bias_global
+        self._bias_delta = bias_delta
+        self._bias = bias_global + bias_delta
+        self._scale = scale
+        self._bias_scores = scipy.special.expit(scale * self._bias)
+        self._bias_order = np.argsort(-self._bias, kind="stable")
 
-    dcg = (sorted_targets * discounts).sum(dim=1)
+    @classmethod
+    def from_arrays(
+        cls, arrays: dict[str, np.ndarray], scale: float
+    ) -> NNEnsemblePredictor:
+        return cls(
+            arrays["weights"], arrays["bias_global"], arrays["bias_delta"], scale
+        )
 
-    ideal_sorted = torch.sort(targets, dim=1, descending=True).values[:, :L]
-    idcg = (ideal_sorted * discounts).sum(dim=1)
+    @classmethod
+    def load(cls, filepath: str, scale: float) -> NNEnsemblePredictor:
+        with np.load(filepath) as arrays:
+            return cls.from_arrays(dict(arrays), scale)
 
-    ndcg = dcg / torch.clamp(idcg, min=1e-8)
+    def save(self, filepath: str) -> None:
+        np.savez(
+            filepath,
+            weights=self._weights,
+            bias_global=self._bias_global,
+            bias_delta=self._bias_delta,
+        )
 
-    return ndcg.mean().item()
+    def _combine_sources(self, arrays: list[csr_array]) -> csr_array:
+        """Return the weighted sum of the log1p transformed source scores,
+        covering the union of subjects suggested by any source"""
+        rows, cols, values = [], [], []
+        for source_idx, array in enumerate(arrays):
+            rows.append(np.repeat(np.arange(array.shape[0]), np.diff(array.indptr)))
+            cols.append(array.indices)
+            values.append(
+                self._weights[source_idx, array.indices] * np.log1p(array.data)
+            )
+        return csr_array(
+            (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+            shape=arrays[0].shape,
+            dtype=np.float32,
+        )
+
+    def predict(
+        self, arrays: list[csr_array], limit: int
+    ) -> list[list[SubjectSuggestion]]:
+        """Return the top suggestions for each document, given a list of
+        (documents x subjects) score arrays, one per source"""
+        combined = self._combine_sources(arrays)
+        scores = scipy.special.expit(
+            self._scale * (combined.data + self._bias[combined.indices])
+        )
+        results = []
+        for row in range(combined.shape[0]):
+            row_slice = slice(combined.indptr[row], combined.indptr[row + 1])
+            cols = combined.indices[row_slice]
+            bias_cols = self._bias_order[: limit + len(cols)]
+            bias_cols = bias_cols[~np.isin(bias_cols, cols)][:limit]
+            cand_cols = np.concatenate([cols, bias_cols])
+            cand_scores = np.concatenate(
+                [scores[row_slice], self._bias_scores[bias_cols]]
+            )
+            top = np.argsort(-cand_scores, kind="stable")[:limit]
+            results.append(
+                [
+                    SubjectSuggestion(
+                        subject_id=int(cand_cols[idx]), score=float(cand_scores[idx])
+                    )
+                    for idx in top
+                ]
+            )
+        return results
 
 
 class NNEnsembleBackend(backend.AnnifLearningBackend, ensemble.BaseEnsembleBackend):
@@ -200,10 +252,12 @@ class NNEnsembleBackend(backend.AnnifLearningBackend, ensemble.BaseEnsembleBacke
     name = "nn_ensemble"
 
     MODEL_FILE = "nn-model.pt"
+    ARRAYS_FILE = "nn-model.npz"
     LMDB_FILE = "nn-train.mdb"
 
     EARLY_STOPPING_PATIENCE = 2
     EARLY_STOP_EVAL_ROWS = 512
+    EARLY_STOP_EVAL_CHUNK = 64
     EARLY_STOP_SEED = 1337
     PRED_SCALE = 20
 
@@ -213,19 +267,55 @@ class NNEnsembleBackend(backend.AnnifLearningBackend, ensemble.BaseEnsembleBacke
         "learn-epochs": 1,
         "batch-size": 256,
         "lmdb_map_size": 1024 * 1024 * 1024,
+        "sparse-training": False,
     }
 
     # defaults for uninitialized instances
     _model = None
+    _predictor = None
 
     def initialize(self, parallel: bool = False) -> None:
         super().initialize(parallel)
-        if self._model is not None:
+        if self._predictor is not None:
             return  # already initialized
         if parallel:
             # Don't load model just before parallel execution,
             # since it won't work after forking worker processes
             return
+        arrays_filename = os.path.join(self.datadir, self.ARRAYS_FILE)
+        if os.path.exists(arrays_filename):
+            self.debug("loading model arrays from {}".format(arrays_filename))
+            try:
+                self._predictor = NNEnsemblePredictor.load(
+                    arrays_filename, self.PRED_SCALE
+                )
+            except Exception as err:
+                message = (
+                    f"loading model from {arrays_filename}; "
+                    f'original error message: "{err}"'
+                )
+                raise OperationFailedException(message, backend_id=self.backend_id)
+        else:
+            # model trained before the arrays were exported
+            self._model = self._load_model()
+            self._predictor = NNEnsemblePredictor.from_arrays(
+                self._model.export_arrays(), self.PRED_SCALE
+            )
+
+    def _torch_module(self) -> ModuleType:
+        """Import the PyTorch based parts of the backend, which are needed
+        only for training"""
+        try:
+            from . import nn_ensemble_torch
+        except ImportError as err:
+            raise NotSupportedException(
+                "PyTorch not available, cannot use nn_ensemble backend",
+                backend_id=self.backend_id,
+            ) from err
+        return nn_ensemble_torch
+
+    def _load_model(self) -> NNEnsembleModel:
+        """Load the PyTorch model, needed only for further training"""
         model_filename = os.path.join(self.datadir, self.MODEL_FILE)
         if not os.path.exists(model_filename):
             raise NotInitializedException(
@@ -233,8 +323,10 @@ class NNEnsembleBackend(backend.AnnifLearningBackend, ensemble.BaseEnsembleBacke
                 backend_id=self.backend_id,
             )
         self.debug("loading model from {}".format(model_filename))
+        nn_ensemble_torch = self._torch_module()
+
         try:
-            self._model = NNEnsembleModel.load(model_filename)
+            return nn_ensemble_torch.NNEnsembleModel.load(model_filename)
         except Exception as err:
             message = (
                 f"loading model from {model_filename}; "
@@ -248,34 +340,20 @@ class NNEnsembleBackend(backend.AnnifLearningBackend, ensemble.BaseEnsembleBacke
         sources: list[tuple[str, float]],
         params: dict[str, Any],
     ) -> SuggestionBatch:
-        score_vectors = np.array(
-            [
-                [suggestions.as_vector() for suggestions in batch]
-                for project_id, batch in batch_by_source.items()
-            ],
-            dtype=np.float32,
-        )
-        score_vector_tensor = torch.log1p(
-            torch.from_numpy(score_vectors.swapaxes(0, 1))
-        )
-        with torch.no_grad():
-            prediction = self._model(score_vector_tensor)
-        # use sigmoid to ensure [0..1] range, scaled to spread out values
-        scaled_pred = torch.sigmoid(prediction * self.PRED_SCALE)
+        arrays = [batch_by_source[project_id].array for project_id, _ in sources]
         return SuggestionBatch.from_sequence(
-            [
-                vector_to_suggestions(row, limit=int(params["limit"]))
-                for row in scaled_pred.detach().numpy()
-            ],
+            self._predictor.predict(arrays, limit=int(params["limit"])),
             self.project.subjects,
         )
 
     def _create_model(self, sources: list[tuple[str, float]]) -> None:
+        nn_ensemble_torch = self._torch_module()
+
         self.info("creating NN ensemble model")
 
         # Create PyTorch model
 
-        self._model = NNEnsembleModel(
+        self._model = nn_ensemble_torch.NNEnsembleModel(
             n_sources=len(sources),
             n_subjects=len(self.project.subjects),
             source_weights=[src[1] for src in sources],
@@ -295,6 +373,7 @@ class NNEnsembleBackend(backend.AnnifLearningBackend, ensemble.BaseEnsembleBacke
             batch_size=int(params["batch-size"]),
             lr=float(params["lr"]),
             lmdb_map_size=int(params["lmdb_map_size"]),
+            sparse=annif.util.boolean(params["sparse-training"]),
             n_jobs=jobs,
         )
 
@@ -325,15 +404,11 @@ class NNEnsembleBackend(backend.AnnifLearningBackend, ensemble.BaseEnsembleBacke
 
         self.info("Processing training documents...")
         with pool_class(jobs) as pool:
-            for hits, subject_set in pool.imap_unordered(
-                psmap.suggest, corpus.documents
+            for hit_sets, subject_sets in pool.imap_unordered(
+                psmap.suggest_batch, corpus.doc_batches
             ):
-                score_vector = np.array(
-                    [p_hits.as_vector() for project_id, p_hits in hits.items()],
-                    dtype=np.float32,
-                )
-                true_vector = subject_set.as_vector(len(self.project.subjects))
-                seq.add_sample(score_vector, true_vector)
+                arrays = [hit_sets[project_id].array for project_id in sources]
+                seq.add_encoded_samples(encode_batch(arrays, subject_sets))
 
     def _open_lmdb(self, cached, lmdb_map_size):
         lmdb_path = os.path.join(self.datadir, self.LMDB_FILE)
@@ -348,8 +423,15 @@ class NNEnsembleBackend(backend.AnnifLearningBackend, ensemble.BaseEnsembleBacke
         batch_size: int,
         lr: float,
         lmdb_map_size: int,
+        sparse: bool = False,
         n_jobs: int = 1,
     ) -> None:
+        nn_ensemble_torch = self._torch_module()
+        # PyTorch is known to be available from here on
+        import torch
+        from torch.utils.data import DataLoader
+        from tqdm import tqdm
+
         env = self._open_lmdb(corpus == "cached", lmdb_map_size)
         if corpus != "cached":
             if corpus.is_empty():
@@ -357,7 +439,7 @@ class NNEnsembleBackend(backend.AnnifLearningBackend, ensemble.BaseEnsembleBacke
                     "Cannot train nn_ensemble project with no documents"
                 )
             with env.begin(write=True, buffers=True) as txn:
-                seq = LMDBDataset(txn)
+                seq = nn_ensemble_torch.LMDBDataset(txn)
                 self._corpus_to_vectors(corpus, seq, n_jobs)
         else:
             self.info("Reusing cached training data from previous run.")
@@ -365,16 +447,21 @@ class NNEnsembleBackend(backend.AnnifLearningBackend, ensemble.BaseEnsembleBacke
         # fit the model using a read-only view of the LMDB
         self.info("Training model...")
         with env.begin(buffers=True) as txn:
-            dataset = LMDBDataset(txn)
+            dataset = nn_ensemble_torch.LMDBDataset(txn, sparse=sparse)
             dataloader = DataLoader(
-                dataset, batch_size=batch_size, shuffle=True, num_workers=0
+                dataset,
+                batch_size=batch_size,
+                shuffle=True,
+                num_workers=0,
+                collate_fn=nn_ensemble_torch.collate_samples if sparse else None,
             )
             # Deterministic eval subset for early stopping
             rng = np.random.default_rng(self.EARLY_STOP_SEED)
             n_samples = len(dataset)
             n_eval = min(self.EARLY_STOP_EVAL_ROWS, n_samples)
-            eval_indices = rng.choice(n_samples, size=n_eval, replace=False)
-            eval_inputs, eval_targets = dataset.get_subset(eval_indices.tolist())
+            eval_indices = rng.choice(n_samples, size=n_eval, replace=False).tolist()
+            if not sparse:
+                eval_inputs, eval_targets = dataset.get_subset(eval_indices)
 
             # Training loop
             optimizer = torch.optim.AdamW(
@@ -383,8 +470,10 @@ class NNEnsembleBackend(backend.AnnifLearningBackend, ensemble.BaseEnsembleBacke
                 weight_decay=0.0,
                 eps=1e-08,
             )
-            criterion = nn.BCEWithLogitsLoss()
-            early_stopping = EarlyStopping(patience=self.EARLY_STOPPING_PATIENCE)
+            criterion = torch.nn.BCEWithLogitsLoss()
+            early_stopping = nn_ensemble_torch.EarlyStopping(
+                patience=self.EARLY_STOPPING_PATIENCE
+            )
 
             for epoch in range(max_epochs):
                 self._model.train()
@@ -392,16 +481,27 @@ class NNEnsembleBackend(backend.AnnifLearningBackend, ensemble.BaseEnsembleBacke
                     dataloader,
                     desc=f"Epoch {epoch + 1}/{max_epochs}",
                 )
-                for inputs, targets in tqdm_loader:
+                for batch in tqdm_loader:
                     optimizer.zero_grad()
-                    outputs = self._model(inputs)
-                    loss = criterion(outputs, targets)
+                    if sparse:
+                        loss = self._model.sparse_loss(batch)
+                    else:
+                        inputs, targets = batch
+                        loss = criterion(self._model(inputs), targets)
                     loss.backward()
                     optimizer.step()
                 # evaluate for early stopping
-                with torch.no_grad():
-                    outputs = self._model(eval_inputs)
-                ndcg = ndcg_batch(outputs, eval_targets.round())
+                if sparse:
+                    ndcg = nn_ensemble_torch.evaluate_sparse(
+                        self._model,
+                        dataset,
+                        eval_indices,
+                        self.EARLY_STOP_EVAL_CHUNK,
+                    )
+                else:
+                    with torch.no_grad():
+                        outputs = self._model(eval_inputs)
+                    ndcg = nn_ensemble_torch.ndcg_batch(outputs, eval_targets.round())
                 self.info(f"Epoch {epoch + 1}/{max_epochs}: NDCG={ndcg:.4f}")
                 if early_stopping(self._model, ndcg, epoch):
                     best = early_stopping.best_epoch + 1
@@ -412,6 +512,10 @@ class NNEnsembleBackend(backend.AnnifLearningBackend, ensemble.BaseEnsembleBacke
             self._model.load_state_dict(early_stopping.best_state)
 
         annif.util.atomic_save(self._model, self.datadir, self.MODEL_FILE)
+        self._predictor = NNEnsemblePredictor.from_arrays(
+            self._model.export_arrays(), self.PRED_SCALE
+        )
+        annif.util.atomic_save(self._predictor, self.datadir, self.ARRAYS_FILE)
 
     def _learn(
         self,
@@ -419,10 +523,13 @@ class NNEnsembleBackend(backend.AnnifLearningBackend, ensemble.BaseEnsembleBacke
         params: dict[str, Any],
     ) -> None:
         self.initialize()
+        if self._model is None:
+            self._model = self._load_model()
         self._fit_model(
             corpus,
             max_epochs=int(params["learn-epochs"]),
             batch_size=int(params["batch-size"]),
             lr=float(params["lr"]),
             lmdb_map_size=int(params["lmdb_map_size"]),
+            sparse=annif.util.boolean(params["sparse-training"]),
         )
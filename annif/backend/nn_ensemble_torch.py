@@ -0,0 +1,292 @@
+"""PyTorch based model and training data handling for the nn_ensemble backend.
+This module is only needed for training; suggestions are computed using the
+exported model arrays without importing PyTorch."""
+
+from __future__ import annotations
+
+import collections
+import copy
+import sys
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import Dataset
+
+from annif.backend.nn_ensemble import (
+    Sample,
+    decode_sample,
+    encode_sample,
+    idx_to_key,
+    key_to_idx,
+)
+
+SparseBatch = collections.namedtuple(
+    "SparseBatch",
+    "batch_size input_batch input_rows input_cols input_values "
+    + "target_batch target_cols target_values",
+)
+
+
+def collate_samples(samples: list[Sample]) -> SparseBatch:
+    """Combine Samples into a SparseBatch of index and value tensors. The
+    input scores and targets are transformed using log1p like in the dense
+    representation."""
+
+    def batch_indices(lengths):
+        return torch.from_numpy(np.repeat(np.arange(len(lengths)), lengths))
+
+    def concat(arrays, dtype):
+        return torch.from_numpy(np.concatenate(arrays).astype(dtype))
+
+    target_cols = concat([s.target_cols for s in samples], np.int64)
+    return SparseBatch(
+        batch_size=len(samples),
+        input_batch=batch_indices([len(s.input_cols) for s in samples]),
+        input_rows=concat([s.input_rows for s in samples], np.int64),
+        input_cols=concat([s.input_cols for s in samples], np.int64),
+        input_values=torch.log1p(concat([s.input_values for s in samples], np.float32)),
+        target_batch=batch_indices([len(s.target_cols) for s in samples]),
+        target_cols=target_cols,
+        target_values=torch.full(
+            (len(target_cols),), np.log1p(1.0), dtype=torch.float32
+        ),
+    )
+
+
+class LMDBDataset(Dataset):
+    """A sequence of samples stored in a LMDB database."""
+
+    def __init__(self, txn, sparse: bool = False):
+        super().__init__()
+        self._txn = txn
+        # in sparse mode, batches are returned as Sample objects
+        self._sparse = sparse
+        cursor = txn.cursor()
+        if cursor.last():
+            # Counter holds the number of samples in the database
+            self._counter = key_to_idx(cursor.key()) + 1
+        else:  # empty database
+            self._counter = 0
+
+    def add_sample(self, inputs: np.ndarray, targets: np.ndarray) -> None:
+        # use zero-padded 8-digit key
+        key = idx_to_key(self._counter)
+        self._counter += 1
+        self._txn.put(key, encode_sample(inputs, targets))
+
+    def add_encoded_samples(self, values: list[bytes]) -> None:
+        """append already encoded samples using a single bulk write"""
+        keys = [idx_to_key(self._counter + idx) for idx in range(len(values))]
+        self._counter += len(values)
+        self._txn.cursor().putmulti(zip(keys, values), append=True)
+
+    @staticmethod
+    def _sample_to_tensors(sample: Sample) -> tuple[torch.Tensor, torch.Tensor]:
+        inputs = np.zeros((sample.n_sources, sample.n_subjects), dtype=np.float32)
+        inputs[sample.input_rows, sample.input_cols] = sample.input_values
+        targets = np.zeros(sample.n_subjects, dtype=np.float32)
+        targets[sample.target_cols] = 1.0
+        return torch.log1p(torch.from_numpy(inputs)), torch.log1p(
+            torch.from_numpy(targets)
+        )
+
+    def get_samples(self, indices: list[int]) -> list[Sample]:
+        """read the samples with the given indices using a single cursor,
+        visiting the keys in sorted order"""
+        keys = [idx_to_key(idx) for idx in indices]
+        values = {
+            bytes(key): value
+            for key, value in self._txn.cursor().getmulti(sorted(set(keys)))
+        }
+        return [decode_sample(values[key]) for key in keys]
+
+    def __getitem__(self, idx: int) -> tuple[torch.Tensor, torch.Tensor]:
+        """get a particular sample"""
+        return self._sample_to_tensors(self.get_samples([idx])[0])
+
+    def __getitems__(
+        self, indices: list[int]
+    ) -> list[tuple[torch.Tensor, torch.Tensor]] | list[Sample]:
+        """get a batch of samples; used by DataLoader to read whole batches at
+        once"""
+        samples = self.get_samples(indices)
+        if self._sparse:
+            return samples
+        return [self._sample_to_tensors(sample) for sample in samples]
+
+    def get_subset(self, indices: list[int]) -> tuple[torch.Tensor, torch.Tensor]:
+        """Fetch a fixed set of samples by index and stack into batch tensors.
+
+        Returns (inputs, targets) where inputs is ``torch.Tensor`` of shape (B, M, N)
+        and targets is ``torch.Tensor`` of shape (B, N).
+        """
+        inputs_list, targets_list = zip(
+            *[self._sample_to_tensors(sample) for sample in self.get_samples(indices)]
+        )
+        inputs = torch.stack(inputs_list, dim=0)
+        targets = torch.stack(targets_list, dim=0)
+        return inputs, targets
+
+    def __len__(self) -> int:
+        """return the number of available samples"""
+        return self._counter
+
+
+class NNEnsembleModel(nn.Module):
+    def __init__(self, n_sources: int, n_subjects: int, source_weights: list[float]):
+        super().__init__()
+        self.model_config = {
+            "n_sources": n_sources,
+            "n_subjects": n_subjects,
+            "source_weights": source_weights,
+        }
+        # per-concept/source weights
+        init_weights = torch.tensor(source_weights, dtype=torch.float32)
+        init_weights = init_weights / init_weights.sum()
+        self.weights = nn.Parameter(
+            init_weights[:, None].expand(-1, n_subjects).contiguous()
+        )
+        # bias decomposition: global + per-label delta
+        self.bias_global = nn.Parameter(torch.tensor(0.0, dtype=torch.float32))
+        self.bias_delta = nn.Parameter(torch.zeros(n_subjects, dtype=torch.float32))
+
+    def forward(self, inputs: torch.Tensor):
+        weighted = inputs * self.weights.unsqueeze(0)
+        return weighted.sum(1) + self.bias_global + self.bias_delta
+
+    def forward_sparse(self, batch: SparseBatch) -> torch.Tensor:
+        """Compute the dense (B, N) output for a SparseBatch without
+        materializing the (B, M, N) input tensor"""
+        bias = self.bias_global + self.bias_delta
+        outputs = bias.expand(batch.batch_size, -1).clone()
+        weighted = self.weights[batch.input_rows, batch.input_cols] * batch.input_values
+        return outputs.index_put(
+            (batch.input_batch, batch.input_cols), weighted, accumulate=True
+        )
+
+    def sparse_loss(self, batch: SparseBatch) -> torch.Tensor:
+        """Compute the mean binary cross-entropy loss over all (document,
+        subject) pairs of a SparseBatch, equal to BCEWithLogitsLoss of the
+        dense forward pass. Only the pairs that have inputs or targets are
+        evaluated explicitly; for the remaining pairs the output only depends
+        on the bias terms, so their loss is computed per subject."""
+        n_subjects = self.bias_delta.shape[0]
+        bias = self.bias_global + self.bias_delta
+        input_keys = batch.input_batch * n_subjects + batch.input_cols
+        target_keys = batch.target_batch * n_subjects + batch.target_cols
+        active_keys, inverse = torch.unique(
+            torch.cat([input_keys, target_keys]), return_inverse=True
+        )
+        active_cols = active_keys % n_subjects
+        n_inputs = len(input_keys)
+
+        weighted = self.weights[batch.input_rows, batch.input_cols] * batch.input_values
+        logits = bias[active_cols].index_add(0, inverse[:n_inputs], weighted)
+        targets = torch.zeros(len(active_keys), dtype=torch.float32)
+        targets[inverse[n_inputs:]] = batch.target_values
+        active_loss = nn.functional.binary_cross_entropy_with_logits(
+            logits, targets, reduction="sum"
+        )
+
+        # with a zero target, the loss of a pair is softplus(output)
+        n_active = torch.bincount(active_cols, minlength=n_subjects)
+        inactive_loss = (
+            (batch.batch_size - n_active) * nn.functional.softplus(bias)
+        ).sum()
+        return (active_loss + inactive_loss) / (batch.batch_size * n_subjects)
+
+    def save(self, filepath):
+        torch.save(
+            {
+                "model_state_dict": self.state_dict(),
+                "model_class": self.__class__.__name__,
+                "model_config": self.model_config,
+                "pytorch_version": str(torch.__version__),
+                "python_version": sys.version,
+            },
+            filepath,
+        )
+
+    @classmethod
+    def load(cls, filepath, map_location="cpu"):
+        checkpoint = torch.load(filepath, map_location=map_location, weights_only=True)
+        config = checkpoint["model_config"]
+        model = cls(**config)
+        model.load_state_dict(checkpoint["model_state_dict"])
+        model.eval()
+        return model
+
+    def export_arrays(self) -> dict[str, np.ndarray]:
+        """Return the model parameters as plain NumPy arrays"""
+        with torch.no_grad():
+            return {
+                "weights": self.weights.numpy().copy(),
+                "bias_global": self.bias_global.numpy().copy(),
+                "bias_delta": self.bias_delta.numpy().copy(),
+            }
+
+
+class EarlyStopping:
+    def __init__(self, patience: int):
+        self._patience = patience
+        self._best_metric = None
+        self._no_improvement_count = 0
+        self._stop_early = False
+        self.best_state = None
+        self.best_epoch = 0
+
+    def __call__(self, model, metric, epoch):
+        if self._best_metric is None or metric > self._best_metric:
+            self._best_metric = metric
+            self._no_improvement_count = 0
+            self.best_state = copy.deepcopy(model.state_dict())
+            self.best_epoch = epoch
+        else:
+            self._no_improvement_count += 1
+            if self._no_improvement_count >= self._patience:
+                self._stop_early = True
+
+        return self._stop_early
+
+
+@torch.no_grad()
+def ndcg_batch(preds: torch.Tensor, targets: torch.Tensor) -> float:
+    """
+    preds:   (B, N) float
+    targets: (B, N) binary {0, 1} relevance labels
+
+    Returns: mean NDCG across the batch (float)
+    """
+    sorted_idx = torch.argsort(preds, dim=1, descending=True)
+    sorted_targets = torch.gather(targets, 1, sorted_idx)
+
+    L = sorted_targets.size(1)
+    ranks = torch.arange(1, L + 1, device=preds.device)
+    discounts = 1.0 / torch.log2(ranks + 1)
+
+    dcg = (sorted_targets * discounts).sum(dim=1)
+
+    ideal_sorted = torch.sort(targets, dim=1, descending=True).values[:, :L]
+    idcg = (ideal_sorted * discounts).sum(dim=1)
+
+    ndcg = dcg / torch.clamp(idcg, min=1e-8)
+
+    return ndcg.mean().item()
+
+
+@torch.no_grad()
+def evaluate_sparse(
+    model: NNEnsembleModel, dataset: LMDBDataset, indices: list[int], chunk_size: int
+) -> float:
+    """Calculate the mean NDCG of the model for the samples with the given
+    indices, processing them in chunks to keep memory usage bounded"""
+    ndcg_sum = 0.0
+    for start in range(0, len(indices), chunk_size):
+        chunk = indices[start : start + chunk_size]
+        batch = collate_samples(dataset.get_samples(chunk))
+        outputs = model.forward_sparse(batch)
+        targets = torch.zeros_like(outputs)
+        targets[batch.target_batch, batch.target_cols] = 1.0
+        ndcg_sum += ndcg_batch(outputs, targets) * len(chunk)
+    return ndcg_sum / len(indices)
@@ -10,13 +10,15 @@ from typing import TYPE_CHECKING, Any
 
 import joblib
 import numpy as np
-from scipy.sparse import coo_matrix, csc_matrix
+import scipy.sparse
+from scipy.sparse import coo_matrix, csc_matrix, csr_array
 from sklearn.isotonic import IsotonicRegression
 
 import annif.corpus
+import annif.parallel
 import annif.util
 from annif.exception import NotInitializedException, NotSupportedException
-from annif.suggestion import SubjectSuggestion, SuggestionBatch
+from annif.suggestion import SuggestionBatch
 
 from . import ensemble
 
@@ -25,6 +27,105 @@ if TYPE_CHECKING:
     from annif.project import AnnifProject
 
 
+class PAVCalibrator:
+    """The concept-specific isotonic regression models of one source,
+    compiled into flat arrays of thresholds and values. The thresholds and
+    values of each concept are stored consecutively, the range for the
+    concept subject_ids[i] being given by offsets[i] and offsets[i + 1]."""
+
+    def __init__(
+        self,
+        subject_ids: np.ndarray,
+        offsets: np.ndarray,
+        thresholds: np.ndarray,
+        values: np.ndarray,
+    ) -> None:
+        self.subject_ids = subject_ids
+        self.offsets = offsets
+        self.thresholds = thresholds
+        self.values = values
+        # Shift the thresholds of each concept into a separate range, so that
+        # all concepts can be interpolated using a single np.interp call
+        if len(thresholds) > 0:
+            self._spacing = thresholds.max() - thresholds.min() + 1.0
+        else:
+            self._spacing = 1.0
+        self._shifted = thresholds + np.repeat(
+            np.arange(len(subject_ids)) * self._spacing, np.diff(offsets)
+        )
+
+    @classmethod
+    def from_regressions(
+        cls, regressions: dict[int, IsotonicRegression]
+    ) -> PAVCalibrator:
+        subject_ids = np.array(sorted(regressions), dtype=np.int32)
+        thresholds = [regressions[sid].X_thresholds_ for sid in subject_ids]
+        values = [regressions[sid].y_thresholds_ for sid in subject_ids]
+        offsets = np.zeros(len(subject_ids) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(thr) for thr in thresholds])
+        return cls(
+            subject_ids,
+            offsets,
+            np.concatenate(thresholds or [np.zeros(0)]).astype(np.float64),
+            np.concatenate(values or [np.zeros(0)]).astype(np.float64),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> PAVCalibrator:
+        data = joblib.load(path)
+        if "thresholds" not in data:
+            # model file containing IsotonicRegression objects
+            return cls.from_regressions(data)
+        return cls(**data)
+
+    def save(self, path: str) -> None:
+        joblib.dump(
+            {
+                "subject_ids": self.subject_ids,
+                "offsets": self.offsets,
+                "thresholds": self.thresholds,
+                "values": self.values,
+            },
+            path,
+        )
+
+    def __len__(self) -> int:
+        return len(self.subject_ids)
+
+    def calibrate(self, array: csr_array) -> csr_array:
+        """Return a copy of a (documents x subjects) score array where the
+        scores of concepts having a model are replaced by the calibrated
+        scores. Scores of other concepts are left as they are."""
+        array = array.copy()
+        if len(self) == 0:
+            return array
+        idx = np.searchsorted(self.subject_ids, array.indices)
+        idx = np.minimum(idx, len(self) - 1)
+        has_model = self.subject_ids[idx] == array.indices
+        idx = idx[has_model]
+        # clip to the range of each concept, like out_of_bounds="clip"
+        scores = np.clip(
+            array.data[has_model],
+            self.thresholds[self.offsets[idx]],
+            self.thresholds[self.offsets[idx + 1] - 1],
+        )
+        array.data[has_model] = np.interp(
+            scores + idx * self._spacing, self._shifted, self.values
+        )
+        array.eliminate_zeros()
+        return array
+
+
+class PAVFitter(annif.parallel.BaseWorker):
+    @classmethod
+    def fit(cls, cid: int) -> tuple[int, IsotonicRegression]:  # pragma: no cover
+        scores, true = cls.args
+        reg = IsotonicRegression(out_of_bounds="clip")
+        cid_scores = scores[:, cid].toarray().flatten().astype(np.float64)
+        reg.fit(cid_scores, true[:, cid].toarray().flatten())
+        return cid, reg
+
+
 class PAVBackend(ensemble.BaseEnsembleBackend):
     """PAV ensemble backend that combines results from multiple projects"""
 
@@ -48,14 +149,14 @@ class PAVBackend(ensemble.BaseEnsembleBackend):
             path = os.path.join(self.datadir, model_filename)
             if os.path.exists(path):
                 self.debug("loading PAV model from {}".format(path))
-                self._models[source_project_id] = joblib.load(path)
+                self._models[source_project_id] = PAVCalibrator.load(path)
             else:
                 raise NotInitializedException(
                     "PAV model file '{}' not found".format(path),
                     backend_id=self.backend_id,
                 )
 
-    def _get_model(self, source_project_id: str) -> dict[int, IsotonicRegression]:
+    def _get_model(self, source_project_id: str) -> PAVCalibrator:
         self.initialize()
         return self._models[source_project_id]
 
@@ -65,59 +166,44 @@ class PAVBackend(ensemble.BaseEnsembleBackend):
         sources: list[tuple[str, float]],
         params: dict[str, Any],
     ) -> SuggestionBatch:
-        reg_batch_by_source = {}
-        for project_id, batch in batch_by_source.items():
-            reg_models = self._get_model(project_id)
-            pav_batch = [
-                [
-                    (
-                        SubjectSuggestion(
-                            subject_id=sugg.subject_id,
-                            score=reg_models[sugg.subject_id].predict([sugg.score])[0],
-                        )
-                        if sugg.subject_id in reg_models
-                        else SubjectSuggestion(
-                            subject_id=sugg.subject_id, score=sugg.score
-                        )
-                    )  # default to raw score
-                    for sugg in result
-                ]
-                for result in batch
-            ]
-            reg_batch_by_source[project_id] = SuggestionBatch.from_sequence(
-                pav_batch, self.project.subjects
+        reg_batch_by_source = {
+            project_id: SuggestionBatch(
+                self._get_model(project_id).calibrate(batch.array)
             )
+            for project_id, batch in batch_by_source.items()
+        }
 
         return super()._merge_source_batches(reg_batch_by_source, sources, params)
 
-    @staticmethod
     def _suggest_train_corpus(
-        source_project: AnnifProject, corpus: DocumentCorpus
+        self, source_project: AnnifProject, corpus: DocumentCorpus, n_jobs: int
     ) -> tuple[csc_matrix, csc_matrix]:
-        # lists for constructing score matrix
-        data, row, col = [], [], []
+        # initialize the source project before forking, to save memory
+        source_project.initialize(parallel=True)
+        psmap = annif.parallel.ProjectSuggestMap(
+            self.project.registry,
+            [source_project.project_id],
+            backend_params=None,
+            limit=None,
+            threshold=0.0,
+        )
+        jobs, pool_class = annif.parallel.get_pool(n_jobs)
+
+        score_arrays = []
         # lists for constructing true label matrix
         trow, tcol = [], []
-
         ndocs = 0
-        for docid, doc in enumerate(corpus.documents):
-            hits = source_project.suggest([doc])[0]
-            vector = hits.as_vector()
-            for cid in np.flatnonzero(vector):
-                data.append(vector[cid])
-                row.append(docid)
-                col.append(cid)
-            for cid in np.flatnonzero(
-                doc.subject_set.as_vector(len(source_project.subjects))
+        with pool_class(jobs) as pool:
+            for hit_sets, subject_sets in pool.imap_unordered(
+                psmap.suggest_batch, corpus.doc_batches
             ):
-                trow.append(docid)
-                tcol.append(cid)
-            ndocs += 1
-        scores = coo_matrix(
-            (data, (row, col)),
-            shape=(ndocs, len(source_project.subjects)),
-            dtype=np.float32,
-        )
+                score_arrays.append(hit_sets[source_project.project_id].array)
+                for subject_set in subject_sets:
+                    tcol.extend(subject_set)
+                    trow.extend([ndocs] * len(subject_set))
+                    ndocs += 1
+
+        scores = scipy.sparse.vstack(score_arrays, format="csc", dtype=np.float32)
         true = coo_matrix(
             (np.ones(len(trow), dtype=bool), (trow, tcol)),
             shape=(ndocs, len(source_project.subjects)),
@@ -126,7 +212,11 @@ class PAVBackend(ensemble.BaseEnsembleBackend):
         return csc_matrix(scores), csc_matrix(true)
 
     def _create_pav_model(
-        self, source_project_id: str, min_docs: int, corpus: DocumentCorpus
+        self,
+        source_project_id: str,
+        min_docs: int,
+        corpus: DocumentCorpus,
+        n_jobs: int,
     ) -> None:
         self.info(
             "creating PAV model for source {}, min_docs={}".format(
@@ -135,20 +225,23 @@ class PAVBackend(ensemble.BaseEnsembleBackend):
         )
         source_project = self.project.registry.get_project(source_project_id)
         # suggest subjects for the training corpus
-        scores, true = self._suggest_train_corpus(source_project, corpus)
-        # create the concept-specific PAV regression models
-        pav_regressions = {}
-        for cid in range(len(source_project.subjects)):
-            if true[:, cid].sum() < min_docs:
-                continue  # don't create model b/c of too few examples
-            reg = IsotonicRegression(out_of_bounds="clip")
-            cid_scores = scores[:, cid].toarray().flatten().astype(np.float64)
-            reg.fit(cid_scores, true[:, cid].toarray().flatten())
-            pav_regressions[cid] = reg
+        scores, true = self._suggest_train_corpus(source_project, corpus, n_jobs)
+        # create the concept-specific PAV regression models, skipping concepts
+        # with too few examples
+        cids = np.flatnonzero(np.asarray(true.sum(axis=0)).flatten() >= min_docs)
+        jobs, pool_class = annif.parallel.get_pool(n_jobs)
+        with pool_class(
+            jobs, initializer=PAVFitter.init, initargs=((scores, true),)
+        ) as pool:
+            pav_regressions = dict(
+                pool.imap_unordered(PAVFitter.fit, cids.tolist(), 10)
+            )
         self.info("created PAV model for {} concepts".format(len(pav_regressions)))
         model_filename = self.MODEL_FILE_PREFIX + source_project_id
         annif.util.atomic_save(
-            pav_regressions, self.datadir, model_filename, method=joblib.dump
+            PAVCalibrator.from_regressions(pav_regressions),
+            self.datadir,
+            model_filename,
         )
 
     def _train(
@@ -169,4 +262,4 @@ class PAVBackend(ensemble.BaseEnsembleBackend):
         sources = annif.util.parse_sources(self.params["sources"])
         min_docs = int(params["min-docs"])
         for source_project_id, _ in sources:
-            self._create_pav_model(source_project_id, min_docs, corpus)
+            self._create_pav_model(source_project_id, min_docs, corpus, jobs)
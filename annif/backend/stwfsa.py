@@ -6,7 +6,7 @@ from typing import TYPE_CHECKING, Any
 from stwfsapy.predictor import StwfsapyPredictor
 
 from annif.exception import NotInitializedException, NotSupportedException
-from annif.suggestion import SubjectSuggestion
+from annif.suggestion import SubjectSuggestion, SuggestionBatch
 from annif.util import atomic_save, boolean
 
 from . import backend
@@ -64,8 +64,15 @@ class StwfsaBackend(backend.AnnifBackend):
     MODEL_FILE = "stwfsa_predictor.zip"
 
     _model = None
+    _uri_index = None
 
     def initialize(self, parallel: bool = False) -> None:
+        if self._uri_index is None:
+            # leave out the subjects excluded from the project
+            self._uri_index = {
+                subject.uri: subject_id
+                for subject_id, subject in self.project.subjects.active
+            }
         if self._model is None:
             path = os.path.join(self.datadir, self.MODEL_FILE)
             self.debug(f"Loading STWFSA model from {path}.")
@@ -125,18 +132,19 @@ class StwfsaBackend(backend.AnnifBackend):
             lambda model, store_path: model.store(store_path),
         )
 
-    def _suggest(
-        self, doc: Document, params: dict[str, Any]
-    ) -> list[SubjectSuggestion]:
-        self.debug(
-            f'Suggesting subjects for text "{doc.text[:20]}..." (len={len(doc.text)})'
+    def _suggest_batch(
+        self, documents: list[Document], params: dict[str, Any]
+    ) -> SuggestionBatch:
+        self.debug(f"Suggesting subjects for a batch of {len(documents)} documents")
+        results = self._model.suggest_proba([doc.text for doc in documents])
+        batch_results = [
+            [
+                SubjectSuggestion(subject_id=self._uri_index[uri], score=score)
+                for uri, score in result
+                if uri in self._uri_index
+            ]
+            for result in results
+        ]
+        return SuggestionBatch.from_sequence(
+            batch_results, self.project.subjects, limit=int(params["limit"])
         )
-        result = self._model.suggest_proba([doc.text])[0]
-        suggestions = []
-        for uri, score in result:
-            subject_id = self.project.subjects.by_uri(uri)
-            if subject_id is not None:
-                suggestions.append(
-                    SubjectSuggestion(subject_id=subject_id, score=score)
-                )
-        return suggestions
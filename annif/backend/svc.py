@@ -2,16 +2,13 @@
 
 from __future__ import annotations
 
-import os.path
 from typing import TYPE_CHECKING, Any
 
-import joblib
 import numpy as np
 import scipy.special
 from sklearn.svm import LinearSVC
 
-import annif.util
-from annif.exception import NotInitializedException, NotSupportedException
+from annif.exception import NotSupportedException
 from annif.suggestion import SubjectSuggestion, SuggestionBatch
 
 from . import backend, mixins
@@ -22,7 +19,11 @@ if TYPE_CHECKING:
     from annif.corpus import Document, DocumentCorpus
 
 
-class SVCBackend(mixins.TfidfVectorizerMixin, backend.AnnifBackend):
+class SVCBackend(
+    mixins.JoblibSerializationMixin,
+    mixins.TfidfVectorizerMixin,
+    backend.AnnifBackend,
+):
     """Support vector classifier backend for Annif"""
 
     name = "svc"
@@ -30,20 +31,13 @@ class SVCBackend(mixins.TfidfVectorizerMixin, backend.AnnifBackend):
     # defaults for uninitialized instances
     _model = None
 
-    MODEL_FILE = "svc-model.gz"
+    MODEL_FILE = "svc-model"
 
-    DEFAULT_PARAMETERS = {"min_df": 1, "ngram": 1}
+    DEFAULT_PARAMETERS = {"min_df": 1, "ngram": 1, "serialization": "compressed"}
 
     def _initialize_model(self) -> None:
         if self._model is None:
-            path = os.path.join(self.datadir, self.MODEL_FILE)
-            self.debug("loading model from {}".format(path))
-            if os.path.exists(path):
-                self._model = joblib.load(path)
-            else:
-                raise NotInitializedException(
-                    "model {} not found".format(path), backend_id=self.backend_id
-                )
+            self._model = self.load_joblib(self.MODEL_FILE, self.params)
 
     def initialize(self, parallel: bool = False) -> None:
         self.initialize_vectorizer()
@@ -66,13 +60,13 @@ class SVCBackend(mixins.TfidfVectorizerMixin, backend.AnnifBackend):
             classes.append(doc.subject_set[0])
         return texts, classes
 
-    def _train_classifier(self, veccorpus: csr_matrix, classes: list[int]) -> None:
+    def _train_classifier(
+        self, veccorpus: csr_matrix, classes: list[int], params: dict[str, Any]
+    ) -> None:
         self.info("creating classifier")
         self._model = LinearSVC(dual="auto")
         self._model.fit(veccorpus, classes)
-        annif.util.atomic_save(
-            self._model, self.datadir, self.MODEL_FILE, method=joblib.dump
-        )
+        self.save_joblib(self._model, self.MODEL_FILE, params)
 
     def _train(
         self, corpus: DocumentCorpus, params: dict[str, Any], jobs: int = 0
@@ -90,7 +84,7 @@ class SVCBackend(mixins.TfidfVectorizerMixin, backend.AnnifBackend):
             "ngram_range": (1, int(params["ngram"])),
         }
         veccorpus = self.create_vectorizer(texts, vecparams)
-        self._train_classifier(veccorpus, classes)
+        self._train_classifier(veccorpus, classes, params)
 
     def _scores_to_suggestions(
         self, scores: np.ndarray, params: dict[str, Any]
@@ -4,8 +4,12 @@
 # https://github.com/NatLibFi/Annif#license.
 from __future__ import annotations
 
+import functools
+import itertools
+import multiprocessing
 import os.path
 import re
+import threading
 from collections import defaultdict
 from typing import TYPE_CHECKING, Any
 
@@ -13,18 +17,54 @@ import joblib
 import yake
 from rdflib.namespace import SKOS
 
+import annif.parallel
 import annif.util
-from annif.exception import ConfigurationException, NotSupportedException
-from annif.suggestion import SubjectSuggestion
+from annif.exception import ConfigurationException, NotInitializedException
+from annif.lexical.util import get_label_table, make_uri_index
+from annif.suggestion import SubjectSuggestion, SuggestionBatch
 
 from . import backend
 
 if TYPE_CHECKING:
+    from multiprocessing.pool import Pool
+
     from rdflib.term import URIRef
 
+    from annif.analyzer import Analyzer
     from annif.corpus import Document, DocumentCorpus
 
 
+def normalize_phrase(phrase: str, analyzer: Analyzer) -> str:
+    return " ".join(analyzer.tokenize_words(phrase, filter=False))
+
+
+def sort_phrase(phrase: str) -> str:
+    words = phrase.split()
+    return " ".join(sorted(words))
+
+
+def normalize_label(label: str, analyzer: Analyzer, remove_parentheses: bool) -> str:
+    label = str(label)
+    if remove_parentheses:
+        label = re.sub(r" \(.*\)", "", label)
+    return sort_phrase(normalize_phrase(label, analyzer))
+
+
+class YakeLabelNormalizer(annif.parallel.BaseWorker):
+    @classmethod
+    def normalize_labels(cls, labels: list[str]) -> list[str]:  # pragma: no cover
+        analyzer, remove_parentheses = cls.args
+        return [
+            normalize_label(label, analyzer, remove_parentheses) for label in labels
+        ]
+
+
+class YakeExtractor(annif.parallel.BaseWorker):
+    @classmethod
+    def extract_keywords(cls, text: str) -> list[tuple[str, float]]:
+        return cls.args.extract_keywords(text)  # pragma: no cover
+
+
 class YakeBackend(backend.AnnifBackend):
     """Yake based backend for Annif"""
 
@@ -33,7 +73,14 @@ class YakeBackend(backend.AnnifBackend):
     # defaults for uninitialized instances
     _index = None
     _graph = None
+    _extractors = None
+    _extract_pools = None
+    _extract_pools_pid = None
+    _extract_pools_lock = threading.Lock()
+    _normalize_keyphrase = None
     INDEX_FILE = "yake-index"
+    KEYPHRASE_CACHE_SIZE = 100000
+    LABEL_CHUNK_SIZE = 1000
 
     DEFAULT_PARAMETERS = {
         "max_ngram_size": 4,
@@ -44,12 +91,9 @@ class YakeBackend(backend.AnnifBackend):
         "features": None,
         "label_types": ["prefLabel", "altLabel"],
         "remove_parentheses": False,
+        "extract_jobs": 1,
     }
 
-    @property
-    def is_trained(self):
-        return True
-
     @property
     def label_types(self) -> list[URIRef]:
         if isinstance(self.params["label_types"], str):  # Label types set by user
@@ -68,90 +112,174 @@ class YakeBackend(backend.AnnifBackend):
 
     def initialize(self, parallel: bool = False) -> None:
         self._initialize_index()
+        if self._extractors is None:
+            self._extractors = {}
+        if self._normalize_keyphrase is None:
+            self._normalize_keyphrase = functools.lru_cache(
+                maxsize=self.KEYPHRASE_CACHE_SIZE
+            )(self._normalize_keyphrase_uncached)
 
     def _initialize_index(self) -> None:
         if self._index is None:
             path = os.path.join(self.datadir, self.INDEX_FILE)
-            if os.path.exists(path):
-                self._index = joblib.load(path)
-                self.debug(f"Loaded index from {path} with {len(self._index)} labels")
-            else:
-                self.info("Creating index")
-                self._index = self._create_index()
-                self._save_index(path)
-                self.info(f"Created index with {len(self._index)} labels")
+            if not os.path.exists(path):
+                raise NotInitializedException(
+                    f"index file {path} not found, the project must be trained",
+                    backend_id=self.backend_id,
+                )
+            self._index = self._resolve_uris(joblib.load(path))
+            self.debug(f"Loaded index from {path} with {len(self._index)} labels")
 
     def _save_index(self, path: str) -> None:
         annif.util.atomic_save(
             self._index, self.datadir, self.INDEX_FILE, method=joblib.dump
         )
 
-    def _create_index(self) -> dict[str, set[str]]:
+    def _resolve_uris(self, index: dict[str, set]) -> dict[str, set[int]]:
+        """Convert an index saved by older versions, where the phrases map to
+        subject URIs, into one mapping the phrases to subject IDs"""
+        if not any(isinstance(value, str) for ids in index.values() for value in ids):
+            return index
+        resolved = {}
+        for phrase, uris in index.items():
+            subject_ids = {self.project.subjects.by_uri(uri) for uri in uris}
+            subject_ids.discard(None)
+            if subject_ids:
+                resolved[phrase] = subject_ids
+        return resolved
+
+    def _create_index(self, n_jobs: int = 1) -> dict[str, set[int]]:
+        uri_index = make_uri_index(self.project.vocab)
+        label_table = get_label_table(
+            self.project.vocab.skos.graph, self.label_types, self.params["language"]
+        )
+        subject_ids, labels = [], []
+        for uri, uri_labels in label_table.items():
+            if uri in uri_index:
+                subject_ids.extend([uri_index[uri]] * len(uri_labels))
+                labels.extend(uri_labels)
+
+        # normalize the labels in chunks using parallel processes
+        chunks = [
+            labels[start : start + self.LABEL_CHUNK_SIZE]
+            for start in range(0, len(labels), self.LABEL_CHUNK_SIZE)
+        ]
+        normalizer_args = (
+            self.project.analyzer,
+            annif.util.boolean(self.params["remove_parentheses"]),
+        )
+        jobs, pool_class = annif.parallel.get_pool(n_jobs)
+        with pool_class(
+            jobs, initializer=YakeLabelNormalizer.init, initargs=(normalizer_args,)
+        ) as pool:
+            normalized = pool.map(YakeLabelNormalizer.normalize_labels, chunks)
+
         index = defaultdict(set)
-        skos_vocab = self.project.vocab.skos
-        for concept in skos_vocab.concepts:
-            uri = str(concept)
-            labels_by_lang = skos_vocab.get_concept_labels(concept, self.label_types)
-            for label in labels_by_lang[self.params["language"]]:
-                label = self._normalize_label(label)
-                index[label].add(uri)
+        for subject_id, label in zip(subject_ids, itertools.chain(*normalized)):
+            index[label].add(subject_id)
         index.pop("", None)  # Remove possible empty string entry
         return dict(index)
 
     def _normalize_label(self, label: str) -> str:
-        label = str(label)
-        if annif.util.boolean(self.params["remove_parentheses"]):
-            label = re.sub(r" \(.*\)", "", label)
-        normalized_label = self._normalize_phrase(label)
-        return self._sort_phrase(normalized_label)
+        return normalize_label(
+            label,
+            self.project.analyzer,
+            annif.util.boolean(self.params["remove_parentheses"]),
+        )
 
     def _normalize_phrase(self, phrase: str) -> str:
-        return " ".join(self.project.analyzer.tokenize_words(phrase, filter=False))
+        return normalize_phrase(phrase, self.project.analyzer)
 
     def _sort_phrase(self, phrase: str) -> str:
-        words = phrase.split()
-        return " ".join(sorted(words))
+        return sort_phrase(phrase)
 
-    def _suggest(
-        self, doc: Document, params: dict[str, Any]
-    ) -> list[SubjectSuggestion]:
-        self.debug(
-            f'Suggesting subjects for text "{doc.text[:20]}..." (len={len(doc.text)})'
-        )
-        limit = int(params["limit"])
+    def _normalize_keyphrase_uncached(self, keyphrase: str) -> str:
+        return self._sort_phrase(self._normalize_phrase(keyphrase))
+
+    def _get_extractor(
+        self, params: dict[str, Any]
+    ) -> tuple[str, yake.KeywordExtractor]:
+        """Return a keyword extractor for the given parameters together with
+        its key, reusing a previously created extractor if possible"""
+        kwargs = {
+            "lan": params["language"],
+            "n": int(params["max_ngram_size"]),
+            "dedupLim": float(params["deduplication_threshold"]),
+            "dedupFunc": params["deduplication_algo"],
+            "windowsSize": int(params["window_size"]),
+            "top": int(params["num_keywords"]),
+            "features": params["features"],
+        }
+        key = repr(kwargs)
+        if key not in self._extractors:
+            self._extractors[key] = yake.KeywordExtractor(**kwargs)
+        return key, self._extractors[key]
 
-        self._kw_extractor = yake.KeywordExtractor(
-            lan=params["language"],
-            n=int(params["max_ngram_size"]),
-            dedupLim=float(params["deduplication_threshold"]),
-            dedupFunc=params["deduplication_algo"],
-            windowsSize=int(params["window_size"]),
-            top=int(params["num_keywords"]),
-            features=self.params["features"],
+    def _get_extract_pool(
+        self, key: str, extractor: yake.KeywordExtractor, n_jobs: int
+    ) -> Pool:
+        """Return a process pool for extracting keywords with the given
+        extractor. The pool is created on first use and terminated together
+        with the backend, so it isn't available in forked processes."""
+        with self._extract_pools_lock:
+            if self._extract_pools is None or self._extract_pools_pid != os.getpid():
+                self._extract_pools = {}
+                self._extract_pools_pid = os.getpid()
+            if (key, n_jobs) not in self._extract_pools:
+                self._extract_pools[(key, n_jobs)] = annif.parallel.get_owned_pool(
+                    self, n_jobs, YakeExtractor.init, (extractor,)
+                )
+            return self._extract_pools[(key, n_jobs)]
+
+    def _extract_keywords(
+        self, texts: list[str], params: dict[str, Any]
+    ) -> list[list[tuple[str, float]]]:
+        key, extractor = self._get_extractor(params)
+        n_jobs = int(params["extract_jobs"])
+        # daemonic processes, e.g. the workers of annif eval -j N, are not
+        # allowed to start processes of their own
+        if (
+            n_jobs > 1
+            and len(texts) > 1
+            and not multiprocessing.current_process().daemon
+        ):
+            pool = self._get_extract_pool(key, extractor, n_jobs)
+            return pool.map(YakeExtractor.extract_keywords, texts)
+        return [extractor.extract_keywords(text) for text in texts]
+
+    def _suggest_batch(
+        self, documents: list[Document], params: dict[str, Any]
+    ) -> SuggestionBatch:
+        self.debug(f"Suggesting subjects for {len(documents)} documents")
+        limit = int(params["limit"])
+        keyphrase_lists = self._extract_keywords(
+            [doc.text for doc in documents], params
+        )
+        return SuggestionBatch.from_sequence(
+            [
+                [
+                    SubjectSuggestion(subject_id=subject_id, score=score)
+                    for subject_id, score in self._keyphrases2suggestions(keyphrases)[
+                        :limit
+                    ]
+                ]
+                for keyphrases in keyphrase_lists
+            ],
+            self.project.subjects,
         )
-        keyphrases = self._kw_extractor.extract_keywords(doc.text)
-        suggestions = self._keyphrases2suggestions(keyphrases)
-
-        subject_suggestions = [
-            SubjectSuggestion(subject_id=self.project.subjects.by_uri(uri), score=score)
-            for uri, score in suggestions[:limit]
-            if score > 0.0
-            if (self.project.subjects.by_uri(uri)) is not None
-        ]
-        return subject_suggestions
 
     def _keyphrases2suggestions(
         self, keyphrases: list[tuple[str, float]]
-    ) -> list[tuple[str, float]]:
+    ) -> list[tuple[int, float]]:
         suggestions = []
         not_matched = []
         for kp, score in keyphrases:
-            uris = self._keyphrase2uris(kp)
-            for uri in uris:
-                suggestions.append((uri, self._transform_score(score)))
-            if not uris:
+            subject_ids = self._keyphrase2subjects(kp)
+            for subject_id in subject_ids:
+                suggestions.append((subject_id, self._transform_score(score)))
+            if not subject_ids:
                 not_matched.append((kp, self._transform_score(score)))
-        # Remove duplicate uris, conflating the scores
+        # Remove duplicate subjects, conflating the scores
         suggestions = self._combine_suggestions(suggestions)
         self.debug(
             "Keyphrases not matched:\n"
@@ -164,25 +292,25 @@ class YakeBackend(backend.AnnifBackend):
         )
         return suggestions
 
-    def _keyphrase2uris(self, keyphrase: str) -> set[str]:
-        keyphrase = self._normalize_phrase(keyphrase)
-        keyphrase = self._sort_phrase(keyphrase)
-        return self._index.get(keyphrase, [])
+    def _keyphrase2subjects(self, keyphrase: str) -> set[int]:
+        return self._index.get(self._normalize_keyphrase(keyphrase), set())
 
     def _transform_score(self, score: float) -> float:
         score = max(score, 0)
         return 1.0 / (score + 1)
 
     def _combine_suggestions(
-        self, suggestions: list[tuple[str, float]]
-    ) -> list[tuple[str, float]]:
+        self, suggestions: list[tuple[int, float]]
+    ) -> list[tuple[int, float]]:
         combined_suggestions = {}
-        for uri, score in suggestions:
-            if uri not in combined_suggestions:
-                combined_suggestions[uri] = score
+        for subject_id, score in suggestions:
+            if subject_id not in combined_suggestions:
+                combined_suggestions[subject_id] = score
             else:
-                old_score = combined_suggestions[uri]
-                combined_suggestions[uri] = self._combine_scores(score, old_score)
+                old_score = combined_suggestions[subject_id]
+                combined_suggestions[subject_id] = self._combine_scores(
+                    score, old_score
+                )
         return list(combined_suggestions.items())
 
     def _combine_scores(self, score1: float, score2: float) -> float:
@@ -193,4 +321,8 @@ class YakeBackend(backend.AnnifBackend):
         return (confl - 0.5) * 2
 
     def _train(self, corpus: DocumentCorpus, params: dict[str, Any], jobs: int = 0):
-        raise NotSupportedException("Training yake backend is not possible.")
+        # the documents are not used, training only builds the label index
+        self.info("Creating index")
+        self._index = self._create_index(jobs)
+        self._save_index(os.path.join(self.datadir, self.INDEX_FILE))
+        self.info(f"Created index with {len(self._index)} labels")
@@ -13,6 +13,7 @@ import click_log
 from flask.cli import FlaskGroup
 
 import annif
+import annif.backend
 import annif.parallel
 import annif.project
 import annif.registry
@@ -442,6 +443,12 @@ def run_index(
 @click.option(
     "--jobs", "-j", default=1, help="Number of parallel jobs (0 means all CPUs)"
 )
+@click.option(
+    "--incremental/--no-incremental",
+    default=False,
+    help="""Accumulate only running sums and per subject counts instead of
+    keeping all suggestions in memory""",
+)
 @cli_util.docs_limit_option
 @cli_util.backend_param_option
 @cli_util.common_options
@@ -455,6 +462,7 @@ def run_eval(
     metrics_file,
     results_file,
     jobs,
+    incremental,
     backend_param,
 ):
     """
@@ -469,6 +477,11 @@ def run_eval(
     Normally the output is the list of the metrics calculated across documents.
     If ``--results-file <FILENAME>`` option is given, the metrics are
     calculated separately for each subject, and written to the given file.
+
+    With ``--incremental`` the memory use doesn't grow with the number of
+    documents, as the metrics are computed from running sums and per
+    subject counts instead of the full set of suggestions. The results are
+    the same apart from floating point rounding.
     """
 
     project = cli_util.get_project(project_id)
@@ -476,7 +489,10 @@ def run_eval(
 
     import annif.eval
 
-    eval_batch = annif.eval.EvaluationBatch(project.subjects)
+    if incremental:
+        eval_batch = annif.eval.IncrementalEvaluationBatch(project.subjects)
+    else:
+        eval_batch = annif.eval.EvaluationBatch(project.subjects)
 
     if results_file:
         try:
@@ -516,6 +532,15 @@ def run_eval(
         elif isinstance(score, float):
             fmt_spec = ".04f"
         click.echo(template.format(metric + ":", score, fmt_spec=fmt_spec))
+    # cascade ensembles report how many calls to expensive sources were
+    # skipped; the counts are only available when suggesting in this process
+    skipped_source_calls = getattr(project.backend, "skipped_source_calls", None)
+    if skipped_source_calls and skipped_source_calls() is not None:
+        click.echo(
+            template.format(
+                "Expensive source calls saved:", skipped_source_calls(), fmt_spec=".04f"
+            )
+        )
     if metrics_file:
         json.dump(
             {metric_code(mname): val for mname, val in metrics.items()},
@@ -549,10 +574,24 @@ OPTIMIZE_METRICS = ["Precision (doc avg)", "Recall (doc avg)", "F1 score (doc av
 @click.option(
     "--jobs", "-j", default=1, help="Number of parallel jobs (0 means all CPUs)"
 )
+@click.option(
+    "--max-limit",
+    default=FILTER_BATCH_MAX_LIMIT,
+    type=click.IntRange(min=1),
+    help="Maximum limit to test",
+)
+@click.option(
+    "--threshold-step",
+    default=0.05,
+    type=click.FloatRange(min=0.01, max=1.0),
+    help="Interval between the tested thresholds",
+)
 @cli_util.docs_limit_option
 @cli_util.backend_param_option
 @cli_util.common_options
-def run_optimize(project_id, paths, jobs, docs_limit, backend_param):
+def run_optimize(
+    project_id, paths, jobs, max_limit, threshold_step, docs_limit, backend_param
+):
     """
     Suggest subjects for documents, testing multiple limits and thresholds.
     \f
@@ -562,10 +601,15 @@ def run_optimize(project_id, paths, jobs, docs_limit, backend_param):
     documents. The output is a list of parameter combinations and their scores.
     From the output, you can determine the optimum limit and threshold
     parameters depending on which measure you want to target.
+
+    All limits from 1 to ``--max-limit`` are combined with thresholds from 0
+    up to 1 at intervals of ``--threshold-step``. The suggestions are
+    computed only once and all the combinations are evaluated in a single
+    pass over them.
     """
     project = cli_util.get_project(project_id)
     backend_params = cli_util.parse_backend_params(backend_param, project)
-    filter_params = cli_util.generate_filter_params(FILTER_BATCH_MAX_LIMIT)
+    filter_params = cli_util.generate_filter_params(max_limit, threshold_step)
 
     import annif.eval
 
@@ -580,24 +624,27 @@ def run_optimize(project_id, paths, jobs, docs_limit, backend_param):
         project.registry,
         [project_id],
         backend_params,
-        limit=FILTER_BATCH_MAX_LIMIT,
+        limit=max_limit,
         threshold=0.0,
     )
 
-    ndocs = 0
-    suggestion_batches = []
-    subject_set_batches = []
+    suggestion_arrays = []
+    subject_sets = []
     with pool_class(jobs) as pool:
-        for suggestion_batch, subject_sets in pool.imap_unordered(
+        for suggestion_batch, subject_set_batch in pool.imap_unordered(
             psmap.suggest_batch, corpus.doc_batches
         ):
-            ndocs += len(suggestion_batch[project_id])
-            suggestion_batches.append(suggestion_batch[project_id])
-            subject_set_batches.append(subject_sets)
+            suggestion_arrays.append(suggestion_batch[project_id].array)
+            subject_sets.extend(subject_set_batch)
+    if not suggestion_arrays:
+        raise NotSupportedException("cannot evaluate empty corpus")
+    ndocs = len(subject_sets)
 
-    from annif.suggestion import SuggestionResults
+    import scipy.sparse
 
-    orig_suggestion_results = SuggestionResults(suggestion_batches)
+    y_pred = scipy.sparse.csr_array(scipy.sparse.vstack(suggestion_arrays))
+    y_true = annif.eval.subject_sets_to_array(subject_sets, len(project.subjects))
+    all_results = annif.eval.evaluate_filter_params(y_true, y_pred, filter_params)
 
     click.echo("\t".join(("Limit", "Thresh.", "Prec.", "Rec.", "F1")))
 
@@ -605,14 +652,8 @@ def run_optimize(project_id, paths, jobs, docs_limit, backend_param):
     best_params = {}
 
     template = "{:d}\t{:.02f}\t{:.04f}\t{:.04f}\t{:.04f}"
-    import annif.eval
 
-    for limit, threshold in filter_params:
-        eval_batch = annif.eval.EvaluationBatch(project.subjects)
-        filtered_results = orig_suggestion_results.filter(limit, threshold)
-        for batch, subject_sets in zip(filtered_results.batches, subject_set_batches):
-            eval_batch.evaluate_many(batch, subject_sets)
-        results = eval_batch.results(metrics=OPTIMIZE_METRICS)
+    for (limit, threshold), results in all_results.items():
         for metric, score in results.items():
             if score >= best_scores[metric]:
                 best_scores[metric] = score
@@ -658,9 +699,18 @@ def run_optimize(project_id, paths, jobs, docs_limit, backend_param):
     help="""Specify file path to write trial results as TSV.
     File directory must exist, existing file will be overwritten.""",
 )
+@click.option(
+    "--pruner",
+    type=click.Choice(list(annif.backend.HYPEROPT_PRUNERS)),
+    default="none",
+    help="""Pruner for stopping unpromising trials early, after evaluating
+    a part of the documents (default: none)""",
+)
 @cli_util.docs_limit_option
 @cli_util.common_options
-def run_hyperopt(project_id, paths, docs_limit, trials, jobs, metric, results_file):
+def run_hyperopt(
+    project_id, paths, docs_limit, trials, jobs, metric, results_file, pruner
+):
     """
     Optimize the hyperparameters of a project using validation documents from
     ``PATHS``. Not supported by all backends. Output is a list of trial results
@@ -671,7 +721,7 @@ def run_hyperopt(project_id, paths, docs_limit, trials, jobs, metric, results_fi
         paths, proj.subjects, proj.vocab_lang, docs_limit
     )
     click.echo(f"Looking for optimal hyperparameters using {trials} trials")
-    rec = proj.hyperopt(documents, trials, jobs, metric, results_file)
+    rec = proj.hyperopt(documents, trials, jobs, metric, results_file, pruner)
     click.echo(f"Got best {metric} score {rec.score:.4f} with:")
     click.echo("---")
     for line in rec.lines:
@@ -5,6 +5,7 @@ from __future__ import annotations
 import collections
 import gzip
 import itertools
+import math
 import os
 import re
 import sys
@@ -275,9 +276,13 @@ def parse_metadata(metadata: tuple[str, ...] | tuple[()]) -> dict[str, str]:
     return metadata_dict
 
 
-def generate_filter_params(filter_batch_max_limit: int) -> list[tuple[int, float]]:
+def generate_filter_params(
+    filter_batch_max_limit: int, threshold_step: float = 0.05
+) -> list[tuple[int, float]]:
     limits = range(1, filter_batch_max_limit + 1)
-    thresholds = [i * 0.05 for i in range(20)]
+    # all multiples of the step below 1, tolerating rounding errors in 1/step
+    n_thresholds = math.floor(1 / threshold_step - 1e-9) + 1
+    thresholds = [i * threshold_step for i in range(n_thresholds)]
     return list(itertools.product(limits, thresholds))
 
 
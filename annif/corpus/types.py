@@ -158,6 +158,13 @@ class SubjectSet:
 
         return destination
 
+    def as_array(self) -> np.ndarray:
+        """Return the subject IDs as a one-dimensional NumPy integer array"""
+
+        import numpy as np
+
+        return np.array(self._subject_ids, dtype=np.int32)
+
     def as_list(
         self, subject_index: SubjectIndex, language: str
     ) -> list[dict[str:str]]:
@@ -7,6 +7,7 @@ from typing import TYPE_CHECKING
 
 import numpy as np
 import scipy.sparse
+from scipy.sparse import csr_array
 from sklearn.metrics import f1_score, precision_score, recall_score
 
 from annif.exception import NotSupportedException
@@ -17,7 +18,6 @@ if TYPE_CHECKING:
     from io import TextIOWrapper
 
     from click.utils import LazyFile
-    from scipy.sparse._arrays import csr_array
 
     from annif.corpus.subject import SubjectIndex, SubjectSet
     from annif.suggestion import SubjectSuggestion
@@ -41,37 +41,178 @@ def false_negatives(y_true: csr_array, y_pred: csr_array) -> int:
     return int((y_true > y_pred).sum())
 
 
+def _ranked_entries(
+    y_pred: csr_array, limit: int | None = None
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """return the row and column indices and the (zero-based) ranks of the
+    top nonzero entries of each row of y_pred, in order of decreasing score
+    within each row. Tied entries are ranked in reverse order of storage,
+    like the reversed ascending argsort of a single row."""
+
+    y_pred = csr_array(y_pred)
+    rows = np.repeat(np.arange(y_pred.shape[0]), np.diff(y_pred.indptr))
+    nonzero = y_pred.data != 0
+    rows, cols, data = rows[nonzero], y_pred.indices[nonzero], y_pred.data[nonzero]
+
+    order = np.lexsort((-np.arange(len(data)), -data.astype(np.float64), rows))
+    rows, cols = rows[order], cols[order]
+    row_start = np.searchsorted(rows, np.arange(y_pred.shape[0]))
+    ranks = np.arange(len(rows)) - row_start[rows]
+    if limit is not None:
+        top = ranks < limit
+        rows, cols, ranks = rows[top], cols[top], ranks[top]
+    return rows, cols, ranks
+
+
+def _dcg_per_row(
+    y_true: csr_array, y_pred: csr_array, limit: int | None = None
+) -> np.ndarray:
+    """return the discounted cumulative gain (DCG) score of each row"""
+
+    rows, cols, ranks = _ranked_entries(y_pred, limit)
+    n_ranked = np.bincount(rows, minlength=y_pred.shape[0])
+    discount = np.log2(np.arange(1, n_ranked.max(initial=0) + 1) + 1)
+    gains = csr_array(y_true)[rows, cols] if len(rows) else np.zeros(0)
+    terms = np.asarray(gains) / discount[ranks]
+
+    # sum the terms of rows with the same number of ranked entries together,
+    # so that the floating point summation order matches a sum over each row
+    dcg = np.zeros(y_pred.shape[0], dtype=np.float64)
+    starts = np.concatenate(([0], np.cumsum(n_ranked)[:-1]))
+    for n_terms in np.unique(n_ranked[n_ranked > 0]):
+        selected = np.flatnonzero(n_ranked == n_terms)
+        positions = starts[selected, np.newaxis] + np.arange(n_terms)
+        dcg[selected] = terms[positions].sum(axis=1)
+    return dcg
+
+
 def dcg_score(
     y_true: csr_array, y_pred: csr_array, limit: int | None = None
 ) -> np.float64:
     """return the discounted cumulative gain (DCG) score for the selected
     labels vs. relevant labels"""
 
-    n_pred = y_pred.count_nonzero()
-    if limit is not None:
-        n_pred = min(limit, n_pred)
+    return _dcg_per_row(y_true, y_pred, limit).sum()
+
 
-    top_k = y_pred.data.argsort()[-n_pred:][::-1]
-    order = y_pred.indices[top_k]
-    gain = y_true[:, order]
-    discount = np.log2(np.arange(1, n_pred + 1) + 1)
-    return (gain / discount).sum()
+def _ndcg_per_row(
+    y_true: csr_array, y_pred: csr_array, limit: int | None = None
+) -> np.ndarray:
+    """return the normalized discounted cumulative gain (nDCG) score of each
+    row"""
+
+    idcg = _dcg_per_row(y_true, y_true, limit)
+    dcg = _dcg_per_row(y_true, y_pred, limit)
+    scores = np.ones(y_true.shape[0], dtype=np.float32)
+    relevant = idcg > 0
+    scores[relevant] = dcg[relevant] / idcg[relevant]
+    return scores
 
 
 def ndcg_score(y_true: csr_array, y_pred: csr_array, limit: int | None = None) -> float:
     """return the normalized discounted cumulative gain (nDCG) score for the
     selected labels vs. relevant labels"""
 
-    scores = np.ones(y_true.shape[0], dtype=np.float32)
-    for i in range(y_true.shape[0]):
-        true = y_true[[i]]
-        idcg = dcg_score(true, true, limit)
-        if idcg > 0:
-            pred = y_pred[[i]]
-            dcg = dcg_score(true, pred, limit)
-            scores[i] = dcg / idcg
+    return float(_ndcg_per_row(y_true, y_pred, limit).mean())
 
-    return float(scores.mean())
+
+def subject_sets_to_array(
+    subject_sets: Sequence[SubjectSet], n_subjects: int
+) -> csr_array:
+    """convert a sequence of subject sets into a boolean (documents x
+    subjects) array in CSR format"""
+
+    lengths = np.fromiter(
+        (len(subject_set) for subject_set in subject_sets), dtype=np.int64
+    )
+    indptr = np.concatenate(([0], np.cumsum(lengths)))
+    if indptr[-1] > 0:
+        indices = np.concatenate(
+            [subject_set.as_array() for subject_set in subject_sets]
+        )
+    else:
+        indices = np.zeros(0, dtype=np.int32)
+    array = csr_array(
+        (np.ones(len(indices), dtype=bool), indices, indptr),
+        shape=(len(subject_sets), n_subjects),
+    )
+    array.sort_indices()
+    return array
+
+
+def evaluate_samples(
+    y_true: csr_array,
+    y_pred: csr_array,
+    metrics: Iterable[str] = [],
+) -> dict[str, float]:
+    """evaluate the predicted scores (documents x subjects) against the gold
+    standard using the given metrics, or all available metrics if none are
+    given"""
+
+    y_pred_binary = y_pred > 0.0
+
+    # define the available metrics as lazy lambda functions
+    # so we can execute only the ones actually requested
+    all_metrics = {
+        "Precision (doc avg)": lambda: precision_score(
+            y_true, y_pred_binary, average="samples"
+        ),
+        "Recall (doc avg)": lambda: recall_score(
+            y_true, y_pred_binary, average="samples"
+        ),
+        "F1 score (doc avg)": lambda: f1_score(
+            y_true, y_pred_binary, average="samples"
+        ),
+        "Precision (subj avg)": lambda: precision_score(
+            y_true, y_pred_binary, average="macro"
+        ),
+        "Recall (subj avg)": lambda: recall_score(
+            y_true, y_pred_binary, average="macro"
+        ),
+        "F1 score (subj avg)": lambda: f1_score(y_true, y_pred_binary, average="macro"),
+        "Precision (weighted subj avg)": lambda: precision_score(
+            y_true, y_pred_binary, average="weighted"
+        ),
+        "Recall (weighted subj avg)": lambda: recall_score(
+            y_true, y_pred_binary, average="weighted"
+        ),
+        "F1 score (weighted subj avg)": lambda: f1_score(
+            y_true, y_pred_binary, average="weighted"
+        ),
+        "Precision (microavg)": lambda: precision_score(
+            y_true, y_pred_binary, average="micro"
+        ),
+        "Recall (microavg)": lambda: recall_score(
+            y_true, y_pred_binary, average="micro"
+        ),
+        "F1 score (microavg)": lambda: f1_score(y_true, y_pred_binary, average="micro"),
+        "F1@5": lambda: f1_score(
+            y_true, filter_suggestion(y_pred, 5) > 0.0, average="samples"
+        ),
+        "NDCG": lambda: ndcg_score(y_true, y_pred),
+        "NDCG@5": lambda: ndcg_score(y_true, y_pred, limit=5),
+        "NDCG@10": lambda: ndcg_score(y_true, y_pred, limit=10),
+        "Precision@1": lambda: precision_score(
+            y_true, filter_suggestion(y_pred, 1) > 0.0, average="samples"
+        ),
+        "Precision@3": lambda: precision_score(
+            y_true, filter_suggestion(y_pred, 3) > 0.0, average="samples"
+        ),
+        "Precision@5": lambda: precision_score(
+            y_true, filter_suggestion(y_pred, 5) > 0.0, average="samples"
+        ),
+        "True positives": lambda: true_positives(y_true, y_pred_binary),
+        "False positives": lambda: false_positives(y_true, y_pred_binary),
+        "False negatives": lambda: false_negatives(y_true, y_pred_binary),
+    }
+
+    if not metrics:
+        metrics = all_metrics.keys()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+
+        return {metric: all_metrics[metric]() for metric in metrics}
 
 
 class EvaluationBatch:
@@ -98,89 +239,9 @@ class EvaluationBatch:
             )
         self._suggestion_arrays.append(suggestion_batch.array)
 
-        # convert gold_subject_batch to sparse matrix
-        ar = scipy.sparse.dok_array(
-            (len(gold_subject_batch), len(self._subject_index)), dtype=bool
+        self._gold_subject_arrays.append(
+            subject_sets_to_array(gold_subject_batch, len(self._subject_index))
         )
-        for idx, subject_set in enumerate(gold_subject_batch):
-            for subject_id in subject_set:
-                ar[idx, subject_id] = True
-        self._gold_subject_arrays.append(ar.tocsr())
-
-    def _evaluate_samples(
-        self,
-        y_true: csr_array,
-        y_pred: csr_array,
-        metrics: Iterable[str] = [],
-    ) -> dict[str, float]:
-        y_pred_binary = y_pred > 0.0
-
-        # define the available metrics as lazy lambda functions
-        # so we can execute only the ones actually requested
-        all_metrics = {
-            "Precision (doc avg)": lambda: precision_score(
-                y_true, y_pred_binary, average="samples"
-            ),
-            "Recall (doc avg)": lambda: recall_score(
-                y_true, y_pred_binary, average="samples"
-            ),
-            "F1 score (doc avg)": lambda: f1_score(
-                y_true, y_pred_binary, average="samples"
-            ),
-            "Precision (subj avg)": lambda: precision_score(
-                y_true, y_pred_binary, average="macro"
-            ),
-            "Recall (subj avg)": lambda: recall_score(
-                y_true, y_pred_binary, average="macro"
-            ),
-            "F1 score (subj avg)": lambda: f1_score(
-                y_true, y_pred_binary, average="macro"
-            ),
-            "Precision (weighted subj avg)": lambda: precision_score(
-                y_true, y_pred_binary, average="weighted"
-            ),
-            "Recall (weighted subj avg)": lambda: recall_score(
-                y_true, y_pred_binary, average="weighted"
-            ),
-            "F1 score (weighted subj avg)": lambda: f1_score(
-                y_true, y_pred_binary, average="weighted"
-            ),
-            "Precision (microavg)": lambda: precision_score(
-                y_true, y_pred_binary, average="micro"
-            ),
-            "Recall (microavg)": lambda: recall_score(
-                y_true, y_pred_binary, average="micro"
-            ),
-            "F1 score (microavg)": lambda: f1_score(
-                y_true, y_pred_binary, average="micro"
-            ),
-            "F1@5": lambda: f1_score(
-                y_true, filter_suggestion(y_pred, 5) > 0.0, average="samples"
-            ),
-            "NDCG": lambda: ndcg_score(y_true, y_pred),
-            "NDCG@5": lambda: ndcg_score(y_true, y_pred, limit=5),
-            "NDCG@10": lambda: ndcg_score(y_true, y_pred, limit=10),
-            "Precision@1": lambda: precision_score(
-                y_true, filter_suggestion(y_pred, 1) > 0.0, average="samples"
-            ),
-            "Precision@3": lambda: precision_score(
-                y_true, filter_suggestion(y_pred, 3) > 0.0, average="samples"
-            ),
-            "Precision@5": lambda: precision_score(
-                y_true, filter_suggestion(y_pred, 5) > 0.0, average="samples"
-            ),
-            "True positives": lambda: true_positives(y_true, y_pred_binary),
-            "False positives": lambda: false_positives(y_true, y_pred_binary),
-            "False negatives": lambda: false_negatives(y_true, y_pred_binary),
-        }
-
-        if not metrics:
-            metrics = all_metrics.keys()
-
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-
-            return {metric: all_metrics[metric]() for metric in metrics}
 
     def _result_per_subject_header(
         self, results_file: LazyFile | TextIOWrapper
@@ -224,7 +285,18 @@ class EvaluationBatch:
         true_pos = y_true.multiply(y_pred).sum(axis=1)
         false_pos = (y_true < y_pred).sum(axis=1)
         false_neg = (y_true > y_pred).sum(axis=1)
+        self._output_counts_per_subject(
+            true_pos, false_pos, false_neg, results_file, language
+        )
 
+    def _output_counts_per_subject(
+        self,
+        true_pos: np.ndarray,
+        false_pos: np.ndarray,
+        false_neg: np.ndarray,
+        results_file: TextIOWrapper | LazyFile,
+        language: str,
+    ) -> None:
         with np.errstate(invalid="ignore"):
             precision = np.nan_to_num(true_pos / (true_pos + false_pos))
             recall = np.nan_to_num(true_pos / (true_pos + false_neg))
@@ -233,7 +305,7 @@ class EvaluationBatch:
         zipped = zip(
             [subj.uri for subj in self._subject_index],  # URI
             [subj.labels[language] for subj in self._subject_index],  # Label
-            y_true.sum(axis=1),  # Support
+            true_pos + false_neg,  # Support
             true_pos,  # True positives
             false_pos,  # False positives
             false_neg,  # False negatives
@@ -261,9 +333,223 @@ class EvaluationBatch:
         y_pred = scipy.sparse.csr_array(scipy.sparse.vstack(self._suggestion_arrays))
         y_true = scipy.sparse.csr_array(scipy.sparse.vstack(self._gold_subject_arrays))
 
-        results = self._evaluate_samples(y_true, y_pred, metrics)
+        results = evaluate_samples(y_true, y_pred, metrics)
         results["Documents evaluated"] = int(y_true.shape[0])
 
         if results_file:
             self.output_result_per_subject(y_true, y_pred, results_file, language)
         return results
+
+
+def _prf_from_counts(
+    true_pos: np.ndarray, n_true: np.ndarray, n_pred: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """return the precision, recall and F1 score of each document given the
+    numbers of true positives, gold standard subjects and predicted subjects,
+    with the zero division conventions of sklearn"""
+
+    true_pos = np.asarray(true_pos, dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        precision = np.nan_to_num(true_pos / n_pred)
+        recall = np.nan_to_num(true_pos / n_true)
+        f1 = np.nan_to_num(2 * true_pos / (n_true + n_pred))
+    return precision, recall, f1
+
+
+def _sample_prf(
+    y_true: csr_array, y_pred: csr_array
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """return the precision, recall and F1 score of each row of a binary
+    prediction array, with the zero division conventions of sklearn"""
+
+    return _prf_from_counts(
+        y_true.multiply(y_pred).sum(axis=1),
+        np.asarray(y_true.sum(axis=1), dtype=np.float64),
+        np.asarray(y_pred.sum(axis=1), dtype=np.float64),
+    )
+
+
+def evaluate_filter_params(
+    y_true: csr_array,
+    y_pred: csr_array,
+    filter_params: Sequence[tuple[int, float]],
+) -> dict[tuple[int, float], dict[str, float]]:
+    """evaluate the predicted scores against the gold standard with each of
+    the given (limit, threshold) filtering settings, as if the scores were
+    filtered using filter_suggestion. Return the document averaged
+    precision, recall and F1 score of each setting.
+
+    The entries of each row are ranked only once. The number of subjects
+    kept by a setting is the number of entries above the threshold capped by
+    the limit, and the true positives among them are looked up from the
+    cumulative number of correct subjects by rank."""
+
+    n_docs = y_true.shape[0]
+    if n_docs == 0:
+        raise NotSupportedException("cannot evaluate empty corpus")
+
+    y_pred = csr_array(y_pred, copy=True)
+    y_pred.sum_duplicates()
+    rows = np.repeat(np.arange(n_docs), np.diff(y_pred.indptr))
+    # rank the entries the same way as filter_suggestion; nonpositive scores
+    # are ranked last and don't count as suggested subjects
+    order = np.lexsort((-y_pred.data, rows))
+    positive = y_pred.data[order] > 0.0
+    rows, cols = rows[order][positive], y_pred.indices[order][positive]
+    scores = y_pred.data[order][positive]
+
+    row_start = np.searchsorted(rows, np.arange(n_docs))
+    hits = np.asarray(csr_array(y_true)[rows, cols]) if len(rows) else np.zeros(0)
+    cumulative_hits = np.concatenate(([0], np.cumsum(hits, dtype=np.int64)))
+    n_true = np.asarray(y_true.sum(axis=1), dtype=np.float64)
+
+    above_threshold = {
+        threshold: np.bincount(rows[scores >= threshold], minlength=n_docs)
+        for threshold in {threshold for _, threshold in filter_params}
+    }
+
+    results = {}
+    for limit, threshold in filter_params:
+        n_pred = np.minimum(above_threshold[threshold], limit)
+        true_pos = cumulative_hits[row_start + n_pred] - cumulative_hits[row_start]
+        precision, recall, f1 = _prf_from_counts(true_pos, n_true, n_pred)
+        results[(limit, threshold)] = {
+            "Precision (doc avg)": float(precision.mean()),
+            "Recall (doc avg)": float(recall.mean()),
+            "F1 score (doc avg)": float(f1.mean()),
+        }
+    return results
+
+
+class IncrementalEvaluationBatch(EvaluationBatch):
+    """An EvaluationBatch that doesn't retain the suggestions and the gold
+    standard of the evaluated documents. Instead it keeps running sums of the
+    document level scores and per subject counts of true positives, false
+    positives and false negatives, so that memory use doesn't depend on the
+    number of documents. The results are the same as with EvaluationBatch,
+    apart from floating point rounding differences."""
+
+    # metrics that are averages of per-document scores
+    DOC_METRICS = [
+        "Precision (doc avg)",
+        "Recall (doc avg)",
+        "F1 score (doc avg)",
+        "F1@5",
+        "NDCG",
+        "NDCG@5",
+        "NDCG@10",
+        "Precision@1",
+        "Precision@3",
+        "Precision@5",
+    ]
+
+    def __init__(self, subject_index: SubjectIndex) -> None:
+        super().__init__(subject_index)
+        self._n_docs = 0
+        self._doc_sums = dict.fromkeys(self.DOC_METRICS, 0.0)
+        self._true_pos = np.zeros(len(subject_index), dtype=np.int64)
+        self._false_pos = np.zeros(len(subject_index), dtype=np.int64)
+        self._false_neg = np.zeros(len(subject_index), dtype=np.int64)
+
+    def evaluate_many(
+        self,
+        suggestion_batch: (
+            list[list[SubjectSuggestion]] | SuggestionBatch | list[Iterator]
+        ),
+        gold_subject_batch: Sequence[SubjectSet],
+    ) -> None:
+        if not isinstance(suggestion_batch, SuggestionBatch):
+            suggestion_batch = SuggestionBatch.from_sequence(
+                suggestion_batch, self._subject_index
+            )
+        y_pred = suggestion_batch.array
+        y_true = subject_sets_to_array(gold_subject_batch, len(self._subject_index))
+        y_pred_binary = y_pred > 0.0
+
+        precision, recall, f1 = _sample_prf(y_true, y_pred_binary)
+        doc_scores = {
+            "Precision (doc avg)": precision,
+            "Recall (doc avg)": recall,
+            "F1 score (doc avg)": f1,
+            "F1@5": _sample_prf(y_true, filter_suggestion(y_pred, 5) > 0.0)[2],
+            "NDCG": _ndcg_per_row(y_true, y_pred),
+            "NDCG@5": _ndcg_per_row(y_true, y_pred, limit=5),
+            "NDCG@10": _ndcg_per_row(y_true, y_pred, limit=10),
+        }
+        for k in (1, 3, 5):
+            doc_scores[f"Precision@{k}"] = _sample_prf(
+                y_true, filter_suggestion(y_pred, k) > 0.0
+            )[0]
+        for metric, scores in doc_scores.items():
+            self._doc_sums[metric] += float(scores.sum(dtype=np.float64))
+        self._n_docs += y_true.shape[0]
+
+        true_pos = np.asarray(y_true.multiply(y_pred_binary).sum(axis=0))
+        self._true_pos += true_pos
+        self._false_pos += np.asarray(y_pred_binary.sum(axis=0)) - true_pos
+        self._false_neg += np.asarray(y_true.sum(axis=0)) - true_pos
+
+    def results(
+        self,
+        metrics: Iterable[str] = [],
+        results_file: LazyFile | TextIOWrapper | None = None,
+        language: str | None = None,
+    ) -> dict[str, float]:
+        if self._n_docs == 0:
+            raise NotSupportedException("cannot evaluate empty corpus")
+
+        tp, fp, fn = self._true_pos, self._false_pos, self._false_neg
+        support = tp + fn
+        with np.errstate(invalid="ignore", divide="ignore"):
+            precision = np.nan_to_num(tp / (tp + fp))
+            recall = np.nan_to_num(tp / support)
+            f1 = np.nan_to_num(2 * tp / (2 * tp + fp + fn))
+
+        def doc_avg(metric):
+            return self._doc_sums[metric] / self._n_docs
+
+        def weighted(scores):
+            if support.sum() == 0:
+                return 0.0
+            return float(np.average(scores, weights=support))
+
+        def ratio(numerator, denominator):
+            return float(numerator / denominator) if denominator else 0.0
+
+        # same metrics in the same order as evaluate_samples
+        all_metrics = {
+            "Precision (doc avg)": lambda: doc_avg("Precision (doc avg)"),
+            "Recall (doc avg)": lambda: doc_avg("Recall (doc avg)"),
+            "F1 score (doc avg)": lambda: doc_avg("F1 score (doc avg)"),
+            "Precision (subj avg)": lambda: float(precision.mean()),
+            "Recall (subj avg)": lambda: float(recall.mean()),
+            "F1 score (subj avg)": lambda: float(f1.mean()),
+            "Precision (weighted subj avg)": lambda: weighted(precision),
+            "Recall (weighted subj avg)": lambda: weighted(recall),
+            "F1 score (weighted subj avg)": lambda: weighted(f1),
+            "Precision (microavg)": lambda: ratio(tp.sum(), tp.sum() + fp.sum()),
+            "Recall (microavg)": lambda: ratio(tp.sum(), support.sum()),
+            "F1 score (microavg)": lambda: ratio(
+                2 * tp.sum(), 2 * tp.sum() + fp.sum() + fn.sum()
+            ),
+            "F1@5": lambda: doc_avg("F1@5"),
+            "NDCG": lambda: doc_avg("NDCG"),
+            "NDCG@5": lambda: doc_avg("NDCG@5"),
+            "NDCG@10": lambda: doc_avg("NDCG@10"),
+            "Precision@1": lambda: doc_avg("Precision@1"),
+            "Precision@3": lambda: doc_avg("Precision@3"),
+            "Precision@5": lambda: doc_avg("Precision@5"),
+            "True positives": lambda: int(tp.sum()),
+            "False positives": lambda: int(fp.sum()),
+            "False negatives": lambda: int(fn.sum()),
+        }
+
+        if not metrics:
+            metrics = all_metrics.keys()
+
+        results = {metric: all_metrics[metric]() for metric in metrics}
+        results["Documents evaluated"] = self._n_docs
+
+        if results_file:
+            self._output_counts_per_subject(tp, fp, fn, results_file, language)
+        return results
@@ -4,11 +4,12 @@ from __future__ import annotations
 
 import collections
 import math
+import os.path
+import tempfile
 from enum import IntEnum
 from statistics import mean
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, BinaryIO
 
-import joblib
 import numpy as np
 from rdflib.namespace import SKOS
 from sklearn.ensemble import BaggingClassifier
@@ -20,9 +21,10 @@ import annif.util
 from annif.exception import OperationFailedException
 from annif.lexical.tokenset import TokenSet, TokenSetIndex
 from annif.lexical.util import (
-    get_subject_labels,
+    get_label_table,
     make_collection_matrix,
     make_relation_matrix,
+    make_uri_index,
 )
 
 if TYPE_CHECKING:
@@ -32,6 +34,7 @@ if TYPE_CHECKING:
     from rdflib.term import URIRef
 
     from annif.analyzer import Analyzer
+    from annif.corpus import SubjectSet
     from annif.corpus.document import DocumentCorpus
     from annif.vocab import AnnifVocabulary
 
@@ -147,6 +150,72 @@ def create_classifier(params: dict[str, Any]) -> BaggingClassifier:
     )
 
 
+class TreeEnsemble:
+    """A flat, array-based representation of a trained bagging ensemble of
+    decision trees. The nodes of all the trees are stored in the same arrays
+    so that the whole ensemble can be evaluated with vectorized NumPy
+    operations, avoiding the per-estimator overhead of scikit-learn."""
+
+    def __init__(self, classifier: BaggingClassifier) -> None:
+        n_classes = classifier.n_classes_
+        features = []
+        thresholds = []
+        left = []
+        right = []
+        values = []
+        roots = []
+        offset = 0
+        max_depth = 0
+
+        for estimator, est_features in zip(
+            classifier.estimators_, classifier.estimators_features_
+        ):
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+            # leaves point back to themselves so that traversal can continue
+            # for a fixed number of steps without branching
+            left.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            right.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+            # map the feature indices of the tree to the original features
+            features.append(np.where(is_leaf, 0, est_features[tree.feature]))
+            thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+
+            leaf_values = tree.value[:, 0, :]
+            normalizer = leaf_values.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            node_values = np.zeros((tree.node_count, n_classes))
+            node_values[:, estimator.classes_] = leaf_values / normalizer
+            values.append(node_values)
+
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        self._feature = np.concatenate(features).astype(np.intp)
+        self._threshold = np.concatenate(thresholds)
+        self._left = np.concatenate(left).astype(np.intp)
+        self._right = np.concatenate(right).astype(np.intp)
+        self._value = np.concatenate(values)
+        self._roots = np.array(roots, dtype=np.intp)
+        self._max_depth = max_depth
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        """Return the class probabilities for the given feature matrix, in
+        the same form as BaggingClassifier.predict_proba"""
+
+        # scikit-learn trees compare float32 feature values with thresholds
+        features = np.asarray(features, dtype=np.float32)
+        rows = np.arange(features.shape[0])[:, np.newaxis]
+        nodes = np.broadcast_to(
+            self._roots, (features.shape[0], len(self._roots))
+        ).copy()
+        for _ in range(self._max_depth):
+            go_left = features[rows, self._feature[nodes]] <= self._threshold[nodes]
+            nodes = np.where(go_left, self._left[nodes], self._right[nodes])
+        return self._value[nodes].mean(axis=1)
+
+
 def prediction_to_list(
     scores: np.ndarray, candidates: list[Candidate]
 ) -> list[tuple[np.float64, int]]:
@@ -161,18 +230,47 @@ class MLLMCandidateGenerator(annif.parallel.BaseWorker):
         return doc_subject_set, candidates  # pragma: no cover
 
 
-class MLLMFeatureConverter(annif.parallel.BaseWorker):
+class MLLMFeatureGenerator(annif.parallel.BaseWorker):
     @classmethod
-    def candidates_to_features(cls, candidates):
-        return candidates_to_features(candidates, **cls.args)  # pragma: no cover
+    def generate_features(cls, doc):  # pragma: no cover
+        doc_subject_set, text = doc
+        candidates = generate_candidates(text, **cls.args["cg_args"])
+        features = candidates_to_features(candidates, cls.args["mdata"])
+        subject_ids = [c.subject_id for c in candidates]
+        labels = [(subj_id in doc_subject_set) for subj_id in subject_ids]
+        return doc_subject_set, subject_ids, labels, features
 
 
 class MLLMModel:
     """Maui-like Lexical Matching model"""
 
+    # number of feature rows processed at a time when writing training data
+    FEATURE_CHUNK_SIZE = 100000
+
     def generate_candidates(self, text: str, analyzer: Analyzer) -> list[Candidate]:
         return generate_candidates(text, analyzer, self._vectorizer, self._index)
 
+    def generate_corpus_candidates(
+        self, corpus: DocumentCorpus, analyzer: Analyzer, n_jobs: int
+    ) -> list[tuple[SubjectSet, list[Candidate]]]:
+        """Generate candidates for all the documents in the corpus using up to
+        n_jobs parallel processes. Return a list of (subject set, candidates)
+        pairs in the same order as the documents in the corpus."""
+
+        jobs, pool_class = annif.parallel.get_pool(n_jobs)
+
+        cg_args = {
+            "analyzer": analyzer,
+            "vectorizer": self._vectorizer,
+            "index": self._index,
+        }
+
+        with pool_class(
+            jobs, initializer=MLLMCandidateGenerator.init, initargs=(cg_args,)
+        ) as pool:
+            params = ((doc.subject_set, doc.text) for doc in corpus.documents)
+            return pool.starmap(MLLMCandidateGenerator.generate_candidates, params, 10)
+
     @property
     def _model_data(self) -> ModelData:
         return ModelData(
@@ -207,28 +305,36 @@ class MLLMModel:
     ) -> tuple[list[Term], list[int]]:
         pref_label_props, nonpref_label_props = self._get_label_props(params)
 
+        pref_labels = get_label_table(graph, pref_label_props, params["language"])
+        nonpref_labels = get_label_table(graph, nonpref_label_props, params["language"])
+
         terms = []
         subject_ids = []
         for subj_id, subject in vocab.subjects.active:
             subject_ids.append(subj_id)
-
-            for label in get_subject_labels(
-                graph, subject.uri, pref_label_props, params["language"]
-            ):
-                terms.append(Term(subject_id=subj_id, label=label, is_pref=True))
-
-            for label in get_subject_labels(
-                graph, subject.uri, nonpref_label_props, params["language"]
-            ):
-                terms.append(Term(subject_id=subj_id, label=label, is_pref=False))
+            terms += [
+                Term(subject_id=subj_id, label=label, is_pref=True)
+                for label in pref_labels.get(subject.uri, [])
+            ]
+            terms += [
+                Term(subject_id=subj_id, label=label, is_pref=False)
+                for label in nonpref_labels.get(subject.uri, [])
+            ]
 
         return (terms, subject_ids)
 
     def _prepare_relations(self, graph: Graph, vocab: AnnifVocabulary) -> None:
-        self._broader_matrix = make_relation_matrix(graph, vocab, SKOS.broader)
-        self._narrower_matrix = make_relation_matrix(graph, vocab, SKOS.narrower)
-        self._related_matrix = make_relation_matrix(graph, vocab, SKOS.related)
-        self._collection_matrix = make_collection_matrix(graph, vocab)
+        uri_index = make_uri_index(vocab)
+        self._broader_matrix = make_relation_matrix(
+            graph, vocab, SKOS.broader, uri_index
+        )
+        self._narrower_matrix = make_relation_matrix(
+            graph, vocab, SKOS.narrower, uri_index
+        )
+        self._related_matrix = make_relation_matrix(
+            graph, vocab, SKOS.related, uri_index
+        )
+        self._collection_matrix = make_collection_matrix(graph, vocab, uri_index)
 
     def _prepare_train_index(
         self,
@@ -259,36 +365,60 @@ class MLLMModel:
         return subject_ids
 
     def _prepare_train_data(
-        self, corpus: DocumentCorpus, analyzer: Analyzer, n_jobs: int
-    ) -> tuple[list[list[Candidate]], list[bool]]:
+        self,
+        corpus: DocumentCorpus,
+        analyzer: Analyzer,
+        n_jobs: int,
+        features_file: BinaryIO,
+    ) -> tuple[np.ndarray, np.ndarray, int]:
+        """Generate candidates and their features for the documents in the
+        corpus and write the raw feature rows into the given file as they are
+        produced. Features that depend on corpus-level statistics are left as
+        zeros. Return the subject IDs of the candidates, their labels and the
+        number of documents."""
+
         # frequency of subjects (by id) in the generated candidates
         self._doc_freq = collections.Counter()
         # frequency of manually assigned subjects ("domain keyphraseness")
         self._subj_freq = collections.Counter()
-        train_x = []
-        train_y = []
+        subject_ids = [np.zeros(0, dtype=np.int32)]
+        train_y = [np.zeros(0, dtype=bool)]
+        n_docs = 0
 
         jobs, pool_class = annif.parallel.get_pool(n_jobs)
 
-        cg_args = {
-            "analyzer": analyzer,
-            "vectorizer": self._vectorizer,
-            "index": self._index,
+        fg_args = {
+            "cg_args": {
+                "analyzer": analyzer,
+                "vectorizer": self._vectorizer,
+                "index": self._index,
+            },
+            "mdata": ModelData(
+                broader=self._broader_matrix,
+                narrower=self._narrower_matrix,
+                related=self._related_matrix,
+                collection=self._collection_matrix,
+                doc_freq=collections.Counter(),
+                subj_freq={},
+                idf=collections.defaultdict(float),
+            ),
         }
 
         with pool_class(
-            jobs, initializer=MLLMCandidateGenerator.init, initargs=(cg_args,)
+            jobs, initializer=MLLMFeatureGenerator.init, initargs=(fg_args,)
         ) as pool:
             params = ((doc.subject_set, doc.text) for doc in corpus.documents)
-            for doc_subject_ids, candidates in pool.starmap(
-                MLLMCandidateGenerator.generate_candidates, params, 10
+            for doc_subject_ids, c_ids, labels, features in pool.imap(
+                MLLMFeatureGenerator.generate_features, params, 10
             ):
                 self._subj_freq.update(doc_subject_ids)
-                self._doc_freq.update([c.subject_id for c in candidates])
-                train_x.append(candidates)
-                train_y += [(c.subject_id in doc_subject_ids) for c in candidates]
+                self._doc_freq.update(c_ids)
+                subject_ids.append(np.array(c_ids, dtype=np.int32))
+                train_y.append(np.array(labels, dtype=bool))
+                features_file.write(features.tobytes())
+                n_docs += 1
 
-        return (train_x, train_y)
+        return (np.concatenate(subject_ids), np.concatenate(train_y), n_docs)
 
     def _calculate_idf(
         self, subject_ids: list[int], doc_count: int
@@ -299,20 +429,42 @@ class MLLMModel:
 
         return idf
 
-    def _prepare_features(
-        self, train_x: list[list[Candidate]], n_jobs: int
-    ) -> list[np.ndarray]:
-        fc_args = {"mdata": self._model_data}
-        jobs, pool_class = annif.parallel.get_pool(n_jobs)
-
-        with pool_class(
-            jobs, initializer=MLLMFeatureConverter.init, initargs=(fc_args,)
-        ) as pool:
-            features = pool.map(
-                MLLMFeatureConverter.candidates_to_features, train_x, 10
-            )
+    def _corpus_feature_arrays(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the corpus-level statistics as arrays indexed by subject ID"""
+
+        n_subj = self._related_matrix.shape[0]
+        doc_freq = np.zeros(n_subj, dtype=np.float64)
+        doc_freq[list(self._doc_freq.keys())] = list(self._doc_freq.values())
+        subj_freq = np.zeros(n_subj, dtype=np.float64)
+        subj_freq[list(self._subj_freq.keys())] = [
+            count - 1 for count in self._subj_freq.values()
+        ]
+        idf = np.zeros(n_subj, dtype=np.float64)
+        idf[list(self._idf.keys())] = list(self._idf.values())
+        return doc_freq, subj_freq, idf
+
+    def _write_features(
+        self, raw_file: BinaryIO, path: str, subject_ids: np.ndarray
+    ) -> None:
+        """Copy the raw feature rows into a .npy file in chunks, filling in
+        the features that depend on corpus-level statistics."""
 
-        return features
+        doc_freq, subj_freq, idf = self._corpus_feature_arrays()
+        features = np.lib.format.open_memmap(
+            path, mode="w+", dtype=np.float32, shape=(len(subject_ids), len(Feature))
+        )
+        raw_file.seek(0)
+        for start in range(0, len(subject_ids), self.FEATURE_CHUNK_SIZE):
+            ids = subject_ids[start : start + self.FEATURE_CHUNK_SIZE]
+            chunk = np.fromfile(
+                raw_file, dtype=np.float32, count=len(ids) * len(Feature)
+            ).reshape(len(ids), len(Feature))
+            chunk[:, Feature.doc_freq] = doc_freq[ids]
+            chunk[:, Feature.subj_freq] = subj_freq[ids]
+            chunk[:, Feature.tfidf] = chunk[:, Feature.freq] * idf[ids]
+            features[start : start + len(ids)] = chunk
+        features.flush()
+        del features
 
     def prepare_train(
         self,
@@ -321,20 +473,37 @@ class MLLMModel:
         analyzer: Analyzer,
         params: dict[str, Any],
         n_jobs: int,
+        path: str,
     ) -> tuple[np.ndarray, np.ndarray]:
+        """Prepare the training data from the corpus. The feature matrix is
+        written into a .npy file with the given path without keeping it in
+        memory and returned as a memory-mapped array together with the
+        labels."""
+
         # create an index from the vocabulary terms
         subject_ids = self._prepare_train_index(vocab, analyzer, params)
 
-        # convert the corpus into train data
-        train_x, train_y = self._prepare_train_data(corpus, analyzer, n_jobs)
+        dirname, filename = os.path.split(path)
+        with tempfile.TemporaryFile(
+            prefix="tmp-" + filename, dir=dirname or None
+        ) as raw_file:
+            # convert the corpus into train data
+            c_subject_ids, train_y, n_docs = self._prepare_train_data(
+                corpus, analyzer, n_jobs, raw_file
+            )
 
-        # precalculate idf values for all candidate subjects
-        self._idf = self._calculate_idf(subject_ids, len(train_x))
+            # precalculate idf values for all candidate subjects
+            self._idf = self._calculate_idf(subject_ids, n_docs)
 
-        # convert the train data into feature values
-        features = self._prepare_features(train_x, n_jobs)
+            # fill in the final feature values
+            annif.util.atomic_save(
+                raw_file,
+                dirname,
+                filename,
+                method=lambda raw, fn: self._write_features(raw, fn, c_subject_ids),
+            )
 
-        return (np.vstack(features), np.array(train_y))
+        return (np.load(path, mmap_mode="r"), train_y)
 
     def train(
         self,
@@ -353,17 +522,18 @@ class MLLMModel:
                 + "in the training data. Please check that your training "
                 + "data matches your vocabulary."
             )
+        self._ensemble = TreeEnsemble(self._classifier)
 
     def predict(self, candidates: list[Candidate]) -> list[tuple[np.float64, int]]:
         if not candidates:
             return []
         features = self._candidates_to_features(candidates)
-        scores = self._classifier.predict_proba(features)
+        scores = self._ensemble.predict_proba(features)
         return prediction_to_list(scores, candidates)
 
-    def save(self, filename: str) -> list[str]:
-        return joblib.dump(self, filename)
-
-    @staticmethod
-    def load(filename: str) -> MLLMModel:
-        return joblib.load(filename)
+    def __setstate__(self, state):
+        # Compile the flat tree ensemble if it's missing.
+        # Might happen when using models saved using Annif 1.4 or older.
+        self.__dict__ = state
+        if "_ensemble" not in state and "_classifier" in state:
+            self._ensemble = TreeEnsemble(self._classifier)  # pragma: no cover
@@ -5,54 +5,92 @@ from __future__ import annotations
 import collections
 from typing import TYPE_CHECKING
 
-from rdflib import URIRef
+import numpy as np
 from rdflib.namespace import SKOS
-from scipy.sparse import csc_matrix, lil_matrix
+from scipy.sparse import coo_matrix, csc_matrix
 
 if TYPE_CHECKING:
+    from rdflib import URIRef
     from rdflib.graph import Graph
 
     from annif.vocab import AnnifVocabulary
 
 
-def get_subject_labels(
-    graph: Graph, uri: str, properties: list[URIRef], language: str
-) -> list[str]:
-    return [
-        str(label)
-        for prop in properties
-        for label in graph.objects(URIRef(uri), prop)
-        if label.language == language
-    ]
+def make_uri_index(vocab: AnnifVocabulary) -> dict[str, int]:
+    """Return a dict mapping the URIs of all active subjects in the vocabulary
+    to their subject IDs"""
+
+    return {subject.uri: subj_id for subj_id, subject in vocab.subjects.active}
+
+
+def get_label_table(
+    graph: Graph, properties: list[URIRef], language: str
+) -> collections.defaultdict[str, list[str]]:
+    """Return a dict mapping subject URIs to their labels in the given
+    language, using a single pass over the triples of each property"""
+
+    labels = collections.defaultdict(list)
+    for prop in properties:
+        for subj, label in graph.subject_objects(prop):
+            if getattr(label, "language", None) == language:
+                labels[str(subj)].append(str(label))
+    return labels
 
 
 def make_relation_matrix(
-    graph: Graph, vocab: AnnifVocabulary, property: URIRef
+    graph: Graph,
+    vocab: AnnifVocabulary,
+    property: URIRef,
+    uri_index: dict[str, int] | None = None,
 ) -> csc_matrix:
+    if uri_index is None:
+        uri_index = make_uri_index(vocab)
     n_subj = len(vocab.subjects)
-    matrix = lil_matrix((n_subj, n_subj), dtype=bool)
-
-    for subj, obj in graph.subject_objects(property):
-        subj_id = vocab.subjects.by_uri(str(subj), warnings=False)
-        obj_id = vocab.subjects.by_uri(str(obj), warnings=False)
-        if subj_id is not None and obj_id is not None:
-            matrix[subj_id, obj_id] = True
 
+    pairs = [
+        (uri_index.get(str(subj)), uri_index.get(str(obj)))
+        for subj, obj in graph.subject_objects(property)
+    ]
+    pairs = np.array(
+        [
+            (subj_id, obj_id)
+            for subj_id, obj_id in pairs
+            if None not in (subj_id, obj_id)
+        ],
+        dtype=np.int64,
+    ).reshape(-1, 2)
+
+    matrix = coo_matrix(
+        (np.ones(len(pairs), dtype=bool), (pairs[:, 0], pairs[:, 1])),
+        shape=(n_subj, n_subj),
+    )
     return csc_matrix(matrix)
 
 
-def make_collection_matrix(graph: Graph, vocab: AnnifVocabulary) -> csc_matrix:
+def make_collection_matrix(
+    graph: Graph, vocab: AnnifVocabulary, uri_index: dict[str, int] | None = None
+) -> csc_matrix:
+    if uri_index is None:
+        uri_index = make_uri_index(vocab)
+
     # make an index with all collection members
     c_members = collections.defaultdict(list)
     for coll, member in graph.subject_objects(SKOS.member):
-        member_id = vocab.subjects.by_uri(str(member), warnings=False)
+        member_id = uri_index.get(str(member))
         if member_id is not None:
             c_members[str(coll)].append(member_id)
 
-    c_matrix = lil_matrix((len(c_members), len(vocab.subjects)), dtype=bool)
-
     # populate the matrix for collection -> subject_id
-    for c_id, members in enumerate(c_members.values()):
-        c_matrix[c_id, members] = True
-
+    rows = np.repeat(
+        np.arange(len(c_members)), [len(members) for members in c_members.values()]
+    )
+    cols = np.fromiter(
+        (member_id for members in c_members.values() for member_id in members),
+        dtype=np.int64,
+        count=len(rows),
+    )
+    c_matrix = coo_matrix(
+        (np.ones(len(rows), dtype=bool), (rows, cols)),
+        shape=(len(c_members), len(vocab.subjects)),
+    )
     return csc_matrix(c_matrix)
@@ -4,11 +4,16 @@ from __future__ import annotations
 
 import multiprocessing
 import multiprocessing.dummy
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from typing import TYPE_CHECKING, Any
 
 if TYPE_CHECKING:
     from collections import defaultdict
     from collections.abc import Iterator
+    from multiprocessing.pool import Pool
     from typing import Callable
 
     from annif.corpus import Document, SubjectSet
@@ -21,6 +26,13 @@ if TYPE_CHECKING:
 # Intended to be overridden in unit tests.
 MP_START_METHOD = None
 
+# Thread pools shared by all callers, keyed by the number of threads
+THREAD_POOL_PREFIX = "annif-pool"
+_thread_pools: dict[int, ThreadPoolExecutor] = {}
+_thread_pools_lock = threading.Lock()
+# The threads of the pools are not inherited by forked worker processes
+os.register_at_fork(after_in_child=_thread_pools.clear)
+
 
 class BaseWorker:
     """Base class for workers that implement tasks executed via
@@ -96,3 +108,40 @@ def get_pool(n_jobs: int) -> tuple[int | None, Callable]:
         pool_constructor = ctx.Pool
 
     return n_jobs, pool_constructor
+
+
+def _terminate_pool(pool: Pool, pid: int) -> None:
+    # forked child processes must not terminate the pools of their parent
+    if os.getpid() == pid:
+        pool.terminate()
+
+
+def get_owned_pool(
+    owner: object, n_jobs: int, initializer: Callable, initargs: tuple
+) -> Pool:
+    """return a pool for the given amount of parallel jobs, created as
+    suggested by get_pool, that is terminated when the owner object is
+    garbage collected or, at the latest, when the interpreter exits"""
+
+    jobs, pool_class = get_pool(n_jobs)
+    pool = pool_class(jobs, initializer=initializer, initargs=initargs)
+    weakref.finalize(owner, _terminate_pool, pool, os.getpid())
+    return pool
+
+
+def get_thread_pool(n_threads: int) -> ThreadPoolExecutor:
+    """return a thread pool with the given number of threads, shared with all
+    other callers asking for the same number of threads"""
+
+    with _thread_pools_lock:
+        if n_threads not in _thread_pools:
+            _thread_pools[n_threads] = ThreadPoolExecutor(
+                n_threads, thread_name_prefix=THREAD_POOL_PREFIX
+            )
+        return _thread_pools[n_threads]
+
+
+def in_thread_pool() -> bool:
+    """return True if called from a thread of a shared thread pool"""
+
+    return threading.current_thread().name.startswith(THREAD_POOL_PREFIX)
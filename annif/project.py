@@ -314,12 +314,13 @@ class AnnifProject(DatadirMixin):
         jobs: int,
         metric: str,
         results_file: LazyFile | None,
+        pruner: str = "none",
     ) -> HPRecommendation:
         """optimize the hyperparameters of the project using a validation
-        corpus against a given metric"""
+        corpus against a given metric, optionally pruning unpromising trials"""
         if isinstance(self.backend, annif.backend.hyperopt.AnnifHyperoptBackend):
             optimizer = self.backend.get_hp_optimizer(corpus, metric)
-            return optimizer.optimize(trials, jobs, results_file)
+            return optimizer.optimize(trials, jobs, results_file, pruner)
 
         raise NotSupportedException(
             "Hyperparameter optimization not supported " "by backend",
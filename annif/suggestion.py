@@ -37,19 +37,24 @@ def filter_suggestion(
     if limit == 0:
         return csr_array(preds.shape, dtype=np.float32)  # empty
 
-    data, rows, cols = [], [], []
-    for row in range(preds.shape[0]):
-        arow = preds[[row]]
-        if limit is not None and limit < len(arow.data):
-            topk_idx = arow.data.argpartition(-limit)[-limit:]
-        else:
-            topk_idx = range(len(arow.data))
-        for idx in topk_idx:
-            if arow.data[idx] >= threshold:
-                data.append(arow.data[idx])
-                rows.append(row)
-                cols.append(arow.indices[idx])
-    return csr_array((data, (rows, cols)), shape=preds.shape, dtype=np.float32)
+    preds = csr_array(preds)
+    if not preds.has_canonical_format:
+        # the array may be shared, so it must not be modified in place
+        preds = preds.copy()
+        preds.sum_duplicates()
+    rows = np.repeat(np.arange(preds.shape[0]), np.diff(preds.indptr))
+    keep = preds.data >= threshold
+    if limit is not None:
+        # rank the scores within each row, highest score first
+        order = np.lexsort((-preds.data, rows))
+        ranks = np.empty(len(order), dtype=np.int64)
+        ranks[order] = np.arange(len(order)) - preds.indptr[rows[order]]
+        keep &= ranks < limit
+    return csr_array(
+        (preds.data[keep], (rows[keep], preds.indices[keep])),
+        shape=preds.shape,
+        dtype=np.float32,
+    )
 
 
 class SuggestionResult:
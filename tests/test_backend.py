@@ -1,12 +1,16 @@
 """Unit tests for backends in Annif"""
 
+import functools
 import importlib.util
 
+import optuna
 import pytest
 
 import annif
 import annif.backend
+import annif.backend.hyperopt
 from annif.corpus import Document, DocumentDirectory
+from annif.exception import ConfigurationException, OperationFailedException
 
 
 def test_get_backend_nonexistent():
@@ -66,13 +70,13 @@ def test_get_backend_fasttext_not_installed():
 
 
 @pytest.mark.skipif(
-    importlib.util.find_spec("torch") is not None,
-    reason="test requires that PyTorch is NOT installed",
+    importlib.util.find_spec("lmdb") is not None,
+    reason="test requires that LMDB is NOT installed",
 )
 def test_get_backend_nn_ensemble_not_installed():
     with pytest.raises(ValueError) as excinfo:
         annif.backend.get_backend("nn_ensemble")
-    assert "PyTorch not available" in str(excinfo.value)
+    assert "LMDB not available" in str(excinfo.value)
 
 
 @pytest.mark.skipif(
@@ -103,3 +107,109 @@ def test_get_backend_stwfsa_not_installed():
     with pytest.raises(ValueError) as excinfo:
         annif.backend.get_backend("stwfsa")
     assert "STWFSA not available" in str(excinfo.value)
+
+
+class ToyHPObjective(annif.backend.hyperopt.HPObjective):
+    @classmethod
+    def suggest_params(cls, trial, args):
+        return {"x": trial.suggest_float("x", 0.0, 1.0)}
+
+    @classmethod
+    def evaluate(cls, params, args):
+        if params["x"] > args["max_x"]:
+            raise ValueError("x out of range")
+        return -((params["x"] - 0.5) ** 2)
+
+    @classmethod
+    def evaluate_steps(cls, params, args):
+        for _ in cls.step_sizes(100):
+            yield cls.evaluate(params, args)
+
+
+class ToyOptimizer(annif.backend.hyperopt.HyperparameterOptimizer):
+    def _prepare(self, n_jobs=1):
+        return {"max_x": 0.8}
+
+    def _postprocess(self, study):
+        return annif.backend.hyperopt.HPRecommendation(
+            lines=[f"x={study.best_params['x']}"], score=study.best_value
+        )
+
+
+def test_hyperopt_ask_and_tell(tmpdir):
+    optimizer = ToyOptimizer(None, None, "toy", ToyHPObjective)
+    results_file = tmpdir.join("results.tsv")
+    with results_file.open("w") as results:
+        rec = optimizer.optimize(n_trials=20, n_jobs=1, results_file=results)
+
+    assert rec.lines[0].startswith("x=")
+    assert -0.25 <= rec.score <= 0.0
+    lines = results_file.read().splitlines()
+    assert lines[0] == "trial\tvalue\tx"
+    # failed trials are not written to the results file
+    assert 1 < len(lines) <= 21
+    assert all(float(line.split("\t")[2]) <= 0.8 for line in lines[1:])
+
+
+@pytest.mark.parametrize("pruner", ["none", "median"])
+def test_hyperopt_all_trials_failed(pruner):
+    class FailingToyOptimizer(ToyOptimizer):
+        def _prepare(self, n_jobs=1):
+            return {"max_x": -1.0}
+
+    optimizer = FailingToyOptimizer(None, None, "toy", ToyHPObjective)
+    with pytest.raises(OperationFailedException) as excinfo:
+        optimizer.optimize(n_trials=3, n_jobs=1, results_file=None, pruner=pruner)
+    assert "None of the 3 trials completed" in str(excinfo.value)
+
+
+def test_hyperopt_step_sizes():
+    objective = annif.backend.hyperopt.HPObjective
+    assert objective.step_sizes(100) == [25, 50, 100]
+    assert objective.step_sizes(2) == [1, 2]
+    assert objective.step_sizes(0) == [1]
+
+
+@pytest.mark.parametrize("pruner", ["median", "halving", "hyperband"])
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_hyperopt_pruning(tmpdir, monkeypatch, pruner, n_jobs):
+    # sample the trials from a fixed sequence to make pruning predictable
+    monkeypatch.setattr(
+        optuna,
+        "create_study",
+        functools.partial(
+            optuna.create_study, sampler=optuna.samplers.RandomSampler(seed=0)
+        ),
+    )
+    optimizer = ToyOptimizer(None, None, "toy", ToyHPObjective)
+    results_file = tmpdir.join("results.tsv")
+    with results_file.open("w") as results:
+        rec = optimizer.optimize(
+            n_trials=40, n_jobs=n_jobs, results_file=results, pruner=pruner
+        )
+
+    assert -0.25 <= rec.score <= 0.0
+    lines = results_file.read().splitlines()
+    assert lines[0] == "trial\tvalue\tx\tstate\tsteps"
+    rows = [line.split("\t") for line in lines[1:]]
+    assert {row[3] for row in rows} == {"complete", "pruned"}
+    assert all(row[4] == "3" for row in rows if row[3] == "complete")
+    assert all(row[1] == "" for row in rows if row[3] == "pruned")
+    # trials may also be pruned after the last step
+    assert all(int(row[4]) <= 3 for row in rows if row[3] == "pruned")
+
+
+def test_hyperopt_get_pruner():
+    for name in annif.backend.HYPEROPT_PRUNERS:
+        pruner = annif.backend.hyperopt.get_pruner(name)
+        assert isinstance(pruner, optuna.pruners.BasePruner)
+    assert isinstance(
+        annif.backend.hyperopt.get_pruner("halving"),
+        optuna.pruners.SuccessiveHalvingPruner,
+    )
+
+
+def test_hyperopt_invalid_pruner():
+    optimizer = ToyOptimizer(None, None, "toy", ToyHPObjective)
+    with pytest.raises(ConfigurationException):
+        optimizer.optimize(n_trials=1, n_jobs=1, results_file=None, pruner="bogus")
@@ -0,0 +1,142 @@
+"""Unit tests for the cascade ensemble backend in Annif"""
+
+import numpy as np
+import pytest
+from scipy.sparse import csr_array
+
+import annif.backend
+import annif.backend.dummy
+from annif.backend.cascade import CascadeHPObjective, cascade_merge, is_confident
+from annif.corpus import Document, DocumentFileTSV
+from annif.suggestion import SubjectSuggestion, SuggestionBatch
+
+
+def test_is_confident():
+    array = csr_array(
+        np.array([[0.9, 0.2, 0.0], [0.9, 0.85, 0.0], [0.5, 0.0, 0.0], [0, 0, 0]])
+    )
+    assert list(is_confident(array, 0.8, 0.1)) == [True, False, False, False]
+    assert list(is_confident(array, 0.5, 0.0)) == [True, True, True, False]
+
+
+def test_cascade_merge_all_sources():
+    rng = np.random.default_rng(42)
+    arrays = [
+        csr_array(rng.random((5, 8)) * (rng.random((5, 8)) > 0.5), dtype=np.float32)
+        for _ in range(3)
+    ]
+    weights = [1.0, 2.0, 0.5]
+    scores, n_calls = cascade_merge(
+        lambda source_idx, docs: arrays[source_idx][docs], 5, weights, 1.1, 0.0
+    )
+    expected = SuggestionBatch.from_averaged(
+        [SuggestionBatch(array) for array in arrays], weights
+    )
+    assert n_calls == 10
+    assert np.allclose(scores.toarray(), expected.array.toarray())
+
+
+def test_cascade_merge_first_source_only():
+    arrays = [
+        csr_array(np.array([[0.9, 0.0], [0.3, 0.2]], dtype=np.float32)),
+        csr_array(np.array([[0.0, 0.7], [0.0, 0.7]], dtype=np.float32)),
+    ]
+    requested = []
+
+    def get_scores(source_idx, docs):
+        requested.append((source_idx, list(docs)))
+        return arrays[source_idx][docs]
+
+    scores, n_calls = cascade_merge(get_scores, 2, [1.0, 1.0], 0.8, 0.0)
+    assert requested == [(0, [0, 1]), (1, [1])]
+    assert n_calls == 1
+    assert np.allclose(scores.toarray(), [[0.9, 0.0], [0.15, 0.45]])
+
+
+@pytest.mark.filterwarnings("error::RuntimeWarning")
+def test_cascade_merge_zero_weights():
+    array = csr_array(np.array([[0.9, 0.0], [0.3, 0.2]], dtype=np.float32))
+    scores, n_calls = cascade_merge(
+        lambda source_idx, docs: array[docs], 2, [0.0, 0.0], 0.8, 0.0
+    )
+    assert n_calls == 2
+    assert np.allclose(scores.toarray(), 0.0)
+
+
+def test_cascade_suggest(registry):
+    project = registry.get_project("ensemble")
+    cascade_type = annif.backend.get_backend("cascade")
+    cascade = cascade_type(
+        backend_id="cascade",
+        config_params={"sources": "dummy-en,dummy-private", "confidence": 0.5},
+        project=project,
+    )
+    assert cascade.skipped_source_calls() is None
+
+    results = cascade.suggest([Document(text="example text")] * 2)
+    assert len(results[0]) > 0
+    assert cascade.skipped_source_calls() == 1.0
+
+
+def _hyperopt_corpus(project, tmpdir):
+    tmpfile = tmpdir.join("documents.tsv")
+    tmpfile.write(
+        "dummy\thttp://example.org/dummy\n"
+        + "another\thttp://example.org/dummy\n"
+        + "none\thttp://example.org/none\n"
+    )
+    return DocumentFileTSV(str(tmpfile), project.subjects)
+
+
+def test_cascade_hyperopt(registry, tmpdir):
+    project = registry.get_project("ensemble")
+    cascade_type = annif.backend.get_backend("cascade")
+    cascade = cascade_type(
+        backend_id="cascade",
+        config_params={"sources": "dummy-en,dummy-private"},
+        project=project,
+    )
+    corpus = _hyperopt_corpus(project, tmpdir)
+
+    optimizer = cascade.get_hp_optimizer(corpus, metric="NDCG")
+    results_file = tmpdir.join("results.tsv")
+    with results_file.open("w") as results:
+        rec = optimizer.optimize(n_trials=4, n_jobs=1, results_file=results)
+    assert rec.lines[0].startswith("confidence=")
+    assert rec.lines[1].startswith("margin=")
+    assert rec.lines[2].startswith("# expensive source calls saved: ")
+    assert 0.0 <= rec.score <= 1.0
+    # the trials are scored by the plain metric
+    values = [float(line.split("\t")[1]) for line in results_file.readlines()[1:]]
+    assert rec.score == max(values)
+
+
+def test_cascade_hyperopt_source_limits(registry, tmpdir, monkeypatch):
+    def suggest_all(self, doc, params):
+        return [
+            SubjectSuggestion(subject_id=subject_id, score=1.0 / (subject_id + 1))
+            for subject_id in range(len(self.project.subjects))
+        ]
+
+    monkeypatch.setattr(annif.backend.dummy.DummyBackend, "_suggest", suggest_all)
+    project = registry.get_project("ensemble")
+    cascade_type = annif.backend.get_backend("cascade")
+    cascade = cascade_type(
+        backend_id="cascade",
+        config_params={"sources": "dummy-en,dummy-private", "limit": 1},
+        project=project,
+    )
+    corpus = _hyperopt_corpus(project, tmpdir)
+
+    optimizer = cascade.get_hp_optimizer(corpus, metric="NDCG")
+    args = optimizer._prepare()
+    docs = list(corpus.documents)
+    # the sources are simulated as queried by the cascade, not cut to its limit
+    for source_id, array in zip(["dummy-en", "dummy-private"], args["source_arrays"]):
+        expected = registry.get_project(source_id).suggest(docs).array
+        assert array.nnz == len(docs) * len(project.subjects) > len(docs)
+        assert (array != expected).nnz == 0
+
+    params = {"confidence": 0.5, "margin": 0.0}
+    score, _ = CascadeHPObjective.score_and_savings(params, args)
+    assert CascadeHPObjective.evaluate(params, args) == score
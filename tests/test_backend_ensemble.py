@@ -1,9 +1,14 @@
 """Unit tests for the ensemble backend in Annif"""
 
+import numpy as np
 import pytest
+from scipy.sparse import csr_array
 
 import annif.backend
+from annif.backend.ensemble import EnsembleHPObjective, EnsembleOptimizer
+from annif.corpus import Document
 from annif.exception import NotSupportedException
+from annif.suggestion import SuggestionBatch
 
 
 def test_ensemble_train(project, document_corpus):
@@ -14,3 +19,71 @@ def test_ensemble_train(project, document_corpus):
 
     with pytest.raises(NotSupportedException):
         ensemble.train(document_corpus)
+
+
+def test_ensemble_suggest_source_threads(registry):
+    project = registry.get_project("ensemble")
+    ensemble_type = annif.backend.get_backend("ensemble")
+    results = []
+    for source_threads in (1, 2):
+        ensemble = ensemble_type(
+            backend_id="ensemble",
+            config_params={
+                "sources": "dummy-en,dummy-private:2",
+                "source-threads": source_threads,
+            },
+            project=project,
+        )
+        batch = ensemble.suggest([Document(text="example text")] * 3)
+        results.append(batch.array.toarray())
+    assert results[0].any()
+    assert np.array_equal(results[0], results[1])
+
+
+def test_ensemble_stack_source_arrays():
+    rng = np.random.default_rng(42)
+    arrays = [
+        csr_array(rng.random((4, 10)) * (rng.random((4, 10)) > 0.6), dtype=np.float32)
+        for _ in range(3)
+    ]
+    indices, indptr, scores = EnsembleOptimizer._stack_source_arrays(arrays)
+    weights = np.array([0.2, 0.5, 0.3])
+    combined = csr_array((scores @ weights, indices, indptr), shape=(4, 10))
+    expected = SuggestionBatch.from_averaged(
+        [SuggestionBatch(array) for array in arrays], list(weights)
+    )
+    assert np.allclose(combined.toarray(), expected.array.toarray())
+
+
+def _objective_args():
+    rng = np.random.default_rng(42)
+    arrays = [
+        csr_array(rng.random((8, 10)) * (rng.random((8, 10)) > 0.6), dtype=np.float32)
+        for _ in range(2)
+    ]
+    indices, indptr, scores = EnsembleOptimizer._stack_source_arrays(arrays)
+    args = {
+        "gold": csr_array(rng.random((8, 10)) > 0.8),
+        "indices": indices,
+        "indptr": indptr,
+        "source_scores": scores,
+        "sources": ["first", "second"],
+        "limit": 5,
+        "metric": "NDCG",
+    }
+    return args
+
+
+def test_ensemble_objective_evaluate_steps():
+    args = _objective_args()
+    params = {"first": 0.3, "second": 0.7}
+    values = list(EnsembleHPObjective.evaluate_steps(params, args))
+    assert len(values) == 3
+    assert values[-1] == pytest.approx(EnsembleHPObjective.evaluate(params, args))
+
+
+def test_ensemble_objective_evaluate_zero_weights():
+    args = _objective_args()
+    params = {"first": 0.0, "second": 0.0}
+    assert EnsembleHPObjective.evaluate(params, args) == 0.0
+    assert list(EnsembleHPObjective.evaluate_steps(params, args)) == [0.0] * 3
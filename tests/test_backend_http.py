@@ -1,8 +1,11 @@
 """Unit tests for the HTTP backend in Annif"""
 
 import importlib
+import json
+import threading
 import unittest.mock
 from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 import pytest
 import requests.exceptions
@@ -13,8 +16,76 @@ from annif.exception import OperationFailedException
 from annif.vocab import Subject
 
 
+class StandInAnnifHandler(BaseHTTPRequestHandler):
+    """Request handler imitating the REST API of an Annif instance. The score
+    of the suggested subject is taken from the document text."""
+
+    protocol_version = "HTTP/1.1"
+
+    def _hit(self, text):
+        return {
+            "uri": "http://example.org/dummy",
+            "label": "dummy",
+            "score": float(text),
+        }
+
+    def _respond(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.requests.append(("GET", self.path))
+        self._respond({"project_id": "dummy", "is_trained": True})
+
+    def do_POST(self):
+        self.server.requests.append(("POST", self.path.split("?")[0]))
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path.startswith("/v1/projects/dummy/suggest-batch"):
+            if not self.server.batch_supported:
+                self._respond({"detail": "Not Found"}, status=404)
+                return
+            documents = json.loads(body)["documents"]
+            self._respond([{"results": [self._hit(doc["text"])]} for doc in documents])
+        else:
+            text = body.decode("utf-8").split("text=")[1].split("&")[0]
+            self._respond({"results": [self._hit(text)]})
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stand_in_server():
+    """a local HTTP server standing in for a remote Annif instance"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInAnnifHandler)
+    server.requests = []
+    server.batch_supported = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _stand_in_backend(server, annif_project, **params):
+    http_type = annif.backend.get_backend("http")
+    host, port = server.server_address
+    return http_type(
+        backend_id="http",
+        config_params={
+            "endpoint": f"http://{host}:{port}/v1/projects/dummy/suggest",
+            **params,
+        },
+        project=annif_project,
+    )
+
+
 def test_http_suggest(app_project):
-    with unittest.mock.patch("requests.post") as mock_request:
+    with unittest.mock.patch("requests.Session.post") as mock_request:
         # create a mock response whose .json() method returns the list that we
         # define here
         mock_response = unittest.mock.Mock()
@@ -43,7 +114,7 @@ def test_http_suggest(app_project):
 
 
 def test_http_suggest_with_results(app_project):
-    with unittest.mock.patch("requests.post") as mock_request:
+    with unittest.mock.patch("requests.Session.post") as mock_request:
         # create a mock response whose .json() method returns the list that we
         # define here
         mock_response = unittest.mock.Mock()
@@ -86,7 +157,7 @@ def test_http_suggest_with_results(app_project):
 
 
 def test_http_suggest_post_args(app_project):
-    with unittest.mock.patch("requests.post"):
+    with unittest.mock.patch("requests.Session.post"):
         http_type = annif.backend.get_backend("http")
         http = http_type(
             backend_id="http",
@@ -99,19 +170,26 @@ def test_http_suggest_post_args(app_project):
         )
         http.suggest([Document(text="this is some text", metadata={"field": "value"})])
 
-        assert requests.post.call_args.args == ("http://api.example.org/analyze",)
-        assert "text" in requests.post.call_args.kwargs["data"]
-        assert requests.post.call_args.kwargs["data"]["text"] == "this is some text"
-        assert "project" in requests.post.call_args.kwargs["data"]
-        assert requests.post.call_args.kwargs["data"]["project"] == "dummy"
-        assert "limit" in requests.post.call_args.kwargs["data"]
-        assert requests.post.call_args.kwargs["data"]["limit"] == "42"
-        assert "metadata_field" in requests.post.call_args.kwargs["data"]
-        assert requests.post.call_args.kwargs["data"]["metadata_field"] == "value"
+        assert requests.Session.post.call_args.args == (
+            "http://api.example.org/analyze",
+        )
+        assert "text" in requests.Session.post.call_args.kwargs["data"]
+        assert (
+            requests.Session.post.call_args.kwargs["data"]["text"]
+            == "this is some text"
+        )
+        assert "project" in requests.Session.post.call_args.kwargs["data"]
+        assert requests.Session.post.call_args.kwargs["data"]["project"] == "dummy"
+        assert "limit" in requests.Session.post.call_args.kwargs["data"]
+        assert requests.Session.post.call_args.kwargs["data"]["limit"] == "42"
+        assert "metadata_field" in requests.Session.post.call_args.kwargs["data"]
+        assert (
+            requests.Session.post.call_args.kwargs["data"]["metadata_field"] == "value"
+        )
 
 
 def test_http_suggest_zero_score(project):
-    with unittest.mock.patch("requests.post") as mock_request:
+    with unittest.mock.patch("requests.Session.post") as mock_request:
         # create a mock response whose .json() method returns the list that we
         # define here
         mock_response = unittest.mock.Mock()
@@ -134,7 +212,7 @@ def test_http_suggest_zero_score(project):
 
 
 def test_http_suggest_error(project):
-    with unittest.mock.patch("requests.post") as mock_request:
+    with unittest.mock.patch("requests.Session.post") as mock_request:
         mock_request.side_effect = requests.exceptions.RequestException("failed")
 
         http_type = annif.backend.get_backend("http")
@@ -151,7 +229,7 @@ def test_http_suggest_error(project):
 
 
 def test_http_suggest_json_fails(project):
-    with unittest.mock.patch("requests.post") as mock_request:
+    with unittest.mock.patch("requests.Session.post") as mock_request:
         # create a mock response whose .json() method returns the list that we
         # define here
         mock_response = unittest.mock.Mock()
@@ -172,7 +250,7 @@ def test_http_suggest_json_fails(project):
 
 
 def test_http_suggest_unexpected_json(project):
-    with unittest.mock.patch("requests.post") as mock_request:
+    with unittest.mock.patch("requests.Session.post") as mock_request:
         # create a mock response whose .json() method returns the list that we
         # define here
         mock_response = unittest.mock.Mock()
@@ -193,7 +271,7 @@ def test_http_suggest_unexpected_json(project):
 
 
 def test_http_is_trained(project):
-    with unittest.mock.patch("requests.get") as mock_request:
+    with unittest.mock.patch("requests.Session.get") as mock_request:
         # create a mock response whose .json() method returns the dict that we
         # define here
         mock_response = unittest.mock.Mock()
@@ -213,7 +291,7 @@ def test_http_is_trained(project):
 
 
 def test_http_modification_time(project):
-    with unittest.mock.patch("requests.get") as mock_request:
+    with unittest.mock.patch("requests.Session.get") as mock_request:
         # create a mock response whose .json() method returns the dict that we
         # define here
         mock_response = unittest.mock.Mock()
@@ -237,7 +315,7 @@ def test_http_modification_time(project):
 
 
 def test_http_modification_time_none(project):
-    with unittest.mock.patch("requests.get") as mock_request:
+    with unittest.mock.patch("requests.Session.get") as mock_request:
         # create a mock response whose .json() method returns the dict that we
         # define here
         mock_response = unittest.mock.Mock()
@@ -257,7 +335,7 @@ def test_http_modification_time_none(project):
 
 
 def test_http_get_project_info_http_error(project):
-    with unittest.mock.patch("requests.get") as mock_request:
+    with unittest.mock.patch("requests.Session.get") as mock_request:
         mock_request.side_effect = requests.exceptions.RequestException("failed")
 
         http_type = annif.backend.get_backend("http")
@@ -274,7 +352,7 @@ def test_http_get_project_info_http_error(project):
 
 
 def test_http_get_project_info_json_decode_error(project):
-    with unittest.mock.patch("requests.get") as mock_request:
+    with unittest.mock.patch("requests.Session.get") as mock_request:
         mock_response = unittest.mock.Mock()
         mock_response.json.side_effect = ValueError("JSON decode failed")
         mock_request.return_value = mock_response
@@ -293,7 +371,7 @@ def test_http_get_project_info_json_decode_error(project):
 
 
 def test_headers(project):
-    with unittest.mock.patch("requests.post"):
+    with unittest.mock.patch("requests.Session.post"):
         http_type = annif.backend.get_backend("http")
         http = http_type(
             backend_id="http",
@@ -306,6 +384,77 @@ def test_headers(project):
         http.suggest([Document("this is some text")])
 
         version = importlib.metadata.version("annif")
-        assert requests.post.call_args.kwargs["headers"] == {
+        assert requests.Session.post.call_args.kwargs["headers"] == {
             "User-Agent": f"Annif/{version}"
         }
+
+
+def test_http_suggest_batch_endpoint(app_project, stand_in_server):
+    http = _stand_in_backend(stand_in_server, app_project, batch="true")
+    docs = [Document(text=f"0.{idx % 9 + 1}") for idx in range(40)]
+    results = http.suggest(docs)
+
+    assert stand_in_server.requests == [
+        ("POST", "/v1/projects/dummy/suggest-batch"),
+        ("POST", "/v1/projects/dummy/suggest-batch"),
+    ]
+    assert len(results) == 40
+    for doc, result in zip(docs, results):
+        assert [hit.score for hit in result] == [pytest.approx(float(doc.text))]
+
+
+def test_http_suggest_batch_not_by_default(app_project, stand_in_server):
+    http = _stand_in_backend(stand_in_server, app_project)
+    http.suggest([Document(text="0.5"), Document(text="0.6")])
+
+    assert stand_in_server.requests == [("POST", "/v1/projects/dummy/suggest")] * 2
+
+
+def test_http_suggest_batch_endpoint_missing(app_project, stand_in_server):
+    stand_in_server.batch_supported = False
+    http = _stand_in_backend(stand_in_server, app_project, batch="true")
+    docs = [Document(text="0.5"), Document(text="0.6")]
+    results = http.suggest(docs)
+    http.suggest(docs)
+
+    # the batch endpoint is tried only once
+    assert (
+        stand_in_server.requests
+        == [("POST", "/v1/projects/dummy/suggest-batch")]
+        + [("POST", "/v1/projects/dummy/suggest")] * 4
+    )
+    for doc, result in zip(docs, results):
+        assert [hit.score for hit in result] == [pytest.approx(float(doc.text))]
+
+
+def test_http_suggest_batch_with_project_param(app_project, stand_in_server):
+    http = _stand_in_backend(
+        stand_in_server, app_project, batch="true", project="dummy"
+    )
+    http.suggest([Document(text="0.5"), Document(text="0.6")])
+
+    # the project parameter can only be passed to the single document endpoint
+    assert stand_in_server.requests == [("POST", "/v1/projects/dummy/suggest")] * 2
+
+
+def test_http_suggest_concurrent(app_project, stand_in_server):
+    http = _stand_in_backend(stand_in_server, app_project, **{"request-threads": 4})
+    docs = [Document(text=f"0.{idx + 1}") for idx in range(9)]
+    results = http.suggest(docs)
+
+    assert stand_in_server.requests == [("POST", "/v1/projects/dummy/suggest")] * 9
+    for doc, result in zip(docs, results):
+        assert [hit.score for hit in result] == [pytest.approx(float(doc.text))]
+
+
+def test_http_project_info_cached(app_project, stand_in_server):
+    http = _stand_in_backend(stand_in_server, app_project)
+    assert http.is_trained
+    assert http.is_trained
+    assert http.modification_time is None
+    assert stand_in_server.requests == [("GET", "/v1/projects/dummy")]
+
+    http = _stand_in_backend(stand_in_server, app_project, **{"info-ttl": 0})
+    assert http.is_trained
+    assert http.is_trained
+    assert len(stand_in_server.requests) == 3
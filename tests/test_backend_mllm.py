@@ -33,8 +33,10 @@ def test_mllm_train(datadir, fulltext_corpus, project):
 
     mllm.train(fulltext_corpus)
     assert mllm._model is not None
-    assert datadir.join("mllm-train.gz").exists()
-    assert datadir.join("mllm-train.gz").size() > 0
+    assert datadir.join("mllm-train-x.npy").exists()
+    assert datadir.join("mllm-train-x.npy").size() > 0
+    assert datadir.join("mllm-train-y.npy").exists()
+    assert datadir.join("mllm-train-y.npy").size() > 0
     assert datadir.join("mllm-model.gz").exists()
     assert datadir.join("mllm-model.gz").size() > 0
 
@@ -121,10 +123,48 @@ def test_mllm_hyperopt(project, fulltext_corpus):
     optimizer.optimize(n_trials=3, n_jobs=1, results_file=None)
 
 
+def test_mllm_hyperopt_parallel(project, fulltext_corpus):
+    mllm_type = annif.backend.get_backend("mllm")
+    mllm = mllm_type(
+        backend_id="mllm",
+        config_params={"limit": 10, "language": "fi"},
+        project=project,
+    )
+
+    optimizer = mllm.get_hp_optimizer(fulltext_corpus, metric="NDCG")
+    rec = optimizer.optimize(n_trials=2, n_jobs=2, results_file=None)
+    assert rec.score >= 0.0
+
+
+def test_mllm_hyperopt_pruning(project, fulltext_corpus):
+    mllm_type = annif.backend.get_backend("mllm")
+    mllm = mllm_type(
+        backend_id="mllm",
+        config_params={"limit": 10, "language": "fi"},
+        project=project,
+    )
+
+    optimizer = mllm.get_hp_optimizer(fulltext_corpus, metric="NDCG")
+    rec = optimizer.optimize(n_trials=3, n_jobs=1, results_file=None, pruner="median")
+    assert rec.score >= 0.0
+
+    objective = optimizer._objective
+    params = {
+        "min_samples_leaf": 10,
+        "max_leaf_nodes": 500,
+        "max_samples": 1.0,
+        "limit": 100,
+    }
+    args = optimizer._objective_args
+    values = list(objective.evaluate_steps(params, args))
+    assert len(values) == len(objective.step_sizes(len(args["gold_subjects"])))
+    assert all(0.0 <= value <= 1.0 for value in values)
+
+
 def test_mllm_train_cached_no_data(datadir, project):
     modelfile = datadir.join("mllm-model.gz")
     assert modelfile.exists()
-    trainfile = datadir.join("mllm-train.gz")
+    trainfile = datadir.join("mllm-train-x.npy")
     trainfile.remove()
 
     mllm_type = annif.backend.get_backend("mllm")
@@ -1,14 +1,25 @@
 """Unit tests for the nn_ensemble backend in Annif"""
 
+import subprocess
+import sys
 import time
 from datetime import datetime, timedelta, timezone
+from io import BytesIO
 from unittest import mock
 
+import joblib
+import numpy as np
 import py.path
 import pytest
+from scipy.sparse import csr_array, csr_matrix
 
 import annif.backend
-from annif.corpus import Document, DocumentFileTSV, LimitingDocumentCorpus
+from annif.corpus import (
+    Document,
+    DocumentFileTSV,
+    LimitingDocumentCorpus,
+    SubjectSet,
+)
 from annif.exception import (
     NotInitializedException,
     NotSupportedException,
@@ -26,6 +37,149 @@ def test_lmdb_idx_to_key_to_idx():
     assert annif.backend.nn_ensemble.key_to_idx(b"00000042") == 42
 
 
+def test_encode_decode_sample():
+    inputs = np.array([[0.0, 0.5, 0.0, 0.25], [0.75, 0.0, 0.0, 0.0]])
+    targets = np.array([False, True, False, True])
+    sample = annif.backend.nn_ensemble.decode_sample(
+        annif.backend.nn_ensemble.encode_sample(inputs, targets)
+    )
+    assert (sample.n_sources, sample.n_subjects) == (2, 4)
+    decoded = np.zeros((2, 4), dtype=np.float32)
+    decoded[sample.input_rows, sample.input_cols] = sample.input_values
+    assert np.array_equal(decoded, inputs)
+    assert list(sample.target_cols) == [1, 3]
+
+
+def test_encode_batch():
+    nn_ensemble = annif.backend.nn_ensemble
+    rng = np.random.default_rng(42)
+    arrays = [
+        csr_array(rng.random((3, 6)) * (rng.random((3, 6)) > 0.6), dtype=np.float32)
+        for _ in range(2)
+    ]
+    subject_sets = [SubjectSet([4, 1]), SubjectSet(), SubjectSet([0])]
+    encoded = nn_ensemble.encode_batch(arrays, subject_sets)
+    assert len(encoded) == 3
+    for idx, subject_set in enumerate(subject_sets):
+        inputs = np.stack([array.toarray()[idx] for array in arrays])
+        targets = subject_set.as_vector(6)
+        assert encoded[idx] == nn_ensemble.encode_sample(inputs, targets)
+
+
+def test_import_without_torch():
+    code = (
+        "import sys, annif.backend.nn_ensemble; " + "assert 'torch' not in sys.modules"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_lmdb_dataset_legacy_sample(tmpdir):
+    nn_ensemble_torch = pytest.importorskip("annif.backend.nn_ensemble_torch")
+    inputs = np.array([[0.0, 0.5, 0.0, 0.25], [0.75, 0.0, 0.0, 0.0]], dtype=np.float32)
+    targets = np.array([False, True, False, True])
+    buf = BytesIO()
+    joblib.dump((csr_matrix(inputs), csr_matrix(targets)), buf)
+
+    env = lmdb.open(str(tmpdir.join("legacy.mdb")))
+    with env.begin(write=True, buffers=True) as txn:
+        txn.put(annif.backend.nn_ensemble.idx_to_key(0), buf.getvalue())
+        dataset = nn_ensemble_torch.LMDBDataset(txn)
+        dataset.add_sample(inputs, targets)
+    with env.begin(buffers=True) as txn:
+        dataset = nn_ensemble_torch.LMDBDataset(txn)
+        assert len(dataset) == 2
+        legacy_inputs, legacy_targets = dataset[0]
+        new_inputs, new_targets = dataset[1]
+    assert np.allclose(legacy_inputs.numpy(), np.log1p(inputs))
+    assert np.allclose(new_inputs.numpy(), np.log1p(inputs))
+    assert np.allclose(legacy_targets.numpy(), np.log1p(targets.astype(np.float32)))
+    assert np.allclose(new_targets.numpy(), np.log1p(targets.astype(np.float32)))
+
+
+def test_sparse_loss_matches_dense():
+    torch = pytest.importorskip("torch")
+    nn_ensemble = annif.backend.nn_ensemble
+    nn_ensemble_torch = pytest.importorskip("annif.backend.nn_ensemble_torch")
+    rng = np.random.default_rng(42)
+    model = nn_ensemble_torch.NNEnsembleModel(
+        n_sources=2, n_subjects=10, source_weights=[0.7, 0.3]
+    )
+    with torch.no_grad():
+        model.weights.add_(torch.from_numpy(rng.random((2, 10), dtype=np.float32)))
+        model.bias_delta.add_(torch.from_numpy(rng.random(10, dtype=np.float32)))
+    samples = []
+    for _ in range(4):
+        inputs = rng.random((2, 10)) * (rng.random((2, 10)) > 0.7)
+        targets = rng.random(10) > 0.8
+        samples.append(
+            nn_ensemble.decode_sample(nn_ensemble.encode_sample(inputs, targets))
+        )
+    batch = nn_ensemble_torch.collate_samples(samples)
+    dense_inputs, dense_targets = zip(
+        *[
+            nn_ensemble_torch.LMDBDataset._sample_to_tensors(sample)
+            for sample in samples
+        ]
+    )
+    dense_inputs = torch.stack(dense_inputs)
+    dense_targets = torch.stack(dense_targets)
+
+    dense_outputs = model(dense_inputs)
+    assert torch.allclose(model.forward_sparse(batch), dense_outputs)
+
+    dense_loss = torch.nn.BCEWithLogitsLoss()(dense_outputs, dense_targets)
+    dense_loss.backward()
+    dense_grads = [param.grad.clone() for param in model.parameters()]
+    model.zero_grad()
+    sparse_loss = model.sparse_loss(batch)
+    sparse_loss.backward()
+    assert torch.allclose(sparse_loss, dense_loss)
+    for param, dense_grad in zip(model.parameters(), dense_grads):
+        assert torch.allclose(param.grad, dense_grad, atol=1e-6)
+
+
+def test_predictor_matches_dense_model(tmpdir):
+    torch = pytest.importorskip("torch")
+    nn_ensemble = annif.backend.nn_ensemble
+    nn_ensemble_torch = pytest.importorskip("annif.backend.nn_ensemble_torch")
+    rng = np.random.default_rng(42)
+    n_docs, n_subjects, limit = 5, 50, 10
+    model = nn_ensemble_torch.NNEnsembleModel(
+        n_sources=2, n_subjects=n_subjects, source_weights=[0.7, 0.3]
+    )
+    with torch.no_grad():
+        model.weights.add_(torch.from_numpy(rng.random((2, n_subjects)) * 0.1).float())
+        model.bias_delta.add_(torch.from_numpy(rng.random(n_subjects) * -0.5).float())
+    arrays = [
+        csr_array(
+            rng.random((n_docs, n_subjects)) * (rng.random((n_docs, n_subjects)) > 0.9),
+            dtype=np.float32,
+        )
+        for _ in range(2)
+    ]
+
+    predictor = nn_ensemble.NNEnsemblePredictor.from_arrays(
+        model.export_arrays(), scale=20
+    )
+    predictor.save(str(tmpdir.join("model.npz")))
+    predictor = nn_ensemble.NNEnsemblePredictor.load(
+        str(tmpdir.join("model.npz")), scale=20
+    )
+    results = predictor.predict(arrays, limit=limit)
+
+    dense_inputs = torch.log1p(
+        torch.from_numpy(np.stack([arr.toarray() for arr in arrays], axis=1))
+    )
+    with torch.no_grad():
+        dense_scores = torch.sigmoid(model(dense_inputs) * 20).numpy()
+    for result, doc_scores in zip(results, dense_scores):
+        assert len(result) == limit
+        expected = np.sort(doc_scores)[::-1][:limit]
+        assert np.allclose([sugg.score for sugg in result], expected, atol=1e-6)
+        for sugg in result:
+            assert np.isclose(doc_scores[sugg.subject_id], sugg.score, atol=1e-6)
+
+
 def test_nn_ensemble_initialize_parallel(project):
     nn_ensemble_type = annif.backend.get_backend("nn_ensemble")
     nn_ensemble = nn_ensemble_type(
@@ -34,7 +188,7 @@ def test_nn_ensemble_initialize_parallel(project):
 
     nn_ensemble.initialize(parallel=True)
     # model is still not loaded since we're preparing for parallel execution
-    assert nn_ensemble._model is None
+    assert nn_ensemble._predictor is None
 
 
 def test_nn_ensemble_suggest_no_model(project):
@@ -105,6 +259,7 @@ def test_nn_ensemble_train_and_learn(registry, tmpdir):
 
     assert datadir.join("nn-model.pt").exists()
     assert datadir.join("nn-model.pt").size() > 0
+    assert datadir.join("nn-model.npz").exists()
 
     # test online learning
     modelfile = datadir.join("nn-model.pt")
@@ -170,6 +325,53 @@ def test_nn_ensemble_train_and_learn_params(registry, tmpdir, capfd):
     assert "Epoch 2/2" in err
 
 
+def test_nn_ensemble_train_sparse(registry, tmpdir):
+    project = registry.get_project("dummy-en")
+    nn_ensemble_type = annif.backend.get_backend("nn_ensemble")
+    nn_ensemble = nn_ensemble_type(
+        backend_id="nn_ensemble",
+        config_params={
+            "sources": "dummy-en",
+            "max-epochs": 2,
+            "sparse-training": True,
+        },
+        project=project,
+    )
+
+    tmpfile = tmpdir.join("document.tsv")
+    tmpfile.write(
+        "dummy\thttp://example.org/dummy\n"
+        + "another\thttp://example.org/dummy\n"
+        + "none\thttp://example.org/none\n" * 40
+    )
+    document_corpus = DocumentFileTSV(str(tmpfile), project.subjects)
+    datadir = py.path.local(project.datadir)
+
+    nn_ensemble.train(document_corpus)
+    assert datadir.join("nn-model.pt").exists()
+    assert datadir.join("nn-model.pt").size() > 0
+
+
+def test_nn_ensemble_initialize_legacy_model(registry):
+    # a model trained before the arrays were exported has only the .pt file
+    project = registry.get_project("dummy-en")
+    datadir = py.path.local(project.datadir)
+    arrays_file = datadir.join("nn-model.npz")
+    arrays_file.move(datadir.join("nn-model.npz.bak"))
+
+    try:
+        nn_ensemble_type = annif.backend.get_backend("nn_ensemble")
+        nn_ensemble = nn_ensemble_type(
+            backend_id="nn_ensemble",
+            config_params={"sources": "dummy-en"},
+            project=project,
+        )
+        nn_ensemble.initialize()
+        assert nn_ensemble._predictor is not None
+    finally:
+        datadir.join("nn-model.npz.bak").move(arrays_file)
+
+
 def test_nn_ensemble_is_trained(app_project):
     nn_ensemble_type = annif.backend.get_backend("nn_ensemble")
     nn_ensemble = nn_ensemble_type(
@@ -190,7 +392,7 @@ def test_nn_ensemble_modification_time(app_project):
     assert datetime.now(timezone.utc) - nn_ensemble.modification_time < timedelta(1)
 
 
-@mock.patch("annif.backend.nn_ensemble.NNEnsembleModel.load", side_effect=Exception)
+@mock.patch("annif.backend.nn_ensemble.NNEnsemblePredictor.load", side_effect=Exception)
 def test_nn_ensemble_initialize_error(load, app_project):
     nn_ensemble_type = annif.backend.get_backend("nn_ensemble")
     nn_ensemble = nn_ensemble_type(
@@ -198,7 +400,7 @@ def test_nn_ensemble_initialize_error(load, app_project):
         config_params={"sources": "dummy-en"},
         project=app_project,
     )
-    assert nn_ensemble._model is None
+    assert nn_ensemble._predictor is None
     with pytest.raises(
         OperationFailedException,
         match=r"loading model from .*; original error message: .*",
@@ -215,9 +417,9 @@ def test_nn_ensemble_initialize(app_project):
         project=app_project,
     )
 
-    assert nn_ensemble._model is None
+    assert nn_ensemble._predictor is None
     nn_ensemble.initialize()
-    assert nn_ensemble._model is not None
+    assert nn_ensemble._predictor is not None
     # initialize a second time - this shouldn't do anything
     nn_ensemble.initialize()
 
@@ -248,6 +450,20 @@ def test_nn_ensemble_train_nodocuments(project, empty_corpus):
         nn_ensemble.train(empty_corpus)
 
 
+def test_nn_ensemble_train_without_torch(project, empty_corpus, monkeypatch):
+    # make importing the PyTorch based parts of the backend fail
+    monkeypatch.delattr(annif.backend, "nn_ensemble_torch", raising=False)
+    monkeypatch.setitem(sys.modules, "annif.backend.nn_ensemble_torch", None)
+
+    nn_ensemble_type = annif.backend.get_backend("nn_ensemble")
+    nn_ensemble = nn_ensemble_type(
+        backend_id="nn_ensemble", config_params={"sources": "dummy-en"}, project=project
+    )
+    with pytest.raises(NotSupportedException) as excinfo:
+        nn_ensemble.train(empty_corpus)
+    assert "PyTorch not available" in str(excinfo.value)
+
+
 def test_nn_ensemble_suggest(app_project):
     nn_ensemble_type = annif.backend.get_backend("nn_ensemble")
     nn_ensemble = nn_ensemble_type(
@@ -269,5 +485,5 @@ def test_nn_ensemble_suggest(app_project):
         ]
     )[0]
 
-    assert nn_ensemble._model is not None
+    assert nn_ensemble._predictor is not None
     assert len(results) > 0
@@ -3,14 +3,42 @@
 import logging
 from datetime import datetime, timedelta, timezone
 
+import joblib
+import numpy as np
 import py.path
 import pytest
+from scipy.sparse import csr_array
+from sklearn.isotonic import IsotonicRegression
 
 import annif.backend
+from annif.backend.pav import PAVCalibrator
 from annif.corpus import Document, DocumentFileTSV
 from annif.exception import NotSupportedException
 
 
+def test_pav_calibrator_matches_isotonic_regression(tmpdir):
+    rng = np.random.default_rng(42)
+    regressions = {}
+    for subject_id in (1, 4, 5):
+        reg = IsotonicRegression(out_of_bounds="clip")
+        scores = rng.random(20) * 0.8 + 0.1
+        reg.fit(scores, rng.random(20) < scores)
+        regressions[subject_id] = reg
+    scores = rng.random((4, 8)) * (rng.random((4, 8)) > 0.3)
+    array = csr_array(scores, dtype=np.float32)
+
+    joblib.dump(regressions, str(tmpdir.join("legacy")))
+    calibrator = PAVCalibrator.load(str(tmpdir.join("legacy")))
+    assert len(calibrator) == 3
+    calibrated = calibrator.calibrate(array).toarray()
+
+    expected = array.toarray()
+    for subject_id, reg in regressions.items():
+        nonzero = expected[:, subject_id] > 0
+        expected[nonzero, subject_id] = reg.predict(expected[nonzero, subject_id])
+    assert np.allclose(calibrated, expected)
+
+
 def test_pav_default_params(document_corpus, app_project):
     pav_type = annif.backend.get_backend("pav")
     pav = pav_type(backend_id="pav", config_params={}, project=app_project)
@@ -56,6 +84,27 @@ def test_pav_train(tmpdir, app_project):
     assert datadir.join("pav-model-dummy-fi").size() > 0
 
 
+def test_pav_train_parallel(tmpdir, app_project):
+    pav_type = annif.backend.get_backend("pav")
+    pav = pav_type(
+        backend_id="pav",
+        config_params={"limit": 50, "min-docs": 2, "sources": "dummy-fi"},
+        project=app_project,
+    )
+
+    tmpfile = tmpdir.join("document.tsv")
+    tmpfile.write(
+        "dummy\thttp://example.org/dummy\n"
+        + "another\thttp://example.org/dummy\n"
+        + "none\thttp://example.org/none"
+    )
+    document_corpus = DocumentFileTSV(str(tmpfile), app_project.subjects)
+
+    pav.train(document_corpus, jobs=2)
+    pav.initialize()
+    assert len(pav._models["dummy-fi"]) == 1
+
+
 def test_pav_train_cached(app_project):
     pav_type = annif.backend.get_backend("pav")
     pav = pav_type(
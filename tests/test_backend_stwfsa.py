@@ -3,6 +3,7 @@ import pytest
 from annif.backend import get_backend
 from annif.corpus import Document, DocumentList
 from annif.exception import NotInitializedException, NotSupportedException
+from annif.vocab import SubjectIndexFilter
 
 stwfsa = pytest.importorskip("annif.backend.stwfsa")
 
@@ -117,3 +118,50 @@ def test_stwfsa_suggest(project, datadir):
     assert len(results) == 10
     labyrinths = project.subjects.by_uri("http://www.yso.fi/onto/yso/p14174")
     assert labyrinths in [result.subject_id for result in results]
+
+
+def test_stwfsa_suggest_batch(project):
+    stwfsa_type = get_backend(stwfsa_backend_name)
+    stwfsa = stwfsa_type(
+        backend_id=stwfsa_backend_name, config_params={"limit": 10}, project=project
+    )
+    docs = [
+        Document(text="labyrintit random zikkuratit"),
+        Document(text="1234"),
+        Document(text="makrofossiilit random termoluminesenssi"),
+    ]
+    batch = stwfsa.suggest(docs)
+    assert len(batch) == 3
+    assert len(batch[1]) == 0
+    for doc, results in zip(docs, batch):
+        single = stwfsa.suggest([doc])[0]
+        assert [(r.subject_id, r.score) for r in results] == [
+            (r.subject_id, r.score) for r in single
+        ]
+    labyrinths = project.subjects.by_uri("http://www.yso.fi/onto/yso/p14174")
+    assert labyrinths in [result.subject_id for result in batch[0]]
+
+
+def test_stwfsa_suggest_with_exclude(project, monkeypatch):
+    stwfsa_type = get_backend(stwfsa_backend_name)
+    doc = Document(
+        text="labyrintit random zikkuratit makrofossiilit termoluminesenssi "
+        + "Indus-kulttuuri muinais-DNA"
+    )
+    stwfsa = stwfsa_type(
+        backend_id=stwfsa_backend_name, config_params={"limit": 2}, project=project
+    )
+    top_subjects = [result.subject_id for result in stwfsa.suggest([doc])[0]]
+    assert len(top_subjects) == 2
+
+    excluded_uri = project.subjects[top_subjects[0]].uri
+    monkeypatch.setattr(
+        project, "subjects", SubjectIndexFilter(project.subjects, {excluded_uri})
+    )
+    stwfsa = stwfsa_type(
+        backend_id=stwfsa_backend_name, config_params={"limit": 2}, project=project
+    )
+    results = [result.subject_id for result in stwfsa.suggest([doc])[0]]
+    # the excluded subject does not take up a place within the limit
+    assert len(results) == 2
+    assert top_subjects[0] not in results
@@ -4,7 +4,11 @@ import pytest
 
 import annif.backend
 from annif.corpus import Document
-from annif.exception import NotInitializedException, NotSupportedException
+from annif.exception import (
+    ConfigurationException,
+    NotInitializedException,
+    NotSupportedException,
+)
 
 
 def test_svc_default_params(project):
@@ -51,6 +55,41 @@ def test_svc_train_ngram(datadir, document_corpus, project):
     assert datadir.join("svc-model.gz").exists()
 
 
+def test_svc_train_uncompressed(datadir, document_corpus, project):
+    svc_type = annif.backend.get_backend("svc")
+    svc = svc_type(
+        backend_id="svc",
+        config_params={"serialization": "uncompressed"},
+        project=project,
+    )
+
+    svc.train(document_corpus)
+    assert datadir.join("svc-model.joblib").exists()
+    assert not datadir.join("svc-model.gz").exists()
+
+    svc = svc_type(
+        backend_id="svc", config_params={"serialization": "mmap"}, project=project
+    )
+    results = svc.suggest([Document(text="Arkeologiaa sanotaan joskus myös...")])[0]
+    assert len(results) > 0
+
+    # restore the compressed model used by the other tests
+    svc = svc_type(backend_id="svc", config_params={}, project=project)
+    svc.train(document_corpus)
+    assert datadir.join("svc-model.gz").exists()
+    assert not datadir.join("svc-model.joblib").exists()
+
+
+def test_svc_invalid_serialization(datadir, project):
+    svc_type = annif.backend.get_backend("svc")
+    svc = svc_type(
+        backend_id="svc", config_params={"serialization": "invalid"}, project=project
+    )
+
+    with pytest.raises(ConfigurationException):
+        svc.suggest([Document(text="example text")])
+
+
 def test_svc_train_cached(datadir, project):
     svc_type = annif.backend.get_backend("svc")
     svc = svc_type(backend_id="svc", config_params={}, project=project)
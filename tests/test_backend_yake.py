@@ -1,15 +1,30 @@
 """Unit tests for the Yake backend in Annif"""
 
+import gc
+import multiprocessing
+
+import py.path
 import pytest
 
 import annif
 import annif.backend
 from annif.corpus import Document
-from annif.exception import ConfigurationException, NotSupportedException
+from annif.exception import ConfigurationException, NotInitializedException
 
 pytest.importorskip("annif.backend.yake")
 
 
+@pytest.fixture(scope="module")
+def yake_index(project, document_corpus):
+    """Build the label index into the data directory shared by the tests of
+    this module"""
+    yake_type = annif.backend.get_backend("yake")
+    yake = yake_type(
+        backend_id="yake", config_params={"language": "fi"}, project=project
+    )
+    yake.train(document_corpus)
+
+
 def test_invalid_label_type(project):
     yake_type = annif.backend.get_backend("yake")
     yake = yake_type(
@@ -18,10 +33,35 @@ def test_invalid_label_type(project):
         project=project,
     )
     with pytest.raises(ConfigurationException):
+        yake.train("cached")
+
+
+def test_yake_suggest_not_trained(project, tmpdir):
+    yake_type = annif.backend.get_backend("yake")
+    yake = yake_type(
+        backend_id="yake", config_params={"language": "fi"}, project=project
+    )
+    yake.datadir = str(tmpdir)  # no index in an empty data directory
+
+    with pytest.raises(NotInitializedException):
         yake.suggest([Document(text="example text")])
 
 
-def test_yake_suggest(project):
+def test_yake_train(project, document_corpus):
+    yake_type = annif.backend.get_backend("yake")
+    yake = yake_type(
+        backend_id="yake", config_params={"language": "fi"}, project=project
+    )
+    yake.train(document_corpus, jobs=2)
+
+    assert yake.is_trained
+    assert yake._index == yake._create_index()
+    datadir = py.path.local(project.datadir)
+    assert datadir.join("yake-index").exists()
+    assert datadir.join("yake-index").size() > 0
+
+
+def test_yake_suggest(project, yake_index):
     yake_type = annif.backend.get_backend("yake")
     yake = yake_type(
         backend_id="yake", config_params={"limit": 8, "language": "fi"}, project=project
@@ -46,7 +86,72 @@ def test_yake_suggest(project):
     assert archaeology in [result.subject_id for result in results]
 
 
-def test_yake_suggest_no_input(project):
+def test_yake_suggest_parallel(project, yake_index):
+    yake_type = annif.backend.get_backend("yake")
+    yake = yake_type(
+        backend_id="yake", config_params={"limit": 8, "language": "fi"}, project=project
+    )
+    docs = [
+        Document(text="Arkeologia on tieteenala, joka tutkii muinaisjäännöksiä."),
+        Document(
+            text="Kalliomaalaukset ja luolamaalaukset ovat esihistoriallista taidetta."
+        ),
+    ]
+
+    serial = yake.suggest(docs)
+    parallel = yake.suggest(docs, params={"extract_jobs": 2})
+    assert serial.array.nnz > 0
+    assert (serial.array != parallel.array).nnz == 0
+    assert len(yake._extractors) == 1
+
+    # the process pool is reused for later batches
+    pool = next(iter(yake._extract_pools.values()))
+    parallel = yake.suggest(docs, params={"extract_jobs": 2})
+    assert (serial.array != parallel.array).nnz == 0
+    assert list(yake._extract_pools.values()) == [pool]
+
+    # the pool is terminated when the backend is no longer used
+    del yake
+    gc.collect()
+    with pytest.raises(ValueError):
+        pool.map(abs, [-1, -2])
+
+
+def test_yake_suggest_parallel_in_daemon_process(project, yake_index, monkeypatch):
+    yake_type = annif.backend.get_backend("yake")
+    yake = yake_type(
+        backend_id="yake", config_params={"limit": 8, "language": "fi"}, project=project
+    )
+    docs = [
+        Document(text="Arkeologia on tieteenala, joka tutkii muinaisjäännöksiä."),
+        Document(
+            text="Kalliomaalaukset ja luolamaalaukset ovat esihistoriallista taidetta."
+        ),
+    ]
+    serial = yake.suggest(docs)
+
+    # daemonic processes can't start a pool, so extraction falls back to serial
+    monkeypatch.setattr(multiprocessing.current_process(), "daemon", True)
+    parallel = yake.suggest(docs, params={"extract_jobs": 2})
+    assert (serial.array != parallel.array).nnz == 0
+    assert not yake._extract_pools
+
+
+def test_yake_legacy_uri_index(project):
+    yake_type = annif.backend.get_backend("yake")
+    yake = yake_type(
+        backend_id="yake", config_params={"language": "fi"}, project=project
+    )
+    legacy_index = {
+        "arkeolog": {"http://www.yso.fi/onto/yso/p1265"},
+        "tuntematon": {"http://example.org/unknown"},
+    }
+    index = yake._resolve_uris(legacy_index)
+    archaeology = project.subjects.by_uri("http://www.yso.fi/onto/yso/p1265")
+    assert index == {"arkeolog": {archaeology}}
+
+
+def test_yake_suggest_no_input(project, yake_index):
     yake_type = annif.backend.get_backend("yake")
     yake = yake_type(
         backend_id="yake", config_params={"limit": 8, "language": "fi"}, project=project
@@ -139,13 +244,3 @@ def test_combine_scores(project):
     assert yake._combine_scores(1.0, 0.0) == 1.0
     assert yake._combine_scores(0.4, 0.3) == 0.625
     assert yake._combine_scores(0.4, 0.5) == 0.75
-
-
-def test_yake_train(project, document_corpus):
-    yake_type = annif.backend.get_backend("yake")
-    yake = yake_type(
-        backend_id="yake", config_params={"language": "fi"}, project=project
-    )
-
-    with pytest.raises(NotSupportedException):
-        yake.train(document_corpus)
@@ -1312,6 +1312,39 @@ def test_eval_resultsfile(tmpdir):
     assert round(f_measure_numerator / denominator, 4) == f_measure
 
 
+def test_eval_incremental(tmpdir):
+    tmpdir.join("doc1.txt").write("doc1")
+    tmpdir.join("doc1.key").write("dummy")
+    tmpdir.join("doc2.txt").write("doc2")
+    tmpdir.join("doc2.key").write("none")
+    tmpdir.join("doc3.txt").write("doc3")
+    resultfile = tmpdir.join("results.tsv")
+    incremental_resultfile = tmpdir.join("incremental.tsv")
+    result = runner.invoke(
+        annif.cli.cli,
+        ["eval", "--results-file", str(resultfile), "dummy-en", str(tmpdir)],
+    )
+    assert not result.exception
+    incremental_result = runner.invoke(
+        annif.cli.cli,
+        [
+            "eval",
+            "--incremental",
+            "--results-file",
+            str(incremental_resultfile),
+            "dummy-en",
+            str(tmpdir),
+        ],
+    )
+    assert not incremental_result.exception
+    assert incremental_result.exit_code == 0
+    assert (
+        incremental_result.output.replace(str(incremental_resultfile), str(resultfile))
+        == result.output
+    )
+    assert incremental_resultfile.read() == resultfile.read()
+
+
 def test_eval_badresultsfile(tmpdir):
     tmpdir.join("doc1.txt").write("doc1")
     tmpdir.join("doc1.key").write("dummy")
@@ -1421,6 +1454,49 @@ def test_optimize_dir(tmpdir):
     assert int(ndocs.group(1)) == 2
 
 
+def test_generate_filter_params():
+    params = annif.cli_util.generate_filter_params(2)
+    assert len(params) == 2 * 20
+    assert params[:2] == [(1, 0.0), (1, 0.05)]
+    assert params[-1] == (2, pytest.approx(0.95))
+
+    # the step doesn't need to divide 1 evenly
+    thresholds = [t for _, t in annif.cli_util.generate_filter_params(1, 0.3)]
+    assert thresholds == pytest.approx([0.0, 0.3, 0.6, 0.9])
+    thresholds = [t for _, t in annif.cli_util.generate_filter_params(1, 0.07)]
+    assert len(thresholds) == 15
+    assert thresholds[-1] == pytest.approx(0.98)
+    assert [t for _, t in annif.cli_util.generate_filter_params(1, 1.0)] == [0.0]
+
+
+def test_optimize_finer_grid(tmpdir):
+    tmpdir.join("doc1.txt").write("doc1")
+    tmpdir.join("doc1.key").write("dummy")
+    tmpdir.join("doc2.txt").write("doc2")
+    tmpdir.join("doc2.key").write("none")
+
+    result = runner.invoke(
+        annif.cli.cli,
+        [
+            "optimize",
+            "--max-limit",
+            "20",
+            "--threshold-step",
+            "0.01",
+            "dummy-en",
+            str(tmpdir),
+        ],
+    )
+    assert not result.exception
+    assert result.exit_code == 0
+
+    rows = re.findall(r"^\d+\t\d\.\d+\t", result.output, re.MULTILINE)
+    assert len(rows) == 20 * 100
+    assert "20\t0.99\t" in result.output
+    f_measure = re.search(r"Best\s+F1 score .*?doc.*?:\s+(\d.\d+)", result.output)
+    assert float(f_measure.group(1)) == pytest.approx(0.5)
+
+
 def test_optimize_docfile(tmpdir):
     docfile = tmpdir.join("documents.tsv")
     docfile.write(
@@ -1488,6 +1564,38 @@ def test_hyperopt_ensemble_resultsfile(tmpdir):
             assert int(parts[0]) == idx
 
 
+def test_hyperopt_ensemble_pruner(tmpdir):
+    for idx in range(8):
+        tmpdir.join(f"doc{idx}.txt").write(f"doc{idx}")
+        tmpdir.join(f"doc{idx}.key").write("dummy" if idx % 2 else "none")
+    resultfile = tmpdir.join("results.tsv")
+
+    result = runner.invoke(
+        annif.cli.cli,
+        [
+            "hyperopt",
+            "--pruner",
+            "median",
+            "--results-file",
+            str(resultfile),
+            "ensemble",
+            str(tmpdir),
+        ],
+    )
+    assert not result.exception
+    assert result.exit_code == 0
+
+    with resultfile.open() as f:
+        header = next(f)
+        assert header.strip("\n") == "\t".join(
+            ["trial", "value", "dummy-en", "dummy-private", "state", "steps"]
+        )
+        for line in f:
+            parts = line.strip("\n").split("\t")
+            assert parts[4] in ("complete", "pruned")
+            assert 1 <= int(parts[5]) <= 3
+
+
 def test_hyperopt_not_supported(tmpdir):
     tmpdir.join("doc1.txt").write("doc1")
     tmpdir.join("doc1.key").write("dummy")
@@ -133,6 +133,13 @@ def test_subjectset_as_vector_destination(subject_index):
     assert vector is destination
 
 
+def test_subjectset_as_array():
+    array = annif.corpus.SubjectSet([5, 1, 3, 1]).as_array()
+    assert array.dtype == np.int32
+    assert sorted(array) == [1, 3, 5]
+    assert len(annif.corpus.SubjectSet().as_array()) == 0
+
+
 def test_docdir_key(tmpdir):
     tmpdir.join("doc1.txt").write("doc1")
     tmpdir.join("doc1.key").write("key1")
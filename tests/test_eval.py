@@ -1,9 +1,12 @@
 """Unit tests for evaluation metrics in Annif"""
 
+import numpy as np
+import pytest
 from scipy.sparse import csr_array
 
 import annif.corpus
 import annif.eval
+import annif.exception
 import annif.suggestion
 
 
@@ -94,6 +97,57 @@ def test_ndcg_5():
     assert ndcg < 0.86
 
 
+def _row_dcg_score(y_true, y_pred, limit=None):
+    # the former implementation of dcg_score for a single row, using a
+    # stable sort so that tied scores are ranked deterministically
+    n_pred = y_pred.count_nonzero()
+    if limit is not None:
+        n_pred = min(limit, n_pred)
+    top_k = y_pred.data.argsort(kind="stable")[-n_pred:][::-1]
+    order = y_pred.indices[top_k]
+    gain = y_true[:, order]
+    discount = np.log2(np.arange(1, n_pred + 1) + 1)
+    return (gain / discount).sum()
+
+
+def test_ndcg_multiple_rows_with_ties():
+    rng = np.random.default_rng(42)
+    y_true = csr_array(rng.random((20, 30)) < 0.2)
+    # few distinct score values, so that most rows have tied scores
+    y_pred = csr_array(rng.integers(0, 4, (20, 30)) / 4)
+    for limit in (None, 5, 10):
+        per_row = []
+        for i in range(20):
+            true, pred = y_true[[i]], y_pred[[i]]
+            idcg = _row_dcg_score(true, true, limit)
+            per_row.append(_row_dcg_score(true, pred, limit) / idcg if idcg else 1)
+        ndcg = annif.eval.ndcg_score(y_true, y_pred, limit)
+        assert ndcg == pytest.approx(np.mean(per_row))
+
+
+def test_ndcg_ties():
+    y_true = csr_array([[1, 0, 0], [0, 1, 1]])
+    y_pred = csr_array([[0.5, 0.5, 0], [0.3, 0.3, 0.3]])
+    assert annif.eval.ndcg_score(y_true, y_pred) == pytest.approx(0.8155, abs=1e-4)
+
+
+def test_subject_sets_to_array():
+    subject_sets = [
+        annif.corpus.SubjectSet([4, 0]),
+        annif.corpus.SubjectSet(),
+        annif.corpus.SubjectSet([2]),
+    ]
+    array = annif.eval.subject_sets_to_array(subject_sets, 5)
+    assert array.dtype == bool
+    assert array.has_sorted_indices
+    assert array.toarray().tolist() == [
+        [True, False, False, False, True],
+        [False, False, False, False, False],
+        [False, False, True, False, False],
+    ]
+    assert annif.eval.subject_sets_to_array([], 5).shape == (0, 5)
+
+
 def test_ndcg_empty():
     y_true = csr_array([[1, 1, 1, 1, 1]])
     y_pred = csr_array([[0, 0, 0, 0, 0]])
@@ -158,3 +212,82 @@ def test_evaluation_batch(subject_index, tmpdir):
         )
         + "\n"
     )
+
+
+def test_incremental_evaluation_batch(subject_index, tmpdir):
+    rng = np.random.default_rng(42)
+    n_subjects = len(subject_index)
+    batch = annif.eval.EvaluationBatch(subject_index)
+    incremental = annif.eval.IncrementalEvaluationBatch(subject_index)
+    for _ in range(4):
+        scores = rng.random((10, n_subjects))
+        scores[scores < 0.95] = 0.0
+        scores[0] = 0.0  # a document without suggestions
+        suggestions = annif.suggestion.SuggestionBatch(
+            csr_array(scores, dtype=np.float32)
+        )
+        gold_sets = [
+            annif.corpus.SubjectSet(
+                rng.choice(n_subjects, size=rng.integers(0, 4), replace=False).tolist()
+            )
+            for _ in range(10)
+        ]
+        batch.evaluate_many(suggestions, gold_sets)
+        incremental.evaluate_many(suggestions, gold_sets)
+
+    outfile = tmpdir.join("results.tsv")
+    incremental_outfile = tmpdir.join("incremental.tsv")
+    results = batch.results(results_file=outfile.open("w"), language="en")
+    incremental_results = incremental.results(
+        results_file=incremental_outfile.open("w"), language="en"
+    )
+    assert list(incremental_results) == list(results)
+    assert incremental_results == pytest.approx(results)
+    assert incremental_outfile.read() == outfile.read()
+
+
+def test_incremental_evaluation_batch_selected_metrics(subject_index):
+    incremental = annif.eval.IncrementalEvaluationBatch(subject_index)
+    with pytest.raises(annif.exception.NotSupportedException):
+        incremental.results()
+
+    gold_set = annif.corpus.SubjectSet.from_string(
+        "<http://www.yso.fi/onto/yso/p10849>\tarkeologit", subject_index, "fi"
+    )
+    hits = [
+        annif.suggestion.SubjectSuggestion(
+            subject_id=subject_index.by_uri("http://www.yso.fi/onto/yso/p10849"),
+            score=1.0,
+        )
+    ]
+    incremental.evaluate_many([hits], [gold_set])
+    results = incremental.results(metrics=["NDCG", "True positives"])
+    assert results == {"NDCG": 1.0, "True positives": 1, "Documents evaluated": 1}
+
+
+def test_evaluate_filter_params():
+    rng = np.random.default_rng(42)
+    # round the scores to get ties
+    scores = np.round(rng.random((50, 40)) * (rng.random((50, 40)) > 0.7), 1)
+    y_pred = annif.suggestion.filter_suggestion(csr_array(scores), limit=8)
+    y_true = csr_array(rng.random((50, 40)) > 0.9)
+    filter_params = [
+        (limit, threshold) for limit in (1, 3, 8) for threshold in (0.0, 0.3, 0.55)
+    ]
+
+    results = annif.eval.evaluate_filter_params(y_true, y_pred, filter_params)
+    assert list(results) == filter_params
+    for (limit, threshold), scores in results.items():
+        expected = annif.eval.evaluate_samples(
+            y_true,
+            annif.suggestion.filter_suggestion(y_pred, limit, threshold),
+            list(scores),
+        )
+        assert scores == pytest.approx(expected)
+
+
+def test_evaluate_filter_params_empty():
+    with pytest.raises(annif.exception.NotSupportedException):
+        annif.eval.evaluate_filter_params(
+            csr_array((0, 5), dtype=bool), csr_array((0, 5)), [(1, 0.0)]
+        )
@@ -4,7 +4,7 @@ import numpy as np
 import pytest
 
 from annif.exception import OperationFailedException
-from annif.lexical.mllm import MLLMModel
+from annif.lexical.mllm import MLLMModel, TreeEnsemble, create_classifier
 
 
 def test_mllmmodel_prepare_terms(vocabulary):
@@ -65,3 +65,18 @@ def test_train_sanity_check():
 
     with pytest.raises(OperationFailedException):
         model.train(train_x, train_y, params)
+
+
+def test_tree_ensemble_matches_classifier():
+    rng = np.random.default_rng(42)
+    train_x = rng.random((500, 15), dtype=np.float32)
+    train_y = train_x[:, 0] + 0.2 * rng.random(500) > 0.6
+    params = {"min_samples_leaf": 5, "max_leaf_nodes": 50, "max_samples": 0.9}
+    classifier = create_classifier(params)
+    classifier.fit(train_x, train_y)
+
+    ensemble = TreeEnsemble(classifier)
+    test_x = rng.random((100, 15), dtype=np.float32)
+    np.testing.assert_allclose(
+        ensemble.predict_proba(test_x), classifier.predict_proba(test_x)
+    )
@@ -1,9 +1,12 @@
 """Unit tests for parallel processing functionality in Annif"""
 
+import gc
 import multiprocessing
 import multiprocessing.dummy
 import multiprocessing.pool
 
+import pytest
+
 import annif.parallel
 
 
@@ -23,3 +26,27 @@ def test_get_pool_2():
     n_jobs, pool_class = annif.parallel.get_pool(2)
     assert n_jobs == 2
     assert isinstance(pool_class(), multiprocessing.pool.Pool)
+
+
+def test_get_owned_pool():
+    class Owner:
+        pass
+
+    owner = Owner()
+    pool = annif.parallel.get_owned_pool(owner, 2, None, ())
+    assert isinstance(pool, multiprocessing.pool.Pool)
+    assert pool.map(abs, [-1, -2]) == [1, 2]
+
+    # the pool is terminated together with its owner
+    del owner
+    gc.collect()
+    with pytest.raises(ValueError):
+        pool.map(abs, [-1, -2])
+
+
+def test_get_thread_pool_shared():
+    pool = annif.parallel.get_thread_pool(2)
+    assert annif.parallel.get_thread_pool(2) is pool
+    assert annif.parallel.get_thread_pool(3) is not pool
+    assert not annif.parallel.in_thread_pool()
+    assert pool.submit(annif.parallel.in_thread_pool).result()
@@ -76,6 +76,22 @@ def test_filter_suggestion_limit_and_threshold():
     assert filtered.toarray().tolist() == [[0, 0, 3, 0], [0, 4, 3, 0]]
 
 
+def test_filter_suggestion_does_not_modify_input():
+    # unsorted indices with a duplicate entry in the first row
+    pred = csr_array(
+        (
+            np.array([1.0, 3.0, 3.0, 4.0], dtype=np.float32),
+            np.array([2, 0, 2, 1]),
+            np.array([0, 3, 4]),
+        ),
+        shape=(2, 3),
+    )
+    filtered = filter_suggestion(pred, limit=1)
+    assert filtered.toarray().tolist() == [[0, 0, 4], [0, 4, 0]]
+    assert pred.indices.tolist() == [2, 0, 2, 1]
+    assert pred.data.tolist() == [1.0, 3.0, 3.0, 4.0]
+
+
 def test_suggestionbatch_from_sequence(dummy_subject_index):
     orig_suggestions = [
         [
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""Measure the throughput of the HTTP backend against a local server that
+imitates the REST API of an Annif instance with a fixed latency per request,
+using single document requests or the suggest-batch endpoint, sequentially
+or concurrently"""
+
+import argparse
+import json
+import tempfile
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import annif.backend
+from annif.corpus import Document
+from annif.vocab import Subject, SubjectIndexFile
+
+SUBJECT_URI = "http://example.org/dummy"
+
+
+class LatencyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(self.server.latency)
+        hit = {"uri": SUBJECT_URI, "label": "dummy", "score": 1.0}
+        if self.path.split("?")[0].endswith("/suggest-batch"):
+            n_docs = len(json.loads(body)["documents"])
+            data = [{"results": [hit]} for _ in range(n_docs)]
+        else:
+            data = {"results": [hit]}
+        response = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), LatencyHandler)
+    server.latency = args.latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+
+    subjects = SubjectIndexFile()
+    subjects.append(Subject(uri=SUBJECT_URI, labels={"en": "dummy"}, notation=None))
+    project = types.SimpleNamespace(subjects=subjects, datadir=tempfile.mkdtemp())
+    docs = [Document(text=f"document {idx}") for idx in range(args.docs)]
+
+    baseline = None
+    for batch in ("false", "true"):
+        for threads in (1, args.threads):
+            http = annif.backend.get_backend("http")(
+                backend_id="http",
+                config_params={
+                    "endpoint": f"http://{host}:{port}/v1/projects/dummy/suggest",
+                    "batch": batch,
+                    "request-threads": threads,
+                },
+                project=project,
+            )
+            start = time.perf_counter()
+            http.suggest(docs)
+            elapsed = time.perf_counter() - start
+            rate = args.docs / elapsed
+            baseline = baseline or rate
+            print(
+                f"batch={batch:<5} threads={threads:<3} {elapsed:7.2f} s  "
+                f"{rate:8.1f} docs/s  speedup {rate / baseline:.2f}x"
+            )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
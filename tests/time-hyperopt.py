@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""Measure how the throughput of hyperparameter optimization trials scales
+with the number of parallel jobs, using a synthetic objective function that
+performs a fixed amount of work on a shared matrix"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import optuna
+
+from annif.backend.hyperopt import (
+    HPObjective,
+    HPRecommendation,
+    HyperparameterOptimizer,
+)
+
+
+class SyntheticHPObjective(HPObjective):
+    @classmethod
+    def suggest_params(cls, trial, args):
+        return {"x": trial.suggest_float("x", 0.0, 1.0)}
+
+    @classmethod
+    def evaluate(cls, params, args):
+        matrix = args["matrix"]
+        for _ in range(args["rounds"]):
+            value = float((matrix * params["x"]).sum())
+        return value
+
+
+class SyntheticOptimizer(HyperparameterOptimizer):
+    def __init__(self, size, rounds):
+        super().__init__(None, None, "synthetic", SyntheticHPObjective)
+        self._size = size
+        self._rounds = rounds
+
+    def _prepare(self, n_jobs=1):
+        rng = np.random.default_rng(0)
+        return {"matrix": rng.random((self._size, self._size)), "rounds": self._rounds}
+
+    def _postprocess(self, study):
+        return HPRecommendation(lines=[], score=study.best_value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--trials", type=int, default=200)
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        nargs="+",
+        default=sorted({1, 2, 4, 8, os.cpu_count()}),
+    )
+    args = parser.parse_args()
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+
+    baseline = None
+    for jobs in args.jobs:
+        optimizer = SyntheticOptimizer(args.size, args.rounds)
+        start = time.perf_counter()
+        optimizer.optimize(n_trials=args.trials, n_jobs=jobs, results_file=None)
+        elapsed = time.perf_counter() - start
+        rate = args.trials / elapsed
+        baseline = baseline or rate
+        print(
+            f"jobs={jobs:<3} {elapsed:7.2f} s  {rate:8.1f} trials/s  "
+            f"speedup {rate / baseline:.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()